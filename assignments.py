@@ -0,0 +1,59 @@
+import os
+import threading
+from concurrency import map_concurrently
+
+
+ASSIGN_BATCH_SIZE = int(os.getenv("ASSIGN_BATCH_SIZE") or "0")
+
+
+def member_identity(member):
+    """Hashable identity of an assignment member (an ID or a member object)."""
+    if isinstance(member, dict):
+        return tuple(sorted(member.items()))
+    return member
+
+
+class AssignmentBatcher:
+    """Accumulates assignments per resource and sends them in as few requests as possible.
+
+    send(resource_id, members) is called once per resource with every member
+    added for it (split into chunks of max_batch_size when set). Members are
+    de-duplicated with member_key.
+    """
+
+    def __init__(self, send, max_workers=1, max_batch_size=ASSIGN_BATCH_SIZE, member_key=None):
+        self.send = send
+        self.max_workers = max_workers
+        self.max_batch_size = max_batch_size
+        self.member_key = member_key if member_key else member_identity
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, resource_id, members):
+        """Queue members to be assigned to resource_id."""
+        with self._lock:
+            pending = self._pending.setdefault(resource_id, {})
+            for member in members:
+                pending.setdefault(self.member_key(member), member)
+
+    def batches(self):
+        """Return the (resource_id, members) requests the pending assignments need."""
+        with self._lock:
+            return self._split(self._pending)
+
+    def flush(self):
+        """Send every pending assignment and return the number of requests made."""
+        with self._lock:
+            requests = self._split(self._pending)
+            self._pending = {}
+        map_concurrently(lambda request: self.send(*request), requests, self.max_workers)
+        return len(requests)
+
+    def _split(self, pending):
+        requests = []
+        for resource_id, members in pending.items():
+            members = list(members.values())
+            size = max(1, self.max_batch_size if self.max_batch_size else len(members))
+            for start in range(0, len(members), size):
+                requests.append((resource_id, members[start:start + size]))
+        return requests
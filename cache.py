@@ -0,0 +1,190 @@
+import copy
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+SOURCE_CACHE_SIZE = int(os.getenv("SOURCE_CACHE_SIZE") or "4096")
+SOURCE_CACHE_TTL = float(os.getenv("SOURCE_CACHE_TTL") or "0")
+SOURCE_SNAPSHOT = os.getenv("SOURCE_SNAPSHOT")
+SNAPSHOT_VERSION = 1
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional time to live (in seconds).
+
+    Concurrent lookups of the same missing key wait for a single load
+    instead of fetching it several times.
+    """
+
+    def __init__(self, max_size=SOURCE_CACHE_SIZE, ttl=SOURCE_CACHE_TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Drop every entry and reset the hit/miss counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_or_load(self, key, load):
+        """Return the cached value for key, calling load() to fetch it on a miss."""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                return value
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                value = self._lookup(key)
+                if value is not _MISSING:
+                    return value
+                self.misses += 1
+            try:
+                value = load()
+                with self._lock:
+                    self._store(key, value)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return value
+
+    def put(self, key, value):
+        """Store a value fetched by other means, a bulk listing for example."""
+        with self._lock:
+            self._store(key, value)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        stored_at, value = entry
+        if self.ttl and self.clock() - stored_at > self.ttl:
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _store(self, key, value):
+        self._entries[key] = (self.clock(), value)
+        self._entries.move_to_end(key)
+        while self.max_size and len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class SourceSnapshot:
+    """Source objects read from a bundle written by snapshot.py.
+
+    Objects are keyed like the source cache, by endpoint and arguments.
+    """
+
+    def __init__(self, path):
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            bundle = json.load(file)
+        if bundle.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"-- Unsupported version {bundle.get('version')} of the snapshot {path} --")
+        self.path = path
+        self.source_vault_id = bundle["sourceVaultID"]
+        self.created_at = bundle["createdAt"]
+        self.hits = 0
+        self._entries = {
+            (entry["endpoint"], *entry["args"]): entry["value"] for entry in bundle["entries"]
+        }
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the snapshotted value for key, or _MISSING."""
+        value = self._entries.get(key, _MISSING)
+        if value is not _MISSING:
+            with self._lock:
+                self.hits += 1
+        return value
+
+
+SOURCE_CACHE = LRUCache()
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Return the source snapshot of the run, or None when SOURCE_SNAPSHOT is not set."""
+    if not SOURCE_SNAPSHOT:
+        return None
+    with _snapshots_lock:
+        snapshot = _snapshots.get(SOURCE_SNAPSHOT)
+        if snapshot is None:
+            snapshot = SourceSnapshot(SOURCE_SNAPSHOT)
+            print(
+                f"-- Reading the source from the snapshot of vault {snapshot.source_vault_id} "
+                f"taken at {snapshot.created_at} --"
+            )
+            _snapshots[SOURCE_SNAPSHOT] = snapshot
+        return snapshot
+
+
+def clear_snapshots():
+    """Forget the loaded snapshots."""
+    with _snapshots_lock:
+        _snapshots.clear()
+
+
+def cached_source(endpoint):
+    """Memoize a source GET helper in SOURCE_CACHE, keyed by endpoint and arguments.
+
+    Objects found in the source snapshot are served from it instead. Callers
+    get a copy of the cached payload as the transforms edit it in place.
+    """
+    def decorator(fetch):
+        @wraps(fetch)
+        def wrapper(*args):
+            key = (endpoint,) + args
+            snapshot = get_snapshot()
+            value = snapshot.get(key) if snapshot is not None else _MISSING
+            if value is _MISSING:
+                value = SOURCE_CACHE.get_or_load(key, lambda: fetch(*args))
+            return copy.deepcopy(value)
+        return wrapper
+    return decorator
+
+
+def snapshot_listing(endpoint):
+    """Serve a source listing helper from the source snapshot, when it has it."""
+    def decorator(list_items):
+        @wraps(list_items)
+        def wrapper(*args):
+            snapshot = get_snapshot()
+            items = snapshot.get((endpoint,) + args) if snapshot is not None else _MISSING
+            if items is _MISSING:
+                return list_items(*args)
+            return iter(copy.deepcopy(items))
+        return wrapper
+    return decorator
+
+
+def print_cache_stats():
+    """Print the hit/miss counters of the source cache."""
+    print(f"-- Source cache: {SOURCE_CACHE.hits} hits, {SOURCE_CACHE.misses} misses --")
+    snapshot = _snapshots.get(SOURCE_SNAPSHOT)
+    if snapshot is not None:
+        print(f"-- Source snapshot: {snapshot.hits} hits out of {len(snapshot)} objects --")
@@ -0,0 +1,74 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+_DONE = object()
+
+
+def map_concurrently(fn, items, max_workers=1):
+    """Apply fn to every item with at most max_workers threads.
+
+    Results are returned in the order of the input items. The first failure
+    cancels the work that has not started yet and is re-raised.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [executor.submit(fn, item) for item in items]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def prefetched(items, prefetch, depth=0):
+    """Yield the items while prefetch(item) runs up to depth items ahead of the consumer.
+
+    prefetch runs in a background thread and only warms caches: its failures
+    are ignored, the consumer gets them when it fetches the item itself.
+    Failures of the items iterable are raised to the consumer. Close the
+    generator to stop the prefetching early.
+    """
+    if depth <= 0:
+        yield from items
+        return
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                ready.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                try:
+                    prefetch(item)
+                except Exception:
+                    pass
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except Exception as err:
+            put((_DONE, err))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, err = ready.get()
+            if item is _DONE:
+                if err is not None:
+                    raise err
+                return
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+from id_mapping import get_store, parse_ids
+
+
+DELTA_SYNC = (os.getenv("DELTA_SYNC") or "").lower() == "true"
+DELTA_SYNC_ACKNOWLEDGED = os.getenv("DELTA_SYNC_ACKNOWLEDGED")
+
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+Delta = namedtuple("Delta", ["status", "target_id", "content_hash"])
+
+
+def content_hash(resource):
+    """Return the SHA-256 of the canonical JSON of a transformed source resource."""
+    canonical = json.dumps(resource, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_sync_store():
+    store = get_store()
+    if store is None:
+        raise ValueError("-- ID_MAPPING_STORE is required for DELTA_SYNC --")
+    return store
+
+
+def diff(kind, source_id, resource, vault_id):
+    """Compare a transformed source resource with the version last synced into a vault.
+
+    The status is NEW when the resource has no target yet, CHANGED when its
+    content hash differs from the last synced one (or was never recorded) and
+    UNCHANGED otherwise.
+    """
+    resource_hash = content_hash(resource)
+    target_id, synced_hash = get_sync_store().synced(kind, source_id, vault_id)
+    if synced_hash == resource_hash:
+        return Delta(UNCHANGED, target_id, resource_hash)
+    return Delta(CHANGED if target_id else NEW, target_id, resource_hash)
+
+
+def mark_synced(kind, source_id, vault_id, delta):
+    """Record the content hash of a resource once it is created or updated."""
+    get_sync_store().save_hash(kind, source_id, vault_id, delta.content_hash)
+
+
+def acknowledge_change(kind, source_id, vault_id, delta):
+    """Mark a changed resource that is not updated in place as synced, once updated by hand.
+
+    Its source ID has to be listed in DELTA_SYNC_ACKNOWLEDGED, later runs
+    then compare the resource with the version acknowledged. Returns whether
+    the change was acknowledged.
+    """
+    if source_id not in parse_ids(DELTA_SYNC_ACKNOWLEDGED):
+        return False
+    mark_synced(kind, source_id, vault_id, delta)
+    return True
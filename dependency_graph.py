@@ -0,0 +1,62 @@
+from concurrency import map_concurrently
+
+
+class DependencyGraph:
+    """Migration steps keyed by resource, executed in topological waves.
+
+    Every node has an action called with the results of all the nodes
+    executed so far. Nodes only run once all of their dependencies have
+    completed, and nodes of the same wave run in parallel.
+    """
+
+    def __init__(self):
+        self.actions = {}
+        self.dependencies = {}
+
+    def __contains__(self, key):
+        return key in self.actions
+
+    def __len__(self):
+        return len(self.actions)
+
+    def add(self, key, action, dependencies=()):
+        """Add a node. Shared nodes that were already added are kept as is."""
+        if key in self.actions:
+            return
+        self.actions[key] = action
+        self.dependencies[key] = list(dependencies)
+
+    def waves(self):
+        """Return the nodes grouped in waves that only depend on earlier waves."""
+        dependents = {key: [] for key in self.actions}
+        pending = {}
+        for key, dependencies in self.dependencies.items():
+            for dependency in dependencies:
+                if dependency not in self.actions:
+                    raise ValueError(f"-- {key} depends on unknown node {dependency} --")
+                dependents[dependency].append(key)
+            pending[key] = len(dependencies)
+        wave = [key for key, count in pending.items() if count == 0]
+        waves = []
+        while wave:
+            waves.append(wave)
+            next_wave = []
+            for key in wave:
+                for dependent in dependents[key]:
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0:
+                        next_wave.append(dependent)
+            wave = next_wave
+        if sum(len(wave) for wave in waves) != len(self.actions):
+            raise ValueError("-- Dependency cycle detected between migration steps --")
+        return waves
+
+    def run(self, max_workers=1):
+        """Execute every node wave by wave and return their results by key."""
+        results = {}
+        for wave in self.waves():
+            wave_results = map_concurrently(
+                lambda key: self.actions[key](results), wave, max_workers
+            )
+            results.update(zip(wave, wave_results))
+        return results
@@ -0,0 +1,196 @@
+import ast
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from functools import partial
+import requests
+import migrate_policies
+import migrate_roles
+import migrate_vault_roles_and_policies
+from cache import print_cache_stats
+from concurrency import map_concurrently
+from id_mapping import parse_ids
+from snapshot import SnapshotCrawler, crawl_policies, crawl_roles, write_snapshot
+
+
+FANOUT_SCRIPT = os.getenv("FANOUT_SCRIPT") or "migrate_vault_roles_and_policies"
+TARGET_VAULT_IDS = os.getenv("TARGET_VAULT_IDS")
+TARGET_ACCOUNT_IDS = os.getenv("TARGET_ACCOUNT_IDS")
+TARGET_ACCOUNT_AUTHS = os.getenv("TARGET_ACCOUNT_AUTHS")
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY") or "0")
+POLICY_IDS = os.getenv("POLICY_IDS")
+ROLE_IDS = os.getenv("ROLE_IDS")
+SOURCE_VAULT_ID = os.getenv("SOURCE_VAULT_ID")
+MIGRATION_JOURNAL = os.getenv("MIGRATION_JOURNAL")
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY") or "1")
+
+FANOUT_SCRIPTS = ["migrate_policies", "migrate_roles", "migrate_vault_roles_and_policies"]
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_print_lock = threading.Lock()
+
+
+def get_targets():
+    """Return the (vault ID, account ID, account auth) of every target.
+
+    Target accounts are optional, without them every target vault uses
+    TARGET_ACCOUNT_ID and TARGET_ACCOUNT_AUTH.
+    """
+    vault_ids = parse_ids(TARGET_VAULT_IDS)
+    account_ids = parse_ids(TARGET_ACCOUNT_IDS) or [None] * len(vault_ids)
+    account_auths = parse_ids(TARGET_ACCOUNT_AUTHS) or [None] * len(vault_ids)
+    if not len(vault_ids) == len(account_ids) == len(account_auths):
+        raise ValueError("-- TARGET_ACCOUNT_IDS and TARGET_ACCOUNT_AUTHS need one entry per target vault --")
+    return list(zip(vault_ids, account_ids, account_auths))
+
+
+def crawl_source(script):
+    """Fetch the source objects the script reads, once for every target."""
+    crawler = SnapshotCrawler(MAX_CONCURRENCY)
+    if script == "migrate_policies":
+        crawl_policies(crawler, ast.literal_eval(POLICY_IDS))
+    elif script == "migrate_roles":
+        crawl_roles(crawler, ast.literal_eval(ROLE_IDS))
+    else:
+        roles = crawler.listing(
+            "roles/list", migrate_vault_roles_and_policies.list_all_vault_custom_roles, SOURCE_VAULT_ID
+        )
+        crawl_roles(crawler, [role["ID"] for role in roles])
+    if script != "migrate_policies" and migrate_roles.PREFETCH_POLICIES and SOURCE_VAULT_ID:
+        crawler.listing("policies/list", migrate_roles.list_vault_policies, SOURCE_VAULT_ID)
+    return crawler.entries
+
+
+def stream_process(args, env, prefix):
+    """Run a script, printing its output line by line as it comes, and return whether it succeeded."""
+    # unbuffered so the lines of the script are printed when they are written
+    env = dict(env, PYTHONUNBUFFERED="1")
+    process = subprocess.Popen(
+        args, env=env, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    for line in process.stdout:
+        with _print_lock:
+            print(f"[{prefix}] {line.rstrip()}", flush=True)
+    return process.wait() == 0
+
+
+def runs_in_process(target):
+    """Targets of the default target account are migrated in this process.
+
+    They share its sessions and so the rate limit budget of the account. A
+    journaled run needs one journal per target and a plan is printed per
+    target, those targets run in their own process.
+    """
+    _, account_id, _ = target
+    planning = FANOUT_SCRIPT == "migrate_vault_roles_and_policies" and migrate_vault_roles_and_policies.PLAN
+    return account_id is None and not MIGRATION_JOURNAL and not planning
+
+
+def migrate_in_process(target, entries):
+    """Run the migration of the script into one target vault of the default account."""
+    vault_id = target[0]
+    print(f"-- Migrating the target vault {vault_id} --")
+    try:
+        if FANOUT_SCRIPT == "migrate_policies":
+            migrate_policies.main(ast.literal_eval(POLICY_IDS), vault_id)
+        elif FANOUT_SCRIPT == "migrate_roles":
+            migrate_roles.main(ast.literal_eval(ROLE_IDS), vault_id)
+        else:
+            role_ids = [role["ID"] for role in entries[("roles/list", SOURCE_VAULT_ID)]]
+            migrate_roles.main(role_ids, vault_id, SOURCE_VAULT_ID)
+    except Exception as err:
+        # the migration scripts print the details of their errors
+        print(f"-- Migration failed for the target vault {vault_id}: {err} --")
+        return False
+    print(f"-- Target vault {vault_id} migrated successfully --")
+    return True
+
+
+def migrate_target(target, snapshot_path):
+    """Run the script against one target in its own process, reading the source from the snapshot."""
+    vault_id, account_id, account_auth = target
+    env = dict(os.environ, TARGET_VAULT_ID=vault_id, SOURCE_SNAPSHOT=snapshot_path)
+    if account_id:
+        env["TARGET_ACCOUNT_ID"] = account_id
+    if account_auth:
+        env["TARGET_ACCOUNT_AUTH"] = account_auth
+    if MIGRATION_JOURNAL:
+        # journals are keyed by source ID, every target needs its own
+        env["MIGRATION_JOURNAL"] = f"{MIGRATION_JOURNAL}.{vault_id}"
+    return stream_process([sys.executable, os.path.join(ROOT, f"{FANOUT_SCRIPT}.py")], env, vault_id)
+
+
+def migrate_account(account, vault_ids, snapshot_path):
+    """Fan out to the target vaults of one target account in a process of its own.
+
+    That process reads the source from the snapshot and migrates the vaults
+    of the account like the ones of the default account are migrated here.
+    """
+    account_id, account_auth = account
+    env = dict(os.environ, TARGET_VAULT_IDS=str(vault_ids), TARGET_ACCOUNT_ID=account_id, SOURCE_SNAPSHOT=snapshot_path)
+    env.pop("TARGET_ACCOUNT_IDS", None)
+    env.pop("TARGET_ACCOUNT_AUTHS", None)
+    if account_auth:
+        env["TARGET_ACCOUNT_AUTH"] = account_auth
+    return stream_process([sys.executable, os.path.join(ROOT, "fanout.py")], env, account_id)
+
+
+def fanout_jobs(targets, entries, snapshot_path):
+    """Return the (vault IDs, run) jobs migrating the targets.
+
+    Targets of the default account run in this process, targets sharing
+    another account run together in one process per account, so every
+    account keeps a single rate limit budget.
+    """
+    jobs = []
+    accounts = {}
+    for target in targets:
+        vault_id, account_id, account_auth = target
+        if runs_in_process(target):
+            jobs.append(([vault_id], partial(migrate_in_process, target, entries)))
+        elif account_id is None:
+            jobs.append(([vault_id], partial(migrate_target, target, snapshot_path)))
+        else:
+            accounts.setdefault((account_id, account_auth), []).append(vault_id)
+    for account, vault_ids in accounts.items():
+        jobs.append((vault_ids, partial(migrate_account, account, vault_ids, snapshot_path)))
+    return jobs
+
+
+def main():
+    """Migrates the source governance set into every target vault"""
+    try:
+        if FANOUT_SCRIPT not in FANOUT_SCRIPTS:
+            print(f"-- Please provide valid input. FANOUT_SCRIPT must be one of {FANOUT_SCRIPTS} --")
+            exit(1)
+        targets = get_targets()
+        if not targets:
+            print("-- Please provide valid input. TARGET_VAULT_IDS is missing. --")
+            exit(1)
+        print(f"-- Fetching the source of {FANOUT_SCRIPT} once for {len(targets)} target vaults --")
+        entries = crawl_source(FANOUT_SCRIPT)
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            snapshot_path = os.path.join(snapshot_dir, "source_snapshot.json.gz")
+            write_snapshot(snapshot_path, SOURCE_VAULT_ID, entries)
+            jobs = fanout_jobs(targets, entries, snapshot_path)
+            results = map_concurrently(lambda job: job[1](), jobs, FANOUT_CONCURRENCY or len(jobs))
+        failed_vault_ids = [
+            vault_id for (vault_ids, _), succeeded in zip(jobs, results) if not succeeded for vault_id in vault_ids
+        ]
+        print(f"-- {len(targets) - len(failed_vault_ids)} out of {len(targets)} target vaults migrated successfully --")
+        if failed_vault_ids:
+            print(f"-- Migration failed for the target vaults {failed_vault_ids} --")
+            exit(1)
+    except requests.exceptions.HTTPError as http_err:
+        print(f"-- fanout HTTP error: {http_err.response.content.decode()} --")
+        exit(1)
+    except Exception as err:
+        print(f"-- fanout other error: {err} --")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
+    print_cache_stats()
@@ -0,0 +1,109 @@
+import os
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from rate_limiter import IDEMPOTENT_METHODS, AdaptiveLimiter
+
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_PAGE_SIZE = int(os.getenv("HTTP_PAGE_SIZE") or "100")
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to every request."""
+
+    def __init__(self, timeout=None, *args, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class LimitedSession(requests.Session):
+    """Session whose requests share the adaptive limiter of its account."""
+
+    def __init__(self, limiter=None):
+        super().__init__()
+        self.limiter = limiter if limiter else AdaptiveLimiter()
+
+    def request(self, method, url, *args, **kwargs):
+        return self.limiter.call(
+            super().request, method, url, *args, idempotent=method.upper() in IDEMPOTENT_METHODS, **kwargs
+        )
+
+
+def build_headers(account_id, account_auth):
+    """Return the Skyflow management API headers for an account."""
+    return {
+        "X-SKYFLOW-ACCOUNT-ID": account_id,
+        "Authorization": f"Bearer {account_auth}",
+        "Content-Type": "application/json",
+    }
+
+
+def create_session(account_id, account_auth):
+    """Create a keep-alive, rate limited session with a bounded connection pool."""
+    session = LimitedSession()
+    session.headers.update(build_headers(account_id, account_auth))
+    adapter = TimeoutHTTPAdapter(
+        timeout=HTTP_TIMEOUT,
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(account_id, account_auth):
+    """Return the shared session for an account, creating it on first use."""
+    key = (account_id, account_auth)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = create_session(account_id, account_auth)
+            _sessions[key] = session
+        return session
+
+
+def close_sessions():
+    """Close every pooled session."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def fetch_page(session, url, key, offset, limit):
+    """Fetch one page of a list endpoint and return its items."""
+    separator = "&" if "?" in url else "?"
+    response = session.get(f"{url}{separator}offset={offset}&limit={limit}")
+    response.raise_for_status()
+    return response.json().get(key) or []
+
+
+def paginate(session, url, key, page_size=None):
+    """Yield the items of an offset/limit paginated list endpoint.
+
+    Items are yielded as soon as their page arrives, while the next page is
+    already being requested in the background. The server may return fewer
+    items than page_size asked for, so only an empty page ends the listing.
+    """
+    page_size = page_size if page_size else HTTP_PAGE_SIZE
+    offset = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = fetch_page(session, url, key, offset, page_size)
+        while page:
+            offset += len(page)
+            next_page = executor.submit(fetch_page, session, url, key, offset, page_size)
+            yield from page
+            page = next_page.result()
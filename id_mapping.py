@@ -0,0 +1,160 @@
+import ast
+import os
+import sqlite3
+import threading
+
+
+ID_MAPPING_STORE = os.getenv("ID_MAPPING_STORE")
+LOOKUP_CHUNK_SIZE = 500
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class IdMappingStore:
+    """SQLite store of the source ID -> target ID of every migrated resource.
+
+    A source resource has one mapping per target vault it was migrated into.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS id_mappings ("
+                "kind TEXT NOT NULL, source_id TEXT NOT NULL, target_id TEXT NOT NULL, vault_id TEXT NOT NULL, "
+                "PRIMARY KEY (kind, source_id, vault_id))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS id_mappings_by_vault ON id_mappings (kind, vault_id)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS content_hashes ("
+                "kind TEXT NOT NULL, source_id TEXT NOT NULL, vault_id TEXT NOT NULL, content_hash TEXT NOT NULL, "
+                "PRIMARY KEY (kind, source_id, vault_id))"
+            )
+
+    def save(self, kind, source_id, target_id, vault_id=None):
+        """Store the target ID of a migrated resource (vault_id is its target vault)."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO id_mappings (kind, source_id, target_id, vault_id) VALUES (?, ?, ?, ?)",
+                (kind, source_id, target_id, vault_id or ""),
+            )
+
+    def target_ids(self, kind, source_ids, vault_id=None):
+        """Return the target IDs of the given source resources, by source ID.
+
+        Without vault_id the resources can be mapped into any vault, as long
+        as each one has a single target ID.
+        """
+        source_ids = list(source_ids)
+        target_ids = {}
+        vault_filter = " AND vault_id = ?" if vault_id else ""
+        # stay below the number of parameters SQLite accepts per query
+        for start in range(0, len(source_ids), LOOKUP_CHUNK_SIZE):
+            chunk = source_ids[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ", ".join("?" for _ in chunk)
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT source_id, target_id FROM id_mappings WHERE kind = ? AND source_id IN ({placeholders})"
+                    + vault_filter,
+                    [kind, *chunk] + ([vault_id] if vault_id else []),
+                ).fetchall()
+            for source_id, target_id in rows:
+                if target_ids.setdefault(source_id, target_id) != target_id:
+                    raise ValueError(
+                        f"-- The {kind} {source_id} was migrated into several vaults, TARGET_VAULT_ID is required --"
+                    )
+        return target_ids
+
+    def mappings(self, kind, vault_id):
+        """Return the (source ID, target ID) pairs of a kind migrated into a vault."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT source_id, target_id FROM id_mappings WHERE kind = ? AND vault_id = ? ORDER BY source_id",
+                (kind, vault_id),
+            ).fetchall()
+
+    def save_hash(self, kind, source_id, vault_id, content_hash):
+        """Store the content hash a resource had when it was last synced into a vault."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO content_hashes (kind, source_id, vault_id, content_hash) VALUES (?, ?, ?, ?)",
+                (kind, source_id, vault_id, content_hash),
+            )
+
+    def synced(self, kind, source_id, vault_id):
+        """Return the target ID and the last synced content hash of a resource in a vault."""
+        with self._lock:
+            mapping = self._connection.execute(
+                "SELECT target_id FROM id_mappings WHERE kind = ? AND source_id = ? AND vault_id = ?",
+                (kind, source_id, vault_id),
+            ).fetchone()
+            synced_hash = self._connection.execute(
+                "SELECT content_hash FROM content_hashes WHERE kind = ? AND source_id = ? AND vault_id = ?",
+                (kind, source_id, vault_id),
+            ).fetchone()
+        return (mapping[0] if mapping else None, synced_hash[0] if synced_hash else None)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def get_store():
+    """Return the ID mapping store of the run, or None when ID_MAPPING_STORE is not set."""
+    if not ID_MAPPING_STORE:
+        return None
+    with _stores_lock:
+        store = _stores.get(ID_MAPPING_STORE)
+        if store is None:
+            store = IdMappingStore(ID_MAPPING_STORE)
+            _stores[ID_MAPPING_STORE] = store
+        return store
+
+
+def close_stores():
+    """Close every open store."""
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
+
+
+def parse_ids(value):
+    """Parse a single ID or a list of IDs such as ['id1','id2']."""
+    if not value:
+        return []
+    if value.strip().startswith("["):
+        return ast.literal_eval(value)
+    return [value.strip()]
+
+
+def resolve_targets(kind, source_ids, vault_id=None):
+    """Return the (source ID, target ID) pairs of the given resources.
+
+    Without source IDs every resource of that kind migrated into vault_id is
+    returned.
+    """
+    store = get_store()
+    if store is None:
+        raise ValueError("-- ID_MAPPING_STORE is required to resolve the target IDs --")
+    if not source_ids:
+        return store.mappings(kind, vault_id) if vault_id else []
+    target_ids = store.target_ids(kind, source_ids, vault_id)
+    missing_ids = [source_id for source_id in source_ids if source_id not in target_ids]
+    if missing_ids:
+        raise ValueError(f"-- No migrated {kind} found for the source IDs {missing_ids} --")
+    return [(source_id, target_ids[source_id]) for source_id in source_ids]
+
+
+def translate_ids(kind, ids, vault_id=None):
+    """Replace the migrated source IDs in ids with their target IDs (in vault_id)."""
+    store = get_store()
+    if store is None:
+        return list(ids)
+    target_ids = store.target_ids(kind, ids, vault_id)
+    return [target_ids.get(resource_id, resource_id) for resource_id in ids]
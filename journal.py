@@ -0,0 +1,109 @@
+import atexit
+import json
+import os
+import threading
+from id_mapping import get_store
+from sharding import get_shard_results
+
+
+MIGRATION_JOURNAL = os.getenv("MIGRATION_JOURNAL")
+RESUME = (os.getenv("RESUME") or "").lower() == "true"
+JOURNAL_FSYNC_EVERY = int(os.getenv("JOURNAL_FSYNC_EVERY") or "20")
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+class Journal:
+    """Append-only JSON lines file of the migrated resources.
+
+    Every record maps the source ID of a resource of a given kind to the ID
+    it got in the target. Records are written as soon as they are made and
+    fsynced every fsync_every records (and when the journal is closed).
+    """
+
+    def __init__(self, path, fsync_every=JOURNAL_FSYNC_EVERY):
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self._entries = {}
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # last line of a run interrupted mid-write
+                        continue
+                    self._entries[(entry["kind"], entry["sourceID"])] = entry["targetID"]
+        self._file = open(path, "a")
+
+    def lookup(self, kind, source_id):
+        """Return the target ID recorded for the source resource, if any."""
+        with self._lock:
+            return self._entries.get((kind, source_id))
+
+    def record(self, kind, source_id, target_id):
+        """Append a migrated resource to the journal."""
+        entry = {"kind": kind, "sourceID": source_id, "targetID": target_id}
+        with self._lock:
+            self._entries[(kind, source_id)] = target_id
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                self._sync()
+
+    def close(self):
+        """Flush the pending records to disk and close the file."""
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+
+def get_journal():
+    """Return the journal of the run, or None when MIGRATION_JOURNAL is not set."""
+    if not MIGRATION_JOURNAL:
+        return None
+    with _journals_lock:
+        journal = _journals.get(MIGRATION_JOURNAL)
+        if journal is None:
+            journal = Journal(MIGRATION_JOURNAL)
+            _journals[MIGRATION_JOURNAL] = journal
+            atexit.register(journal.close)
+        return journal
+
+
+def close_journals():
+    """Close every open journal."""
+    with _journals_lock:
+        for journal in _journals.values():
+            journal.close()
+        _journals.clear()
+
+
+def completed(kind, source_id):
+    """Return the journaled target ID of a source resource when resuming a run."""
+    journal = get_journal()
+    if journal is None or not RESUME:
+        return None
+    return journal.lookup(kind, source_id)
+
+
+def record(kind, source_id, target_id, vault_id=None):
+    """Journal a migrated resource, store its ID mapping and add it to the shard results, when they are enabled."""
+    journal = get_journal()
+    if journal is not None:
+        journal.record(kind, source_id, target_id)
+    shard_results = get_shard_results()
+    if shard_results is not None:
+        shard_results.record(kind, source_id, target_id, vault_id)
+    store = get_store()
+    if store is not None:
+        store.save(kind, source_id, target_id, vault_id)
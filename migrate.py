@@ -0,0 +1,182 @@
+import argparse
+import os
+import requests
+import migrate_connections
+import migrate_pipelines
+import migrate_policies
+import migrate_roles
+import migrate_service_accounts
+import migrate_vault_roles_and_policies
+import migrate_vault_schema
+import sharding
+from cache import print_cache_stats
+
+
+SOURCE_VAULT_ID = os.getenv("SOURCE_VAULT_ID")
+TARGET_VAULT_ID = os.getenv("TARGET_VAULT_ID")
+
+STAGES = ["schema", "roles", "policies", "service-accounts", "connections", "pipelines"]
+ALL_STAGES = ["schema", "roles", "connections", "pipelines"]
+
+# modules reading the source vault from their SOURCE_VAULT_ID constant
+SOURCE_VAULT_MODULES = [migrate_connections, migrate_roles, migrate_vault_roles_and_policies, migrate_vault_schema]
+# modules reading the target vault from their TARGET_VAULT_ID constant
+TARGET_VAULT_MODULES = [
+    migrate_connections,
+    migrate_pipelines,
+    migrate_policies,
+    migrate_roles,
+    migrate_service_accounts,
+    migrate_vault_roles_and_policies,
+]
+
+
+def use_source_vault(vault_id):
+    for module in SOURCE_VAULT_MODULES:
+        module.SOURCE_VAULT_ID = vault_id
+
+
+def use_target_vault(vault_id):
+    """Point every migrate script at the target vault, without going through the environment."""
+    for module in TARGET_VAULT_MODULES:
+        module.TARGET_VAULT_ID = vault_id
+
+
+def migrate_schema(context):
+    vault_id = migrate_vault_schema.main()
+    if vault_id:
+        context["targetVaultID"] = vault_id
+        use_target_vault(vault_id)
+
+
+def migrate_roles_stage(context):
+    """Migrate the given roles, or all the custom roles of the source vault."""
+    if migrate_roles.ROLE_IDS or migrate_roles.MIGRATE_ALL_ROLES:
+        role_ids = None
+    else:
+        print(f"-- Fetching roles for the vault {context['sourceVaultID']} --")
+        role_ids = (
+            role["ID"]
+            for role in migrate_vault_roles_and_policies.list_all_vault_custom_roles(context["sourceVaultID"])
+        )
+    roles_created = migrate_roles.main(role_ids, context["targetVaultID"], context["sourceVaultID"])
+    print(f"-- No.of Roles: {len(roles_created) if roles_created else 0} --")
+
+
+def migrate_policies_stage(context):
+    migrate_policies.main(None, context["targetVaultID"])
+
+
+def migrate_service_accounts_stage(context):
+    migrate_service_accounts.main()
+
+
+def migrate_connections_stage(context):
+    """Migrate the configured connections, or all the connections of the source vault."""
+    if (
+        migrate_connections.CONNECTION_IDS
+        or migrate_connections.CONNECTIONS_CONFIG
+        or migrate_connections.MIGRATE_ALL_CONNECTIONS
+    ):
+        migrate_connections.main()
+        return
+    connection_ids = [
+        connection["ID"] for connection in migrate_connections.list_connections(context["sourceVaultID"])
+    ]
+    if not connection_ids:
+        print(f"-- No connections found for the vault {context['sourceVaultID']} --")
+        return
+    migrate_connections.main(connection_ids)
+
+
+def migrate_pipelines_stage(context):
+    """Migrate PIPELINE_ID, or all the pipelines of the source vault."""
+    if migrate_pipelines.PIPELINE_ID:
+        pipeline_ids = [migrate_pipelines.PIPELINE_ID]
+    else:
+        pipeline_ids = sharding.select_shard(
+            pipeline["ID"] for pipeline in migrate_pipelines.list_pipelines(context["sourceVaultID"])
+        )
+    for pipeline_id in pipeline_ids:
+        migrate_pipelines.main(pipeline_id)
+
+
+STAGE_FUNCTIONS = {
+    "schema": migrate_schema,
+    "roles": migrate_roles_stage,
+    "policies": migrate_policies_stage,
+    "service-accounts": migrate_service_accounts_stage,
+    "connections": migrate_connections_stage,
+    "pipelines": migrate_pipelines_stage,
+}
+# stages that write into the target vault and so need its ID
+TARGET_VAULT_STAGES = {"roles", "policies", "service-accounts", "connections", "pipelines"}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="migrate",
+        description="Run migration stages in one process. Stages run in the given order and the vault "
+        "created by the schema stage is the target vault of the stages after it.",
+    )
+    parser.add_argument(
+        "stages",
+        nargs="+",
+        choices=STAGES + ["all"],
+        help=f"stages to run, 'all' runs {', '.join(ALL_STAGES)}",
+    )
+    parser.add_argument("--source-vault-id", default=SOURCE_VAULT_ID, help="default: SOURCE_VAULT_ID")
+    parser.add_argument("--target-vault-id", default=TARGET_VAULT_ID, help="default: TARGET_VAULT_ID")
+    parser.add_argument(
+        "--shard",
+        default=sharding.SHARD,
+        help="only migrate the resources of shard i out of n, given as i/n. default: SHARD",
+    )
+    return parser.parse_args(argv)
+
+
+def expand_stages(stages):
+    expanded = []
+    for stage in stages:
+        for name in ALL_STAGES if stage == "all" else [stage]:
+            if name not in expanded:
+                expanded.append(name)
+    return expanded
+
+
+def main(argv=None):
+    """Runs the given migration stages"""
+    args = parse_args(argv)
+    context = {"sourceVaultID": args.source_vault_id, "targetVaultID": args.target_vault_id}
+    if args.source_vault_id:
+        use_source_vault(args.source_vault_id)
+    if args.target_vault_id:
+        use_target_vault(args.target_vault_id)
+    try:
+        stages = expand_stages(args.stages)
+        if args.shard:
+            sharding.parse_shard(args.shard)
+            if "schema" in stages:
+                # every shard would create its own vault
+                print("-- The schema stage can not be sharded, create the vault first and pass its ID --")
+                exit(1)
+            sharding.SHARD = args.shard
+        for stage in stages:
+            if stage in TARGET_VAULT_STAGES and not context["targetVaultID"]:
+                print(f"-- Please provide valid input. Target vault ID is required for the {stage} stage --")
+                exit(1)
+            print(f"-- Running the {stage} stage --")
+            STAGE_FUNCTIONS[stage](context)
+        print("-- Migration executed successfully --")
+        return context
+    except requests.exceptions.HTTPError as http_err:
+        print(f"-- migrate HTTP error: {http_err.response.content.decode()} --")
+        exit(1)
+    except Exception as err:
+        print(f"-- migrate other error: {err} --")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
+    print_cache_stats()
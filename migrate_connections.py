@@ -2,6 +2,11 @@ import ast
 import os
 import requests
 import json
+from cache import cached_source, print_cache_stats, snapshot_listing
+from delta_sync import DELTA_SYNC, NEW, UNCHANGED, acknowledge_change, diff, mark_synced
+from http_client import get_session, paginate
+from journal import completed, record
+from sharding import select_shard
 
 CONNECTION_IDS = os.getenv("CONNECTION_IDS")
 CONNECTIONS_CONFIG = os.getenv("CONNECTIONS_CONFIG")
@@ -15,42 +20,26 @@ TARGET_ACCOUNT_AUTH = os.getenv("TARGET_ACCOUNT_AUTH")
 SOURCE_ENV_URL = os.getenv("SOURCE_ENV_URL")
 TARGET_ENV_URL = os.getenv("TARGET_ENV_URL")
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-TARGET_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": TARGET_ACCOUNT_ID,
-    "Authorization": f"Bearer {TARGET_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
 
 
+@snapshot_listing("connections/list")
 def list_connections(vault_id):
-    """Lists inbound + outbound connections for a vault."""
-    connections = []
-    response = requests.get(
-        f"{SOURCE_ENV_URL}/v1/gateway/outboundRoutes?vaultID={vault_id}",
-        headers=SOURCE_ACCOUNT_HEADERS,
-    )
-    response.raise_for_status()
-    connections.extend(response.json()["ConnectionMappings"])
-    response = requests.get(
-        f"{SOURCE_ENV_URL}/v1/gateway/inboundRoutes?vaultID={vault_id}",
-        headers=SOURCE_ACCOUNT_HEADERS,
-    )
-    response.raise_for_status()
-    connections.extend(response.json()["ConnectionMappings"])
-    return connections
+    """Yields outbound + inbound connections for a vault, page by page."""
+    for route in ("outboundRoutes", "inboundRoutes"):
+        yield from paginate(
+            SOURCE_SESSION,
+            f"{SOURCE_ENV_URL}/v1/gateway/{route}?vaultID={vault_id}",
+            "ConnectionMappings",
+        )
 
+@cached_source("connections")
 def get_connection(connection_id):
     """Fetches a single connection"""
     # /inboundRoutes can also fetch outbound connection details
-    response = requests.get(
+    response = SOURCE_SESSION.get(
         f"{SOURCE_ENV_URL}/v1/gateway/inboundRoutes/{connection_id}",
-        headers=SOURCE_ACCOUNT_HEADERS,
     )
     response.raise_for_status()
     return response.json()
@@ -58,10 +47,9 @@ def get_connection(connection_id):
 def create_connection(connection):
     """Creates connection"""
     route = "outboundRoutes" if connection["mode"] == "EGRESS" else "inboundRoutes"
-    response = requests.post(
+    response = TARGET_SESSION.post(
         f"{TARGET_ENV_URL}/v1/gateway/{route}",
         json=connection,
-        headers=TARGET_ACCOUNT_HEADERS,
     )
     return response
 
@@ -88,10 +76,12 @@ def main(connection_ids=None):
             with open("configs/connections/connections.json", "r") as file:
                 content = file.read()
                 connections = json.loads(content)
+            # hand-written config entries may have no source ID, they are sharded by name
+            connections = select_shard(connections, key=lambda connection: connection.get("ID") or connection["name"])
         elif MIGRATE_ALL_CONNECTIONS is not None and MIGRATE_ALL_CONNECTIONS.lower() == "true":
             if SOURCE_VAULT_ID:
                 print(f"-- Fetching all connections from the source vault --")
-                connections = list_connections(SOURCE_VAULT_ID)
+                connections = select_shard(list_connections(SOURCE_VAULT_ID), key=lambda connection: connection["ID"])
             else:
                 print(
                     "-- Please provide valid input. Source vault ID is required to migrate all connections --"
@@ -104,25 +94,54 @@ def main(connection_ids=None):
                 else ast.literal_eval(CONNECTION_IDS)
             )
             print(f"-- Fetching connection details for the given connection IDs --")
+            connection_ids = select_shard(connection_ids)
             for connection_id in connection_ids:
+                migrated_connection_id = completed("connections", connection_id)
+                if migrated_connection_id:
+                    print(f"-- Connection {connection_id} already migrated, Target CONNECTION_ID: {migrated_connection_id} --")
+                    continue
                 connection = get_connection(connection_id)
                 connections.append(connection)
         created_connections = []
+        no_of_connections = 0
         for index, connection in enumerate(connections):
-            print(f"-- Working on connection: {index + 1}. {connection['name']} --")
+            # only connections with a source ID are journaled and delta synced
+            source_connection_id = connection.get("ID")
+            migrated_connection_id = source_connection_id and completed("connections", source_connection_id)
+            if migrated_connection_id:
+                print(f"-- Connection {connection['name']} already migrated, Target CONNECTION_ID: {migrated_connection_id} --")
+                continue
             connection_payload = transform_connection_payload(connection)
+            if DELTA_SYNC and source_connection_id:
+                delta = diff("connections", source_connection_id, connection_payload, TARGET_VAULT_ID)
+                if delta.status == UNCHANGED:
+                    print(f"-- Connection {connection['name']} unchanged since the last sync, Target CONNECTION_ID: {delta.target_id} --")
+                    continue
+                if delta.status != NEW:
+                    # connections are not updated in place, only new ones are created
+                    if acknowledge_change("connections", source_connection_id, TARGET_VAULT_ID, delta):
+                        print(f"-- Connection {connection['name']} updated by hand, marked as synced --")
+                    else:
+                        print(f"-- Connection {connection['name']} changed since the last sync, update Target CONNECTION_ID: {delta.target_id} manually and list {source_connection_id} in DELTA_SYNC_ACKNOWLEDGED --")
+                    continue
+            no_of_connections += 1
+            print(f"-- Working on connection: {index + 1}. {connection['name']} --")
             create_connection_response = create_connection(connection_payload)
             if create_connection_response.status_code == 200:
                 created_connection = create_connection_response.json()
                 created_connections.append(created_connection)
+                if source_connection_id:
+                    record("connections", source_connection_id, created_connection["ID"], TARGET_VAULT_ID)
+                    if DELTA_SYNC:
+                        mark_synced("connections", source_connection_id, TARGET_VAULT_ID, delta)
                 # fetch connection roles
                 # create service account and assign connection invoker role
                 print(
-                f"-- Connection migrated successfully: {connection['name']}. Source CONNECTION_ID: {connection['ID']}, Target CONNECTION_ID: {created_connection['ID']} --"
+                f"-- Connection migrated successfully: {connection['name']}. Source CONNECTION_ID: {source_connection_id}, Target CONNECTION_ID: {created_connection['ID']} --"
                 )
             else:
                 print(f"-- Connection migration failed: {create_connection_response.status_code}. {create_connection_response.content}")
-        print(f"-- {len(created_connections)} out of {len(connections)} connections were created successfully. --") 
+        print(f"-- {len(created_connections)} out of {no_of_connections} connections were created successfully. --") 
         print("-- Connections migration script executed successfully. --")
     except requests.exceptions.HTTPError as http_err:
         print(
@@ -136,3 +155,4 @@ def main(connection_ids=None):
 
 if __name__ == "__main__":
     main()
+    print_cache_stats()
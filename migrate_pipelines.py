@@ -2,9 +2,13 @@ import copy
 import json
 import os
 import requests
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, Optional
 
 from dotenv import load_dotenv
+from cache import cached_source, print_cache_stats, snapshot_listing
+from delta_sync import DELTA_SYNC, NEW, UNCHANGED, acknowledge_change, diff, mark_synced
+from http_client import get_session, paginate
+from journal import completed, record
 load_dotenv()
 
 PIPELINE_ID = os.getenv("PIPELINE_ID")
@@ -23,44 +27,32 @@ S3_ALLOWED_KEYS = {"name", "region", "assumedRoleARN"}
 PIPELINE = "pipeline"
 PIPELINES = "pipelines"
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-TARGET_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": TARGET_ACCOUNT_ID,
-    "Authorization": f"Bearer {TARGET_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-def list_pipelines(vault_id: str) -> List[Dict[str, Any]]:
-    """Lists Pipelines"""
-    pipelines = []
-    response = requests.get(
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
+
+@snapshot_listing("pipelines/list")
+def list_pipelines(vault_id: str) -> Iterator[Dict[str, Any]]:
+    """Lists Pipelines, page by page"""
+    return paginate(
+        SOURCE_SESSION,
         f"{SOURCE_ENV_URL}/v1/pipelines?vaultID={vault_id}",
-        headers=SOURCE_ACCOUNT_HEADERS,
+        PIPELINES,
     )
-    response.raise_for_status()
-    pipelines.extend(response.json()[PIPELINES])
-    return pipelines
 
+@cached_source("pipelines")
 def get_pipeline(pipeline_id: str) -> Dict[str, Any]:
     """Fetches a single pipeline"""
-    response = requests.get(
+    response = SOURCE_SESSION.get(
         f"{SOURCE_ENV_URL}/v1/pipelines/{pipeline_id}",
-        headers=SOURCE_ACCOUNT_HEADERS,
     )
     response.raise_for_status()
     return response.json()[PIPELINE]
 
 def create_pipeline(pipeline: Dict[str, Any]) -> requests.Response:
     """Creates a pipeline"""
-    response = requests.post(
+    response = TARGET_SESSION.post(
         f"{TARGET_ENV_URL}/v1/pipelines",
         json=pipeline,
-        headers=TARGET_ACCOUNT_HEADERS,
     )
     response.raise_for_status()
     return response
@@ -191,6 +183,10 @@ def main(pipeline_id: str) -> None:
     """Migrates pipeline"""
     try:
         print("-- Initiating Pipelines migration --")
+        migrated_pipeline_id = completed("pipelines", pipeline_id)
+        if migrated_pipeline_id:
+            print(f"-- Pipeline {pipeline_id} already migrated, Target PIPELINE_ID: {migrated_pipeline_id} --")
+            return
         source_datastore_input = load_datastore_input(SOURCE_DATASTORE_CONFIG, "source")
         target_datastore_input = load_datastore_input(TARGET_DATASTORE_CONFIG, "destination")
         pipeline = get_pipeline(pipeline_id)
@@ -200,10 +196,25 @@ def main(pipeline_id: str) -> None:
         pipeline_payload = transform_pipeline_payload(
             pipeline, source_datastore_input, target_datastore_input
         )
+        if DELTA_SYNC:
+            delta = diff("pipelines", pipeline_id, pipeline_payload, TARGET_VAULT_ID)
+            if delta.status == UNCHANGED:
+                print(f"-- Pipeline {pipeline_name} unchanged since the last sync, Target PIPELINE_ID: {delta.target_id} --")
+                return
+            if delta.status != NEW:
+                # pipelines are not updated in place, only new ones are created
+                if acknowledge_change("pipelines", pipeline_id, TARGET_VAULT_ID, delta):
+                    print(f"-- Pipeline {pipeline_name} updated by hand, marked as synced --")
+                else:
+                    print(f"-- Pipeline {pipeline_name} changed since the last sync, update Target PIPELINE_ID: {delta.target_id} manually and list {pipeline_id} in DELTA_SYNC_ACKNOWLEDGED --")
+                return
         create_pipeline_response = create_pipeline(pipeline_payload)
 
         if create_pipeline_response.status_code == 200:
             created_pipeline = create_pipeline_response.json()
+            record("pipelines", pipeline_id, created_pipeline.get("ID"), TARGET_VAULT_ID)
+            if DELTA_SYNC:
+                mark_synced("pipelines", pipeline_id, TARGET_VAULT_ID, delta)
             print(
                 f"-- Pipeline migrated successfully: {pipeline_name}. "
                 f"Source PIPELINE_ID: {pipeline.get('ID')}, "
@@ -229,3 +240,4 @@ if __name__ == "__main__":
     if not PIPELINE_ID:
         raise ValueError("-- PIPELINE_ID is required to migrate a pipeline. --")
     main(PIPELINE_ID)
+    print_cache_stats()
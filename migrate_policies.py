@@ -1,6 +1,17 @@
 import os
 import ast
 import requests
+from functools import partial
+from concurrency import map_concurrently
+from delta_sync import DELTA_SYNC, NEW, UNCHANGED, acknowledge_change, diff, mark_synced
+from cache import cached_source, print_cache_stats
+from http_client import get_session
+from journal import completed, record
+from policy_registry import POLICY_REGISTRY
+from policy_transformer import transform_policy
+from policy_validation import VALIDATE_POLICIES, validate_policies
+from retry import create_idempotently
+from update_policy import update_policy_from_source
 
 
 POLICY_IDS = os.getenv("POLICY_IDS")
@@ -11,102 +22,121 @@ SOURCE_ACCOUNT_AUTH = os.getenv("SOURCE_ACCOUNT_AUTH")
 TARGET_ACCOUNT_AUTH = os.getenv("TARGET_ACCOUNT_AUTH")
 SOURCE_ENV_URL = os.getenv("SOURCE_ENV_URL")
 TARGET_ENV_URL = os.getenv("TARGET_ENV_URL")
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY") or "1")
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-TARGET_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": TARGET_ACCOUNT_ID,
-    "Authorization": f"Bearer {TARGET_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
 
 
+@cached_source("policies")
 def get_policy(policy_id):
     """Fetches a policy"""
-    response = requests.get(
-        f"{SOURCE_ENV_URL}/v1/policies/{policy_id}", headers=SOURCE_ACCOUNT_HEADERS
+    response = SOURCE_SESSION.get(
+        f"{SOURCE_ENV_URL}/v1/policies/{policy_id}"
     )
     response.raise_for_status()
     return response.json()
 
 
-def create_policy(policy_data):
-    """Creates a policy"""
-    response = requests.post(
-        f"{TARGET_ENV_URL}/v1/policies", json=policy_data, headers=TARGET_ACCOUNT_HEADERS
+def get_policy_by_name(policy_name, target_vault_id=None):
+    """Search the target vault for an existing policy by name."""
+    response = TARGET_SESSION.get(
+        f"{TARGET_ENV_URL}/v1/policies?name={policy_name}&resource.type=VAULT&resource.ID={target_vault_id or TARGET_VAULT_ID}"
     )
     response.raise_for_status()
     return response.json()
 
 
-def transform_policy_payload(source_resource):
+def find_policy(policy_name, target_vault_id=None):
+    """Return the target policy with the given name, if it exists."""
+    policies = get_policy_by_name(policy_name, target_vault_id).get("policies", [])
+    return {"ID": policies[0]["ID"]} if len(policies) == 1 else None
+
+
+def create_policy(policy_data):
+    """Creates a policy, retrying transient failures without duplicating it"""
+    def post_policy():
+        response = TARGET_SESSION.post(
+            f"{TARGET_ENV_URL}/v1/policies", json=policy_data
+        )
+        response.raise_for_status()
+        return response.json()
+
+    policy_name = policy_data.get("name")
+    target_vault_id = policy_data.get("resource", {}).get("ID")
+    return create_idempotently(
+        post_policy, lambda: find_policy(policy_name, target_vault_id), f"policy {policy_name}"
+    )
+
+
+def transform_policy_payload(source_resource, target_vault_id=None):
     """Transforms source policy payload to target payload."""
-    transformed_resource = source_resource["policy"]
-    transformed_resource["resource"] = {"ID": TARGET_VAULT_ID, "type": "VAULT"}
-    policy_rules = transformed_resource["rules"]
-    policy_rule_params = []
-
-    for policy_rule in policy_rules:
-        temp_rule_param = {"name": policy_rule["name"], "ruleExpression": policy_rule["ruleExpression"]}
-        ruleParams = policy_rule
-        actions: list[str] = ruleParams["actions"]
-        rule_param_actions = [action.split(".")[1].upper() for action in actions]
-        resources: list[str] = ruleParams["resources"]
-        resourceType = policy_rule["resourceType"]
-
-        ruleParams["vaultID"] = TARGET_VAULT_ID
-        ruleParams["actions"] = rule_param_actions
-        ruleParams["action"] = rule_param_actions[0]
-
-        del ruleParams["ID"]
-        del ruleParams["resources"]
-        del ruleParams["dlpFormat"]
-        del ruleParams["resourceType"]
-        del ruleParams["ruleExpression"]
-
-        if resourceType == "COLUMN":
-            ruleParams["columns"] = [
-                f"{resource.split('/')[1].split(':')[1]}.{resource.split('/')[2].split(':')[1]}"
-                for resource in resources
-            ]
-            temp_rule_param["columnRuleParams"] = ruleParams
-        elif resourceType == "TABLE":
-            ruleParams["tableName"] = resources[0].split("table:")[1]
-            temp_rule_param["tableRuleParams"] = ruleParams
-        elif resourceType == "COLUMN_GROUP":
-            ruleParams["columnGroups"] = [
-                resource.split("columngroup:")[1] for resource in resources
-            ]
-            temp_rule_param["columnGroupRuleParams"] = ruleParams
-        policy_rule_params.append(temp_rule_param)
-
-    transformed_resource["ruleParams"] = policy_rule_params
-    transformed_resource["activated"] = True
-
-    del transformed_resource["ID"]
-    del transformed_resource["namespace"]
-    del transformed_resource["status"]
-    del transformed_resource["BasicAudit"]
-    del transformed_resource["members"]
-    del transformed_resource["rules"]
-
-    return transformed_resource
-
-
-def main(policy_ids=None):
-    """Migrates policies"""
+    return transform_policy(source_resource, target_vault_id or TARGET_VAULT_ID)
+
+
+def validate_target_policies(policy_ids, target_vault_id=None):
+    """Check the policies still to migrate against the schema of the target vault, before any write."""
+    target_vault_id = target_vault_id or TARGET_VAULT_ID
+    policy_ids = [policy_id for policy_id in dict.fromkeys(policy_ids) if not completed("policies", policy_id)]
+    # the fetched policies are cached and reused by the migration
+    policies = map_concurrently(get_policy, policy_ids, MAX_CONCURRENCY)
+    validate_policies([transform_policy_payload(policy, target_vault_id) for policy in policies], target_vault_id)
+
+
+def migrate_policy(policy_id, target_vault_id=None):
+    """Fetches, transforms and creates a single policy, once per run and target vault"""
+    target_vault_id = target_vault_id or TARGET_VAULT_ID
+    return POLICY_REGISTRY.migrate(
+        target_vault_id, policy_id, lambda: migrate_new_policy(policy_id, target_vault_id)
+    )
+
+
+def migrate_new_policy(policy_id, target_vault_id):
+    migrated_policy_id = completed("policies", policy_id)
+    if migrated_policy_id:
+        print(f"-- Policy {policy_id} already migrated, Target POLICY_ID: {migrated_policy_id} --")
+        return {"ID": migrated_policy_id}
+    fetched_policy = get_policy(policy_id)
+    policy_payload = transform_policy_payload(fetched_policy, target_vault_id)
+    if DELTA_SYNC:
+        return sync_policy(policy_id, policy_payload, target_vault_id)
+    new_policy = create_policy(policy_payload)
+    record("policies", policy_id, new_policy["ID"], target_vault_id)
+    return new_policy
+
+
+def sync_policy(policy_id, policy_payload, target_vault_id):
+    """Create, update or skip a policy depending on its changes since the last sync."""
+    delta = diff("policies", policy_id, policy_payload, target_vault_id)
+    if delta.status == UNCHANGED:
+        print(f"-- Policy {policy_id} unchanged since the last sync, Target POLICY_ID: {delta.target_id} --")
+        return {"ID": delta.target_id}
+    if delta.status == NEW:
+        synced_policy = create_policy(policy_payload)
+        record("policies", policy_id, synced_policy["ID"], target_vault_id)
+    else:
+        synced_policy = {"ID": delta.target_id}
+        if not update_policy_from_source((policy_id, delta.target_id)):
+            # the rules removed from the source are still in the target policy
+            if acknowledge_change("policies", policy_id, target_vault_id, delta):
+                print(f"-- Policy {policy_id} rules removed by hand, marked as synced --")
+            else:
+                print(f"-- Policy {policy_id} is not synced until its removed rules are deleted from Target POLICY_ID: {delta.target_id} and {policy_id} is listed in DELTA_SYNC_ACKNOWLEDGED --")
+            return synced_policy
+    mark_synced("policies", policy_id, target_vault_id, delta)
+    return synced_policy
+
+
+def main(policy_ids=None, target_vault_id=None):
+    """Migrates policies (into target_vault_id, TARGET_VAULT_ID by default)"""
     try:
         policy_ids = policy_ids if policy_ids else ast.literal_eval(POLICY_IDS)
-        policies_created = []
-        for policy_id in policy_ids:
-            fetched_policy = get_policy(policy_id)
-            policy_payload = transform_policy_payload(fetched_policy)
-            policy = create_policy(policy_payload)
-            policies_created.append(policy)
+        if VALIDATE_POLICIES:
+            validate_target_policies(policy_ids, target_vault_id)
+        # created policies keep the order of policy_ids so callers can zip them
+        policies_created = map_concurrently(
+            partial(migrate_policy, target_vault_id=target_vault_id), policy_ids, MAX_CONCURRENCY
+        )
         print(f"-- Policies migrated successfully --")        
         return policies_created
     except requests.exceptions.HTTPError as http_err:
@@ -119,3 +149,4 @@ def main(policy_ids=None):
 
 if __name__ == "__main__":
     main()
+    print_cache_stats()
@@ -1,10 +1,24 @@
 import ast
 import requests
 import os
-from migrate_policies import main as migrate_policies
+from contextlib import closing
+from functools import partial
+from migrate_policies import get_policy, main as migrate_policies, validate_target_policies
+from assignments import AssignmentBatcher
+from concurrency import prefetched
+from cache import SOURCE_CACHE, cached_source, print_cache_stats, snapshot_listing
+from delta_sync import DELTA_SYNC, NEW, UNCHANGED, acknowledge_change, diff, mark_synced
+from http_client import get_session, paginate
+from journal import completed, get_journal, record
+from policy_validation import VALIDATE_POLICIES
+from retry import create_idempotently
+from sharding import select_shard
+from target_inventory import get_inventory
 
 
 SYSTEM_ROLES = ["VAULT_OWNER", "VAULT_EDITOR", "VAULT_VIEWER", "PIPELINE_MANAGER", "CONNECTION_MANAGER"]
+# fields of a source policy read by its migration, a listed policy is only cached with all of them
+PREFETCHED_POLICY_FIELDS = ["ID", "name", "rules"]
 
 ROLE_IDS = os.getenv("ROLE_IDS") 
 TARGET_VAULT_ID = os.getenv("TARGET_VAULT_ID")
@@ -17,87 +31,177 @@ TARGET_ENV_URL = os.getenv("TARGET_ENV_URL")
 MIGRATE_ALL_ROLES = os.getenv("MIGRATE_ALL_ROLES")
 SKIP_ROLE_CREATION_IF_ROLE_EXISTS = os.getenv("SKIP_ROLE_CREATION_IF_ROLE_EXISTS")
 SOURCE_VAULT_ID = os.getenv("SOURCE_VAULT_ID")
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY") or "1")
+PREFETCH_POLICIES = (os.getenv("PREFETCH_POLICIES") or "").lower() == "true"
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH") or "0")
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-TARGET_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": TARGET_ACCOUNT_ID,
-    "Authorization": f"Bearer {TARGET_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
 
 
+@cached_source("roles")
 def get_role(role_id):
     """Fetch a single role definition from the source account."""
-    response = requests.get(
-        f"{SOURCE_ENV_URL}/v1/roles/{role_id}", headers=SOURCE_ACCOUNT_HEADERS
+    response = SOURCE_SESSION.get(
+        f"{SOURCE_ENV_URL}/v1/roles/{role_id}"
     )
     response.raise_for_status()
     return response.json()
 
-def get_system_role(role_name):
-    """Return a system role present in the target vault."""
-    response = requests.get(
-        f"{TARGET_ENV_URL}/v1/roles?name={role_name}&resource.type=VAULT&resource.ID={TARGET_VAULT_ID}", headers=TARGET_ACCOUNT_HEADERS
-    )
-    response.raise_for_status()
-    return response.json()    
+def get_target_inventory(target_vault_id=None):
+    """Return the name -> ID index of the target vault, listed once per run."""
+    return get_inventory(TARGET_SESSION, TARGET_ENV_URL, target_vault_id or TARGET_VAULT_ID)
+
 
 def create_role(role):
-    """Create a custom role in the target vault."""
-    response = requests.post(
-        f"{TARGET_ENV_URL}/v1/roles", json=role, headers=TARGET_ACCOUNT_HEADERS
+    """Create a custom role in the target vault, retrying transient failures."""
+    def post_role():
+        response = TARGET_SESSION.post(
+            f"{TARGET_ENV_URL}/v1/roles", json=role
+        )
+        response.raise_for_status()
+        return response.json()
+
+    role_name = role["roleDefinition"]["name"]
+    target_vault_id = role.get("resource", {}).get("ID")
+    new_role = create_idempotently(
+        post_role, lambda: find_role(role_name, target_vault_id), f"role {role_name}"
     )
-    response.raise_for_status()
-    return response.json()
+    get_target_inventory(target_vault_id).add("roles", role_name, new_role["ID"])
+    return new_role
 
 
+@cached_source("roles/policies")
 def get_role_policies(role_id):
     """List all policies attached to the given role."""
-    response = requests.get(
-        f"{SOURCE_ENV_URL}/v1/roles/{role_id}/policies", headers=SOURCE_ACCOUNT_HEADERS
+    response = SOURCE_SESSION.get(
+        f"{SOURCE_ENV_URL}/v1/roles/{role_id}/policies"
     )
     response.raise_for_status()
     return response.json()
 
 
-def get_role_by_role_name(role_name):
+@snapshot_listing("policies/list")
+def list_vault_policies(vault_id):
+    """Yield all policies of the vault, page by page."""
+    return paginate(
+        SOURCE_SESSION,
+        f"{SOURCE_ENV_URL}/v1/policies?resource.type=VAULT&resource.ID={vault_id}",
+        "policies",
+    )
+
+
+def prefetch_role_policies(vault_id, role_ids):
+    """List the policies of the source vault in bulk and index them by role.
+
+    The complete listed policies, and the policies of every given role, are
+    added to the source cache so get_policy and get_role_policies are
+    answered without a request each.
+    """
+    print(f"-- Prefetching the policies of the vault {vault_id} --")
+    role_policies = {role_id: [] for role_id in role_ids}
+    policies = list(list_vault_policies(vault_id))
+    for policy in policies:
+        # a listed policy without its rules is fetched on its own when it is migrated
+        if all(field in policy for field in PREFETCHED_POLICY_FIELDS):
+            SOURCE_CACHE.put(("policies", policy["ID"]), {"policy": policy})
+        for member in policy.get("members") or []:
+            if member.get("type", "ROLE") == "ROLE" and member["ID"] in role_policies:
+                role_policies[member["ID"]].append(policy)
+    if any("members" not in policy for policy in policies):
+        # without the members of every policy the roles can not be indexed
+        print("-- Policy members are not listed, the policies of every role are fetched --")
+        return
+    for role_id, policies_of_role in role_policies.items():
+        SOURCE_CACHE.put(("roles/policies", role_id), {"policies": policies_of_role})
+    print(f"-- {len(policies)} policies of the vault {vault_id} indexed for {len(role_policies)} roles --")
+
+
+def get_role_by_role_name(role_name, target_vault_id=None):
     """Search the target vault for an existing custom role by name."""
-    response = requests.get(
-        f"{TARGET_ENV_URL}/v1/roles?name={role_name}&resource.type=VAULT&resource.ID={TARGET_VAULT_ID}",
-        headers=TARGET_ACCOUNT_HEADERS,
+    response = TARGET_SESSION.get(
+        f"{TARGET_ENV_URL}/v1/roles?name={role_name}&resource.type=VAULT&resource.ID={target_vault_id or TARGET_VAULT_ID}",
     )
     response.raise_for_status()
     return response.json()
 
 
-def assign_policy_to_role(policy_ids, role_id: list):
-    """Assign the provided policies to the role."""
-    for policy_id in policy_ids:
-        assign_request = {"ID": policy_id, "roleIDs": role_id}
-        response = requests.post(
-            f"{TARGET_ENV_URL}/v1/policies/assign",
-            json=assign_request,
-            headers=TARGET_ACCOUNT_HEADERS,
-        )
-        response.raise_for_status()
-    # return response.json()
+def find_role(role_name, target_vault_id=None):
+    """Return the target custom role with the given name, if it exists."""
+    roles = get_role_by_role_name(role_name, target_vault_id).get("roles", [])
+    return {"ID": roles[0]["ID"]} if len(roles) == 1 else None
+
+
+def find_existing_role(role_name, target_vault_id=None):
+    """Return the target role to reuse instead of creating role_name, if any."""
+    if(role_name in SYSTEM_ROLES):
+        print('-- SYSTEM_ROLE found, skipping role creation --')
+        system_role_id = get_target_inventory(target_vault_id).find("roles", role_name)
+        if(system_role_id is None):
+            raise ValueError(f"-- SYSTEM_ROLE {role_name} not found in the target vault --")
+        return {"ID": system_role_id}
+    if(SKIP_ROLE_CREATION_IF_ROLE_EXISTS):
+        print('-- Checking if a role exists for the given vault --')
+        role_id = get_target_inventory(target_vault_id).find("roles", role_name)
+        if(role_id):
+            print("-- Found an existing CUSTOM_ROLE, skipping role creation --")
+            return {"ID" : role_id}
+        print("-- Role does not exist --")
+    return None
 
-def list_all_roles() -> list:
-    """Lists custom roles"""
-    response = requests.get(
-        f"{SOURCE_ENV_URL}/v1/roles?type=CUSTOM&resource.ID={SOURCE_VAULT_ID}&resource.type=VAULT",
-        headers=SOURCE_ACCOUNT_HEADERS,
+
+def creates_role(role_id, target_vault_id=None):
+    """Whether migrating role_id creates a target role, rather than reusing one or being done already."""
+    if completed("roles", role_id):
+        return False
+    role_name = get_role(role_id)["role"]["definition"]["name"]
+    if role_name in SYSTEM_ROLES:
+        return False
+    return not (
+        SKIP_ROLE_CREATION_IF_ROLE_EXISTS and get_target_inventory(target_vault_id).find("roles", role_name)
+    )
+
+
+def assign_policy(policy_id, role_ids: list):
+    """Assign a policy to all the given roles in a single request."""
+    assign_request = {"ID": policy_id, "roleIDs": role_ids}
+    response = TARGET_SESSION.post(
+        f"{TARGET_ENV_URL}/v1/policies/assign",
+        json=assign_request,
     )
     response.raise_for_status()
-    return response.json()
 
 
-def transform_role_payload(source_resource):
+def create_policy_assignment_batcher():
+    """Return a batcher that sends one assignment request per policy."""
+    return AssignmentBatcher(assign_policy, max_workers=MAX_CONCURRENCY)
+
+
+def list_all_roles(source_vault_id=None):
+    """Yields custom roles of the source vault (SOURCE_VAULT_ID by default), page by page"""
+    return paginate(
+        SOURCE_SESSION,
+        f"{SOURCE_ENV_URL}/v1/roles?type=CUSTOM&resource.ID={source_vault_id or SOURCE_VAULT_ID}&resource.type=VAULT",
+        "roles",
+    )
+
+
+def role_policy_ids(role_id):
+    return [policy["ID"] for policy in get_role_policies(role_id)["policies"]]
+
+
+def prefetch_role(role_id, target_vault_id=None):
+    """Read a role and its policies from the source ahead of its migration.
+
+    The policies of a role reused in the target are not migrated, so they are not read.
+    """
+    if not creates_role(role_id, target_vault_id):
+        return
+    for policy_id in role_policy_ids(role_id):
+        get_policy(policy_id)
+
+
+def transform_role_payload(source_resource, target_vault_id=None):
     """Transforms source role payload to target payload."""
     transformed_resource = {}
     transformed_resource["roleDefinition"] = source_resource["role"]["definition"]
@@ -114,64 +218,129 @@ def transform_role_payload(source_resource):
     ]
     # remove upstream read permissions that are implicitly granted in the target account
     transformed_resource["roleDefinition"]["permissions"] = new_permissions
-    transformed_resource["resource"] = {"ID": TARGET_VAULT_ID, "type": "VAULT"}
+    transformed_resource["resource"] = {"ID": target_vault_id or TARGET_VAULT_ID, "type": "VAULT"}
     return transformed_resource
 
-def main(role_ids=None):
-    """Migrates roles and their associated policies."""
+def sync_role(role_id, role_info, policy_assignments, target_vault_id):
+    """Create or skip a role depending on its changes since the last sync.
+
+    A changed role is reported and left as it is, like connections and
+    pipelines, until its update by hand is acknowledged.
+    """
+    role_payload = transform_role_payload(role_info, target_vault_id)
+    role_policies = get_role_policies(role_id)
+    policy_ids = [policy["ID"] for policy in role_policies["policies"]]
+    delta = diff("roles", role_id, {"role": role_payload, "policyIDs": policy_ids}, target_vault_id)
+    # policies are synced on their own as they can change while the role does not
+    synced_policies = migrate_policies(policy_ids, target_vault_id) if policy_ids else []
+    if delta.status == UNCHANGED:
+        print(f"-- Role {role_id} unchanged since the last sync, Target ROLE_ID: {delta.target_id} --")
+        return {"ID": delta.target_id}
+    if delta.status != NEW:
+        # the update only patches the role metadata, permissions and removed policies can not be synced
+        if acknowledge_change("roles", role_id, target_vault_id, delta):
+            print(f"-- Role {role_payload['roleDefinition']['name']} updated by hand, marked as synced --")
+        else:
+            print(f"-- Role {role_payload['roleDefinition']['name']} changed since the last sync, update Target ROLE_ID: {delta.target_id} manually and list {role_id} in DELTA_SYNC_ACKNOWLEDGED --")
+        return {"ID": delta.target_id}
+    print(f"-- Creating role: {role_payload['roleDefinition']['name']} --")
+    synced_role = create_role(role_payload)
+    for policy in synced_policies:
+        policy_assignments.add(policy["ID"], [synced_role["ID"]])
+    # the role is only marked as synced once its policies are assigned
+    policy_assignments.flush()
+    record("roles", role_id, synced_role["ID"], target_vault_id)
+    mark_synced("roles", role_id, target_vault_id, delta)
+    return synced_role
+
+
+def main(role_ids=None, target_vault_id=None, source_vault_id=None):
+    """Migrates roles and their associated policies (into target_vault_id, TARGET_VAULT_ID by default)."""
+    target_vault_id = target_vault_id or TARGET_VAULT_ID
+    source_vault_id = source_vault_id or SOURCE_VAULT_ID
+    # bound by the roles loop, the listing, sharding and validation run before it
+    role_name = role_id = None
     try:
         print("-- Initializing Roles migration --")
-        should_enable_custom_role_check = SKIP_ROLE_CREATION_IF_ROLE_EXISTS
-        if MIGRATE_ALL_ROLES:
-            if(SOURCE_VAULT_ID):
-                print(f"-- Fetching Roles for the vault {SOURCE_VAULT_ID}")
-                roles = list_all_roles()
-                role_ids = [role["ID"] for role in roles["roles"]]
+        # role IDs passed by the caller take precedence over MIGRATE_ALL_ROLES
+        if role_ids is None and MIGRATE_ALL_ROLES:
+            if(source_vault_id):
+                print(f"-- Fetching Roles for the vault {source_vault_id}")
+                role_ids = (role["ID"] for role in list_all_roles(source_vault_id))
             else:
                 print("-- Please provide valid input. Source vault ID is required to migrate all roles --")
-        else:
+        elif role_ids is None:
             role_ids = ast.literal_eval(ROLE_IDS)
+        if PREFETCH_POLICIES and source_vault_id:
+            role_ids = list(role_ids)
+            prefetch_role_policies(source_vault_id, role_ids)
+        # roles sharing a policy are migrated by the same shard
+        role_ids = select_shard(role_ids, dependencies=role_policy_ids)
+        if VALIDATE_POLICIES:
+            role_ids = list(role_ids)
+            # reused roles keep their target policies, only the created roles get the source ones
+            validate_target_policies(
+                [
+                    policy_id
+                    for role_id in role_ids
+                    if creates_role(role_id, target_vault_id)
+                    for policy_id in role_policy_ids(role_id)
+                ],
+                target_vault_id,
+            )
         roles_created = []
-        for index, role_id in enumerate(role_ids):
-            role_info = get_role(role_id)
-            role_name = role_info["role"]["definition"]["name"]
-            print(f"-- Working on Role {index + 1}: {role_name}, ID: {role_id}  --")
-            if(role_name in SYSTEM_ROLES):
-                print('-- SYSTEM_ROLE found, skipping role creation --')
-                system_role = get_system_role(role_name)
-                roles_created.append({"ID": system_role["roles"][0]["ID"]})
-            else:
-                should_create_role = True
-                if(should_enable_custom_role_check):
-                    print('-- Checking if a role exists for the given vault --')
-                    role_response = get_role_by_role_name(role_name)
-                    if(len(role_response["roles"]) == 1):
-                        print("-- Found an existing CUSTOM_ROLE, skipping role creation --")
-                        should_create_role = False
-                        roles_created.append({"ID" : role_response["roles"][0]["ID"]})
-                    else:
-                        print("-- Role does not exist --") 
-                if(should_create_role):
-                    role_payload = transform_role_payload(role_info)
-                    print(f"-- Creating role: {role_name} --")
-                    new_role = create_role(role_payload)
-                    roles_created.append(new_role)
-                    print(f"-- Fetching policies for the given role --")
-                    role_policies = get_role_policies(role_id)
-                    policy_ids = [policy["ID"] for policy in role_policies["policies"]]
-                    no_of_policies = len(policy_ids)
-                    if(no_of_policies == 0):
-                        print('-- No policies found for the given role --')
+        # policy -> roles assignments are coalesced and sent once the roles are created
+        policy_assignments = create_policy_assignment_batcher()
+        try:
+            # the next roles and their policies are read while the current one is written
+            prefetch = partial(prefetch_role, target_vault_id=target_vault_id)
+            with closing(prefetched(role_ids, prefetch, PREFETCH_DEPTH)) as prefetching:
+                for index, role_id in enumerate(prefetching):
+                    migrated_role_id = completed("roles", role_id)
+                    if(migrated_role_id):
+                        print(f"-- Role {role_id} already migrated, Target ROLE_ID: {migrated_role_id} --")
+                        roles_created.append({"ID": migrated_role_id})
+                        continue
+                    role_info = get_role(role_id)
+                    role_name = role_info["role"]["definition"]["name"]
+                    print(f"-- Working on Role {index + 1}: {role_name}, ID: {role_id}  --")
+                    existing_role = find_existing_role(role_name, target_vault_id)
+                    if(existing_role):
+                        roles_created.append(existing_role)
+                        record("roles", role_id, existing_role["ID"], target_vault_id)
+                    elif(DELTA_SYNC):
+                        roles_created.append(sync_role(role_id, role_info, policy_assignments, target_vault_id))
                     else:
-                        print(f"-- Working on policies migration. No. of policies found for given role: {no_of_policies} --")
-                        policies_created = migrate_policies(policy_ids)
-                        created_policy_ids = [policy["ID"] for policy in policies_created]
-                        assign_policy_to_role(created_policy_ids, [new_role["ID"]])
-                    print(f"-- Role migrated successfully: {role_name}. Source ROLE_ID: {role_id}, Target ROLE_ID: {new_role['ID']} --")
+                        role_payload = transform_role_payload(role_info, target_vault_id)
+                        print(f"-- Creating role: {role_name} --")
+                        new_role = create_role(role_payload)
+                        roles_created.append(new_role)
+                        print(f"-- Fetching policies for the given role --")
+                        role_policies = get_role_policies(role_id)
+                        policy_ids = [policy["ID"] for policy in role_policies["policies"]]
+                        no_of_policies = len(policy_ids)
+                        if(no_of_policies == 0):
+                            print('-- No policies found for the given role --')
+                        else:
+                            print(f"-- Working on policies migration. No. of policies found for given role: {no_of_policies} --")
+                            policies_created = migrate_policies(policy_ids, target_vault_id)
+                            for policy in policies_created:
+                                policy_assignments.add(policy["ID"], [new_role["ID"]])
+                        if(get_journal()):
+                            # a journaled role is skipped on resume, its policies have to be assigned first
+                            policy_assignments.flush()
+                        record("roles", role_id, new_role["ID"], target_vault_id)
+                        print(f"-- Role migrated successfully: {role_name}. Source ROLE_ID: {role_id}, Target ROLE_ID: {new_role['ID']} --")
+        finally:
+            # the roles created before a failure keep their policies
+            no_of_assignments = policy_assignments.flush()
+            if no_of_assignments:
+                print(f"-- Policies assigned to roles with {no_of_assignments} requests --")
         print("-- Roles migration script executed successfully --")        
         return roles_created
     except requests.exceptions.HTTPError as http_err:
-        print(f'-- Role creation failed for {role_name if role_name else ""}, ID: {role_id}. --')
+        if role_id:
+            print(f'-- Role creation failed for {role_name if role_name else ""}, ID: {role_id}. --')
         print(f'-- migrate_roles HTTP error: {http_err.response.content.decode()} --')
         raise http_err
     except Exception as err:
@@ -180,3 +349,4 @@ def main(role_ids=None):
 
 if __name__ == "__main__":
     main()
+    print_cache_stats()
@@ -1,7 +1,25 @@
 import os
 import ast
 import requests
-from migrate_roles import main as migrate_roles
+from functools import partial
+from migrate_policies import migrate_policy, validate_target_policies
+from migrate_roles import (
+    create_policy_assignment_batcher,
+    create_role,
+    find_existing_role,
+    get_role,
+    get_role_policies,
+    transform_role_payload,
+)
+from assignments import AssignmentBatcher
+from concurrency import map_concurrently
+from dependency_graph import DependencyGraph
+from cache import cached_source, print_cache_stats
+from http_client import get_session
+from journal import completed, get_journal, record
+from policy_validation import VALIDATE_POLICIES
+from retry import create_idempotently
+from sharding import select_shard
 
 
 SERVICE_ACCOUNT_IDS = os.getenv("SERVICE_ACCOUNT_IDS")
@@ -12,64 +30,98 @@ SOURCE_ACCOUNT_AUTH = os.getenv("SOURCE_ACCOUNT_AUTH")
 TARGET_ACCOUNT_AUTH = os.getenv("TARGET_ACCOUNT_AUTH")
 SOURCE_ENV_URL = os.getenv("SOURCE_ENV_URL")
 TARGET_ENV_URL = os.getenv("TARGET_ENV_URL")
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY") or "1")
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-TARGET_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": TARGET_ACCOUNT_ID,
-    "Authorization": f"Bearer {TARGET_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
 
 
+@cached_source("members/roles")
 def list_service_account_roles(service_account_id):
     """Return every role assigned to the given service account."""
-    response = requests.get(
+    response = SOURCE_SESSION.get(
         f"{SOURCE_ENV_URL}/v1/members/{service_account_id}/roles?member.type=SERVICE_ACCOUNT",
-        headers=SOURCE_ACCOUNT_HEADERS,
     )
     response.raise_for_status()
     return response.json()
 
 
+def service_account_dependencies(service_account_id):
+    """Return the roles of a service account and their policies."""
+    role_ids = [
+        service_account_role["role"]["ID"]
+        for service_account_role in list_service_account_roles(service_account_id)["roleToResource"]
+    ]
+    return [("role", role_id) for role_id in role_ids] + [
+        ("policy", policy["ID"]) for role_id in role_ids for policy in get_role_policies(role_id)["policies"]
+    ]
+
+
+@cached_source("serviceAccounts")
 def get_service_account(service_account_id):
     """Fetch a service account definition from the source account."""
-    response = requests.get(
+    response = SOURCE_SESSION.get(
         f"{SOURCE_ENV_URL}/v1/serviceAccounts/{service_account_id}",
-        headers=SOURCE_ACCOUNT_HEADERS,
     )
     response.raise_for_status()
     return response.json()
 
 
-def create_service_account(service_account):
-    """Create the supplied service account in the target account."""
-    response = requests.post(
-        f"{TARGET_ENV_URL}/v1/serviceAccounts",
-        json=service_account,
-        headers=TARGET_ACCOUNT_HEADERS,
+def get_service_account_by_name(service_account_name):
+    """Search the target account for an existing service account by name."""
+    response = TARGET_SESSION.get(
+        f"{TARGET_ENV_URL}/v1/serviceAccounts?name={service_account_name}",
     )
     response.raise_for_status()
     return response.json()
 
 
-def assign_roles_to_service_account(role_ids, service_account_id):
-    """Attach the specified roles to the new service account."""
-    for role_id in role_ids:
-        assign_request = {
-            "ID": role_id,
-            "members": [{"type": "SERVICE_ACCOUNT", "ID": service_account_id}],
-        }
-        response = requests.post(
-            f"{TARGET_ENV_URL}/v1/roles/assign",
-            json=assign_request,
-            headers=TARGET_ACCOUNT_HEADERS,
+def find_service_account(service_account_name):
+    """Return the target service account with the given name, if it exists."""
+    service_accounts = get_service_account_by_name(service_account_name).get("serviceAccounts", [])
+    if len(service_accounts) != 1:
+        return None
+    # credentials are only returned on creation, the account has to be re-keyed
+    print(f"-- Re-key {service_account_name} from Studio to get its credentials --")
+    return {"clientID": service_accounts[0]["ID"]}
+
+
+def create_service_account(service_account):
+    """Create the supplied service account in the target account."""
+    def post_service_account():
+        response = TARGET_SESSION.post(
+            f"{TARGET_ENV_URL}/v1/serviceAccounts",
+            json=service_account,
         )
         response.raise_for_status()
+        return response.json()
+
+    service_account_name = service_account["serviceAccount"]["name"]
+    return create_idempotently(
+        post_service_account,
+        lambda: find_service_account(service_account_name),
+        f"service account {service_account_name}",
+    )
+
+
+def assign_role(role_id, members):
+    """Assign a role to all the given members in a single request."""
+    assign_request = {"ID": role_id, "members": members}
+    response = TARGET_SESSION.post(
+        f"{TARGET_ENV_URL}/v1/roles/assign",
+        json=assign_request,
+    )
+    response.raise_for_status()
+
+
+def create_role_assignment_batcher():
+    """Return a batcher that sends one assignment request per role."""
+    return AssignmentBatcher(assign_role, max_workers=MAX_CONCURRENCY)
+
+
+def service_account_member(service_account_id):
+    """Return the role member entry for a service account."""
+    return {"type": "SERVICE_ACCOUNT", "ID": service_account_id}
 
 
 def transform_service_account_payload(source_resource):
@@ -82,6 +134,137 @@ def transform_service_account_payload(source_resource):
     return transformed_resource
 
 
+def crawl_service_account(service_account_id):
+    """Fetch a service account and the IDs of its roles from the source account."""
+    service_account_resource = get_service_account(service_account_id)
+    service_account_roles = list_service_account_roles(service_account_id)
+    role_ids = [
+        service_account_role["role"]["ID"]
+        for service_account_role in service_account_roles["roleToResource"]
+    ]
+    return service_account_resource, role_ids
+
+
+def crawl_role(role_id):
+    """Fetch a role, the target role reused in its place (if any) and its policy IDs."""
+    role_info = get_role(role_id)
+    existing_role = find_existing_role(role_info["role"]["definition"]["name"])
+    if existing_role:
+        return role_info, existing_role, []
+    role_policies = get_role_policies(role_id)
+    return role_info, None, [policy["ID"] for policy in role_policies["policies"]]
+
+
+def migrate_policy_step(policy_id, results):
+    """Graph step creating a policy in the target vault."""
+    return migrate_policy(policy_id)
+
+
+def migrate_role_step(role_id, role_info, existing_role, policy_ids, policy_assignments, results):
+    """Graph step creating a role once all of its policies exist."""
+    if existing_role:
+        record("roles", role_id, existing_role["ID"], TARGET_VAULT_ID)
+        return existing_role
+    role_name = role_info["role"]["definition"]["name"]
+    print(f"-- Creating role: {role_name} --")
+    new_role = create_role(transform_role_payload(role_info))
+    # a journaled role is skipped on resume, its policies have to be assigned first
+    assignments = create_policy_assignment_batcher() if get_journal() else policy_assignments
+    for policy_id in policy_ids:
+        assignments.add(results[("policy", policy_id)]["ID"], [new_role["ID"]])
+    if assignments is not policy_assignments:
+        assignments.flush()
+    record("roles", role_id, new_role["ID"], TARGET_VAULT_ID)
+    print(f"-- Role migrated successfully: {role_name}. Source ROLE_ID: {role_id}, Target ROLE_ID: {new_role['ID']} --")
+    return new_role
+
+
+def migrate_service_account_step(service_account_id, service_account_resource, role_ids, role_assignments, results):
+    """Graph step creating a service account once all of its roles exist."""
+    service_account_name = service_account_resource["serviceAccount"]["name"]
+    print(f"-- Creating Service account: {service_account_name} --")
+    new_service_account = create_service_account(
+        transform_service_account_payload(service_account_resource)
+    )
+    if(len(role_ids) == 0):
+        print(f"-- No Roles found for {service_account_name} --")
+    # a journaled service account is skipped on resume, its roles have to be assigned first
+    assignments = create_role_assignment_batcher() if get_journal() else role_assignments
+    for role_id in role_ids:
+        assignments.add(
+            results[("role", role_id)]["ID"],
+            [service_account_member(new_service_account["clientID"])],
+        )
+    if assignments is not role_assignments:
+        assignments.flush()
+    record("serviceAccounts", service_account_id, new_service_account["clientID"], TARGET_VAULT_ID)
+    print(f"-- Service account migrated succesfully: {service_account_name}. Source SERVICE_ACCOUNT_ID: {service_account_id}, Target SERVICE_ACCOUNT_ID: {new_service_account['clientID']} --")
+    return new_service_account
+
+
+def add_migrated_node(graph, node, kind, source_id, id_field):
+    """Add a resource journaled by a previous run to the graph, if it is one."""
+    target_id = completed(kind, source_id)
+    if not target_id:
+        return False
+    print(f"-- {kind} {source_id} already migrated, target ID: {target_id} --")
+    graph.add(node, lambda results: {id_field: target_id})
+    return True
+
+
+def build_migration_graph(service_accounts_ids, policy_assignments, role_assignments):
+    """Crawl the source account into a service account -> role -> policy graph.
+
+    Roles shared by several service accounts and policies shared by several
+    roles are fetched and added to the graph only once. Resources journaled
+    by a previous run are added without fetching them.
+    """
+    graph = DependencyGraph()
+    service_accounts_ids = [
+        service_account_id
+        for service_account_id in dict.fromkeys(service_accounts_ids)
+        if not add_migrated_node(
+            graph, ("service_account", service_account_id), "serviceAccounts", service_account_id, "clientID"
+        )
+    ]
+    service_accounts = map_concurrently(crawl_service_account, service_accounts_ids, MAX_CONCURRENCY)
+    role_ids = [
+        role_id
+        for role_id in dict.fromkeys(
+            role_id for _, service_account_role_ids in service_accounts for role_id in service_account_role_ids
+        )
+        if not add_migrated_node(graph, ("role", role_id), "roles", role_id, "ID")
+    ]
+    roles = map_concurrently(crawl_role, role_ids, MAX_CONCURRENCY)
+    for role_id, (role_info, existing_role, policy_ids) in zip(role_ids, roles):
+        for policy_id in policy_ids:
+            graph.add(("policy", policy_id), partial(migrate_policy_step, policy_id))
+        graph.add(
+            ("role", role_id),
+            partial(migrate_role_step, role_id, role_info, existing_role, policy_ids, policy_assignments),
+            [("policy", policy_id) for policy_id in policy_ids],
+        )
+    for service_account_id, (service_account_resource, service_account_role_ids) in zip(service_accounts_ids, service_accounts):
+        graph.add(
+            ("service_account", service_account_id),
+            partial(migrate_service_account_step, service_account_id, service_account_resource, service_account_role_ids, role_assignments),
+            [("role", role_id) for role_id in service_account_role_ids],
+        )
+    return graph
+
+
+def flush_assignments(policy_assignments, role_assignments):
+    """Send the pending policy -> role and role -> service account assignments."""
+    try:
+        no_of_assignments = policy_assignments.flush()
+        if no_of_assignments:
+            print(f"-- Policies assigned to roles with {no_of_assignments} requests --")
+    finally:
+        no_of_assignments = role_assignments.flush()
+        if no_of_assignments:
+            print(f"-- Roles assigned to service accounts with {no_of_assignments} requests --")
+
+
 def main(service_accounts_ids=None):
     """Migrates service accounts and associated roles."""
     try:
@@ -91,33 +274,25 @@ def main(service_accounts_ids=None):
             if service_accounts_ids
             else ast.literal_eval(SERVICE_ACCOUNT_IDS)
         )
-        created_service_accounts = []
-        for index, service_account_id in enumerate(service_accounts_ids):
-            service_account_resource = get_service_account(service_account_id)
-            print(f"-- Working on Service account: {index + 1}  {service_account_resource['serviceAccount']['name']} --")
-            service_account_payload = transform_service_account_payload(
-                service_account_resource
-            )
-            print("-- Creating Service account --")
-            new_service_account = create_service_account(service_account_payload)
-            created_service_accounts.append(new_service_account)
-            print(f"-- Fetching Roles --")
-            service_account_roles = list_service_account_roles(service_account_id)
-            service_account_roles_ids = [
-                service_account_role["role"]["ID"]
-                for service_account_role in service_account_roles["roleToResource"]
-            ]
-            no_of_roles = len(service_account_roles_ids)
-            if(no_of_roles == 0):
-                print(f"-- No Roles found for {service_account_resource['serviceAccount']['name']} --")
-            else:
-                print(f"-- Working on Roles migration. No.of Roles for {service_account_resource['serviceAccount']['name']}: {no_of_roles} --")
-                roles_created = migrate_roles(service_account_roles_ids)
-                created_role_ids = [role["ID"] for role in roles_created]
-                assign_roles_to_service_account(
-                created_role_ids, new_service_account["clientID"]
-                )
-            print(f"-- Service account migrated succesfully: {service_account_resource['serviceAccount']['name']}. Source SERVICE_ACCOUNT_ID: {service_account_id}, Target SERVICE_ACCOUNT_ID: {new_service_account['clientID']} --")
+        # service accounts sharing a role, or roles sharing a policy, are migrated by the same shard
+        service_accounts_ids = select_shard(service_accounts_ids, dependencies=service_account_dependencies)
+        # assignments are grouped by policy and role and sent once every resource exists
+        policy_assignments = create_policy_assignment_batcher()
+        role_assignments = create_role_assignment_batcher()
+        print("-- Fetching Service accounts, Roles and Policies --")
+        graph = build_migration_graph(service_accounts_ids, policy_assignments, role_assignments)
+        if VALIDATE_POLICIES:
+            validate_target_policies([key[1] for key in graph.actions if key[0] == "policy"])
+        print(f"-- Migrating {len(graph)} resources in {len(graph.waves())} waves --")
+        try:
+            results = graph.run(MAX_CONCURRENCY)
+        finally:
+            # the resources created before a failure keep their assignments
+            flush_assignments(policy_assignments, role_assignments)
+        created_service_accounts = [
+            results[("service_account", service_account_id)]
+            for service_account_id in service_accounts_ids
+        ]
         print("-- Service account migration script executed successfully --")        
         return created_service_accounts
     except requests.exceptions.HTTPError as http_err:
@@ -132,3 +307,4 @@ def main(service_accounts_ids=None):
 
 if __name__ == "__main__":
     main()
+    print_cache_stats()
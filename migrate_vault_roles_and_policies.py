@@ -1,44 +1,45 @@
 import requests
 import os
+from cache import print_cache_stats, snapshot_listing
 from migrate_roles import main as migrate_roles
+from migration_plan import build_plan, print_plan
+from http_client import get_session, paginate
 
 SOURCE_VAULT_ID = os.getenv("SOURCE_VAULT_ID")
 TARGET_VAULT_ID = os.getenv("TARGET_VAULT_ID")
 SOURCE_ACCOUNT_ID = os.getenv("SOURCE_ACCOUNT_ID")
 SOURCE_ACCOUNT_AUTH = os.getenv("SOURCE_ACCOUNT_AUTH")
 SOURCE_ENV_URL = os.getenv("SOURCE_ENV_URL")
+PLAN = (os.getenv("PLAN") or "").lower() == "true"
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
 
 
-def list_all_vault_custom_roles() -> list:
-    """Return all custom roles of the source vault."""
-    response = requests.get(
-        f"{SOURCE_ENV_URL}/v1/roles?type=CUSTOM&resource.ID={SOURCE_VAULT_ID}&resource.type=VAULT",
-        headers=SOURCE_ACCOUNT_HEADERS,
+@snapshot_listing("roles/list")
+def list_all_vault_custom_roles(vault_id):
+    """Yield all custom roles of the vault, page by page."""
+    return paginate(
+        SOURCE_SESSION,
+        f"{SOURCE_ENV_URL}/v1/roles?type=CUSTOM&resource.ID={vault_id}&resource.type=VAULT",
+        "roles",
     )
-    response.raise_for_status()
-    return response.json()
 
 
 def main():
     """Migrates all the custom roles and policies"""
     try:
         print(f"-- Fetching roles for the vault {SOURCE_VAULT_ID} --")
-        roles = list_all_vault_custom_roles()
-        role_ids = [
-            role["ID"]
-            for role in roles["roles"]
-        ]
+        # roles are streamed so migration starts while later pages are fetched
+        role_ids = (role["ID"] for role in list_all_vault_custom_roles(SOURCE_VAULT_ID))
+        if PLAN:
+            print(f"-- Planning the migration of vault {SOURCE_VAULT_ID} to {TARGET_VAULT_ID}, nothing will be created --")
+            print_plan(build_plan(role_ids))
+            return
+        print("-- Working on Roles migration --")
+        roles_created = migrate_roles(role_ids)
         print(
-            f"-- No.of Roles: {len(role_ids)} --",
+            f"-- No.of Roles: {len(roles_created) if roles_created else 0} --",
         )
-        print("-- Working on Roles migration --")
-        migrate_roles(role_ids)
         print(
             f"-- Roles and Policies of vault {SOURCE_VAULT_ID} are migrated successfully --"
         )
@@ -52,3 +53,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    print_cache_stats()
@@ -2,6 +2,8 @@ import requests
 import os
 import json
 import random
+from cache import cached_source, print_cache_stats
+from http_client import get_session
 
 SOURCE_VAULT_ID = os.getenv("SOURCE_VAULT_ID")
 SOURCE_ACCOUNT_ID = os.getenv("SOURCE_ACCOUNT_ID")
@@ -15,44 +17,38 @@ VAULT_NAME = os.getenv("VAULT_NAME")
 VAULT_DESCRIPTION = os.getenv("VAULT_DESCRIPTION")
 VAULT_SCHEMA_CONFIG = os.getenv("VAULT_SCHEMA_CONFIG")
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-TARGET_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": TARGET_ACCOUNT_ID,
-    "Authorization": f"Bearer {TARGET_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
+@cached_source("vaults")
 def get_vault_details(vaultID: str):
     """Return the vault metadata and schema"""
-    response = requests.get(f"{SOURCE_ENV_URL}/v1/vaults/{vaultID}", headers=SOURCE_ACCOUNT_HEADERS)
+    response = SOURCE_SESSION.get(f"{SOURCE_ENV_URL}/v1/vaults/{vaultID}")
     response.raise_for_status()
     return response.json()
 
 def create_vault(create_vault_request_payload):
     """Creates a vault"""
-    response = requests.post(f"{TARGET_ENV_URL}/v1/vaults", json=create_vault_request_payload, headers=TARGET_ACCOUNT_HEADERS)
+    response = TARGET_SESSION.post(f"{TARGET_ENV_URL}/v1/vaults", json=create_vault_request_payload)
     response.raise_for_status()
     return response.json()
 
-def transform_payload(vault_details):
+def transform_payload(vault_details, workspace_id=None, vault_name=None, vault_description=None):
     """Transforms source vault payload to target payload."""
+    vault_name = vault_name or VAULT_NAME
+    vault_description = vault_description or VAULT_DESCRIPTION
     create_vault_payload = {
-        "name": VAULT_NAME if VAULT_NAME else f"UntitledVault{random.randint(0,1000)}" if VAULT_SCHEMA_CONFIG else vault_details["name"],
-        "description": VAULT_DESCRIPTION if VAULT_DESCRIPTION else "" if VAULT_SCHEMA_CONFIG else vault_details["description"],
+        "name": vault_name if vault_name else f"UntitledVault{random.randint(0,1000)}" if VAULT_SCHEMA_CONFIG else vault_details["name"],
+        "description": vault_description if vault_description else "" if VAULT_SCHEMA_CONFIG else vault_details["description"],
         "vaultSchema" : {
             "schemas": vault_details["schemas"],
             "tags": vault_details["tags"]
         },
-        "workspaceID": WORKSPACE_ID
+        "workspaceID": workspace_id or WORKSPACE_ID
     }
     return create_vault_payload
     
 def main():
-    """Migrates vault schema"""
+    """Migrates vault schema and returns the ID of the created vault"""
     try:
         print("-- Initializing Vault migration --")
         if VAULT_SCHEMA_CONFIG is not None and VAULT_SCHEMA_CONFIG == "config_file":
@@ -78,6 +74,7 @@ def main():
                 env_file = os.getenv('GITHUB_ENV')
                 with open(env_file, "a") as file:
                     file.write(f"TARGET_VAULT_ID={create_vault_response['ID']}")
+            return create_vault_response["ID"]
         else:
             print("-- Please provide valid input. Workspace ID is missing. --")
 
@@ -90,3 +87,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    print_cache_stats()
@@ -0,0 +1,95 @@
+import json
+import os
+import requests
+import migrate_roles
+import migrate_vault_schema
+from cache import print_cache_stats
+from concurrency import map_concurrently
+from migrate_vault_roles_and_policies import list_all_vault_custom_roles
+
+
+BATCH_MANIFEST = os.getenv("BATCH_MANIFEST")
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY") or "4")
+
+MANIFEST_FIELDS = ["sourceVaultID", "workspaceID"]
+
+
+def load_manifest(manifest):
+    """Parse a manifest, given as JSON or as the path of a JSON file.
+
+    Every entry maps a source vault to the workspace its copy is created in:
+    {"sourceVaultID": "...", "workspaceID": "...", "vaultName": "...", "vaultDescription": "..."}
+    where the name and description are optional.
+    """
+    if os.path.isfile(manifest):
+        with open(manifest, "r") as file:
+            manifest = file.read()
+    entries = json.loads(manifest)
+    for index, entry in enumerate(entries):
+        missing_fields = [field for field in MANIFEST_FIELDS if not entry.get(field)]
+        if missing_fields:
+            raise ValueError(f"-- Manifest entry {index + 1} is missing {missing_fields} --")
+    return entries
+
+
+def migrate_vault(entry, result):
+    """Create the vault of a manifest entry and migrate its roles and policies into it."""
+    source_vault_id = entry["sourceVaultID"]
+    vault_details = migrate_vault_schema.get_vault_details(source_vault_id)["vault"]
+    create_vault_request = migrate_vault_schema.transform_payload(
+        vault_details, entry["workspaceID"], entry.get("vaultName"), entry.get("vaultDescription")
+    )
+    result["targetVaultID"] = migrate_vault_schema.create_vault(create_vault_request)["ID"]
+    print(f"-- Vault {result['targetVaultID']} created for the source vault {source_vault_id} --")
+    role_ids = (role["ID"] for role in list_all_vault_custom_roles(source_vault_id))
+    roles_created = migrate_roles.main(role_ids, result["targetVaultID"], source_vault_id)
+    result["roles"] = len(roles_created) if roles_created else 0
+
+
+def run_vault(entry):
+    """Migrate one vault, returning its result instead of failing the batch."""
+    result = {"sourceVaultID": entry["sourceVaultID"], "targetVaultID": None, "roles": 0, "error": None}
+    try:
+        migrate_vault(entry, result)
+    except requests.exceptions.HTTPError as http_err:
+        result["error"] = http_err.response.content.decode()
+    except Exception as err:
+        result["error"] = str(err)
+    return result
+
+
+def print_summary(results):
+    """Print the outcome of every vault of the batch."""
+    print("-- Batch migration summary: --")
+    for result in results:
+        if result["error"]:
+            print(
+                f"--   {result['sourceVaultID']}: failed (target vault: {result['targetVaultID'] or 'not created'}). "
+                f"{result['error']} --"
+            )
+        else:
+            print(f"--   {result['sourceVaultID']} -> {result['targetVaultID']}: {result['roles']} roles migrated --")
+    failed = sum(1 for result in results if result["error"])
+    print(f"-- {len(results) - failed} out of {len(results)} vaults migrated successfully --")
+
+
+def main():
+    """Migrates the schema, roles and policies of every vault of the manifest"""
+    try:
+        if not BATCH_MANIFEST:
+            print("-- Please provide valid input. BATCH_MANIFEST is missing. --")
+            exit(1)
+        entries = load_manifest(BATCH_MANIFEST)
+        print(f"-- Migrating {len(entries)} vaults, {BATCH_CONCURRENCY} at a time --")
+        results = map_concurrently(run_vault, entries, BATCH_CONCURRENCY)
+        print_summary(results)
+        if any(result["error"] for result in results):
+            exit(1)
+    except Exception as err:
+        print(f"-- migrate_vaults_batch other error: {err} --")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
+    print_cache_stats()
@@ -0,0 +1,148 @@
+import math
+import os
+import threading
+import time
+from collections import Counter
+import assignments
+import http_client
+import journal
+import migrate_roles
+from concurrency import map_concurrently
+from migrate_policies import get_policy
+
+
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY") or "1")
+PLAN_RATE_LIMIT = float(os.getenv("PLAN_RATE_LIMIT") or "0")
+PLAN_REQUEST_LATENCY = float(os.getenv("PLAN_REQUEST_LATENCY") or "0")
+
+
+class MigrationPlan:
+    """API calls and conflicts of a roles and policies migration, without running it."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.conflicts = []
+        self.roles_to_create = []
+        self.roles_reused = []
+        self.read_time = 0.0
+        self.reads = 0
+        self._lock = threading.Lock()
+
+    def add_call(self, endpoint, count=1):
+        with self._lock:
+            self.calls[endpoint] += count
+
+    def add_conflict(self, conflict):
+        with self._lock:
+            self.conflicts.append(conflict)
+
+    def read(self, endpoint, fetch, *args):
+        """Fetch a source resource, counting the call and its latency."""
+        started_at = time.monotonic()
+        resource = fetch(*args)
+        with self._lock:
+            self.read_time += time.monotonic() - started_at
+            self.reads += 1
+            self.calls[endpoint] += 1
+        return resource
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    @property
+    def average_latency(self):
+        if PLAN_REQUEST_LATENCY:
+            return PLAN_REQUEST_LATENCY
+        return self.read_time / self.reads if self.reads else 0.0
+
+    def projected_seconds(self, concurrency=MAX_CONCURRENCY, rate_limit=PLAN_RATE_LIMIT):
+        """Return the projected duration of the migration, in seconds."""
+        seconds = self.total_calls * self.average_latency / max(1, concurrency)
+        if rate_limit:
+            seconds = max(seconds, self.total_calls / rate_limit)
+        return seconds
+
+
+def plan_role(plan, role_id):
+    """Add the calls needed to migrate a role to the plan and return its policy IDs."""
+    role_info = plan.read("GET /v1/roles/{ID}", migrate_roles.get_role, role_id)
+    role_name = role_info["role"]["definition"]["name"]
+    target_role_id = migrate_roles.get_target_inventory().find("roles", role_name)
+    if role_name in migrate_roles.SYSTEM_ROLES:
+        if target_role_id is None:
+            plan.add_conflict(f"SYSTEM_ROLE {role_name} does not exist in the target vault")
+        plan.roles_reused.append(role_name)
+        return []
+    if target_role_id and migrate_roles.SKIP_ROLE_CREATION_IF_ROLE_EXISTS:
+        plan.roles_reused.append(role_name)
+        return []
+    if target_role_id:
+        plan.add_conflict(f"Role {role_name} already exists in the target vault")
+    plan.roles_to_create.append(role_name)
+    plan.add_call("POST /v1/roles")
+    role_policies = plan.read("GET /v1/roles/{ID}/policies", migrate_roles.get_role_policies, role_id)
+    return [policy["ID"] for policy in role_policies["policies"]]
+
+
+def plan_policy(plan, policy_id, no_of_roles):
+    """Add the calls needed to migrate a policy attached to no_of_roles roles."""
+    policy = plan.read("GET /v1/policies/{ID}", get_policy, policy_id)["policy"]
+    policy_name = policy["name"]
+    # a policy shared by several roles is created once and assigned to all of them
+    plan.add_call("POST /v1/policies")
+    if migrate_roles.get_target_inventory().find("policies", policy_name):
+        plan.add_conflict(f"Policy {policy_name} already exists in the target vault")
+    plan.add_call("POST /v1/policies/assign", assignment_requests(no_of_roles))
+
+
+def assignment_requests(no_of_roles):
+    """Return the requests assigning a policy to no_of_roles roles.
+
+    The roles of a policy are assigned in chunks of ASSIGN_BATCH_SIZE, or one
+    by one when MIGRATION_JOURNAL flushes the assignments after every role.
+    """
+    if journal.MIGRATION_JOURNAL:
+        return no_of_roles
+    if not assignments.ASSIGN_BATCH_SIZE:
+        return 1
+    return math.ceil(no_of_roles / assignments.ASSIGN_BATCH_SIZE)
+
+
+def build_plan(role_ids):
+    """Crawl the source (read only) and return the plan of the roles migration."""
+    plan = MigrationPlan()
+    role_ids = list(role_ids)
+    plan.add_call("GET /v1/roles (source vault listing)", len(role_ids) // http_client.HTTP_PAGE_SIZE + 1)
+    roles_policy_ids = map_concurrently(lambda role_id: plan_role(plan, role_id), role_ids, MAX_CONCURRENCY)
+    if plan.roles_reused or (role_ids and migrate_roles.SKIP_ROLE_CREATION_IF_ROLE_EXISTS):
+        plan.add_call("GET /v1/roles (target vault listing)")
+    for role_name, count in Counter(plan.roles_to_create).items():
+        if count > 1:
+            plan.add_conflict(f"{count} source roles are named {role_name}, only one can be created")
+    no_of_roles = Counter(policy_id for policy_ids in roles_policy_ids for policy_id in policy_ids)
+    map_concurrently(
+        lambda policy_id: plan_policy(plan, policy_id, no_of_roles[policy_id]), list(no_of_roles), MAX_CONCURRENCY
+    )
+    return plan
+
+
+def print_plan(plan, concurrency=MAX_CONCURRENCY, rate_limit=PLAN_RATE_LIMIT):
+    """Print the API calls, projected duration and conflicts of a plan."""
+    print(f"-- Roles to create: {len(plan.roles_to_create)}, existing roles reused: {len(plan.roles_reused)} --")
+    print(f"-- Policies to create: {plan.calls['POST /v1/policies']} --")
+    print("-- API calls per endpoint: --")
+    for endpoint, count in sorted(plan.calls.items()):
+        print(f"--   {endpoint}: {count} --")
+    print(f"-- Total API calls: {plan.total_calls} --")
+    print(
+        f"-- Projected time: {plan.projected_seconds(concurrency, rate_limit):.1f}s "
+        f"(concurrency: {concurrency}, average request latency: {plan.average_latency:.3f}s, "
+        f"rate limit: {f'{rate_limit}/s' if rate_limit else 'none'}) --"
+    )
+    if plan.conflicts:
+        print(f"-- {len(plan.conflicts)} conflicts detected with the target vault: --")
+        for conflict in plan.conflicts:
+            print(f"--   {conflict} --")
+    else:
+        print("-- No conflicts detected with the target vault --")
@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import Future
+
+
+class PolicyRegistry:
+    """Run-wide registry of the migrated policies, by target vault and source policy ID.
+
+    A policy referenced by several roles is fetched, transformed and created
+    by its first caller only, the others wait for it and reuse its target
+    policy. A failed migration is not kept, so it can be attempted again.
+    """
+
+    def __init__(self):
+        self._policies = {}
+        self._lock = threading.Lock()
+
+    def migrate(self, vault_id, policy_id, migrate):
+        """Return the target policy of policy_id, calling migrate() if it is not migrated yet."""
+        key = (vault_id, policy_id)
+        with self._lock:
+            future = self._policies.get(key)
+            registered = future is not None
+            if not registered:
+                future = self._policies[key] = Future()
+        if registered:
+            target_policy = future.result()
+            print(f"-- Policy {policy_id} already migrated in this run, Target POLICY_ID: {target_policy['ID']} --")
+            return target_policy
+        try:
+            future.set_result(migrate())
+        except BaseException as err:
+            with self._lock:
+                del self._policies[key]
+            future.set_exception(err)
+            raise
+        return future.result()
+
+    def clear(self):
+        with self._lock:
+            self._policies.clear()
+
+
+POLICY_REGISTRY = PolicyRegistry()
+
+
+def clear_policy_registry():
+    POLICY_REGISTRY.clear()
@@ -0,0 +1,98 @@
+import sys
+from functools import lru_cache
+
+
+RESOURCE_CACHE_SIZE = 65536
+
+RULE_PARAMS_KEYS = {
+    "COLUMN": "columnRuleParams",
+    "TABLE": "tableRuleParams",
+    "COLUMN_GROUP": "columnGroupRuleParams",
+}
+DROPPED_RULE_FIELDS = {"resources", "dlpFormat", "resourceType", "ruleExpression"}
+DROPPED_POLICY_FIELDS = {"ID", "namespace", "status", "BasicAudit", "members", "rules"}
+
+
+def segment_name(segment):
+    """Return the name of a kind:name segment of a resource path."""
+    return segment.partition(":")[2]
+
+
+@lru_cache(maxsize=RESOURCE_CACHE_SIZE)
+def column_name(resource):
+    """Return the table.column of a vault:v/table:t/column:c resource."""
+    _, _, path = resource.partition("/")
+    table, _, column = path.partition("/")
+    return sys.intern(f"{segment_name(table)}.{segment_name(column.partition('/')[0])}")
+
+
+@lru_cache(maxsize=RESOURCE_CACHE_SIZE)
+def table_name(resource):
+    return sys.intern(resource.partition("table:")[2])
+
+
+@lru_cache(maxsize=RESOURCE_CACHE_SIZE)
+def column_group_name(resource):
+    return sys.intern(resource.partition("columngroup:")[2])
+
+
+@lru_cache(maxsize=1024)
+def action_name(action):
+    """Return the target action of a source action, POLICY.read -> READ."""
+    return sys.intern(action.partition(".")[2].partition(".")[0].upper())
+
+
+def transform_rule(source_rule, target_vault_id, target_rule_id=None):
+    """Build the rule params of a source rule, updating target_rule_id if given.
+
+    The source rule is left untouched.
+    """
+    rule_param = {"name": source_rule["name"], "ruleExpression": source_rule["ruleExpression"]}
+    if target_rule_id:
+        rule_param = {"ID": target_rule_id, **rule_param}
+    rule_params = {key: value for key, value in source_rule.items() if key not in DROPPED_RULE_FIELDS}
+    if not target_rule_id:
+        rule_params.pop("ID", None)
+    actions = [action_name(action) for action in source_rule["actions"]]
+    rule_params["vaultID"] = target_vault_id
+    rule_params["actions"] = actions
+    rule_params["action"] = actions[0]
+
+    resources = source_rule["resources"]
+    resource_type = source_rule["resourceType"]
+    if resource_type == "COLUMN":
+        rule_params["columns"] = [column_name(resource) for resource in resources]
+    elif resource_type == "TABLE":
+        rule_params["tableName"] = table_name(resources[0])
+    elif resource_type == "COLUMN_GROUP":
+        rule_params["columnGroups"] = [column_group_name(resource) for resource in resources]
+    if resource_type in RULE_PARAMS_KEYS:
+        rule_param[RULE_PARAMS_KEYS[resource_type]] = rule_params
+    return rule_param
+
+
+def transform_rules(source_rules, target_vault_id, target_rule_ids=None):
+    """Build the rule params of every source rule, in their order.
+
+    target_rule_ids, when given, has the target rule updated by every source
+    rule (None for a new rule).
+    """
+    source_rules = list(source_rules)
+    target_rule_ids = target_rule_ids or [None] * len(source_rules)
+    return [
+        transform_rule(source_rule, target_vault_id, target_rule_id)
+        for source_rule, target_rule_id in zip(source_rules, target_rule_ids)
+    ]
+
+
+def transform_policy(source_policy, target_vault_id):
+    """Build the create payload of a source policy in the target vault."""
+    source_resource = source_policy["policy"]
+    transformed_resource = {
+        key: value for key, value in source_resource.items() if key not in DROPPED_POLICY_FIELDS
+    }
+    transformed_resource["resource"] = {"ID": target_vault_id, "type": "VAULT"}
+    transformed_resource["ruleParams"] = transform_rules(source_resource["rules"], target_vault_id)
+    transformed_resource["activated"] = True
+    return transformed_resource
+
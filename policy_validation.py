@@ -0,0 +1,87 @@
+import os
+import threading
+from http_client import get_session
+
+
+VALIDATE_POLICIES = (os.getenv("VALIDATE_POLICIES") or "").lower() == "true"
+TARGET_ACCOUNT_ID = os.getenv("TARGET_ACCOUNT_ID")
+TARGET_ACCOUNT_AUTH = os.getenv("TARGET_ACCOUNT_AUTH")
+TARGET_ENV_URL = os.getenv("TARGET_ENV_URL")
+
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
+
+_schemas = {}
+# vault ID -> lock held while that vault's schema is fetched
+_schema_locks = {}
+_schemas_lock = threading.Lock()
+
+
+def index_schema(schemas):
+    """Return the table -> columns index of a vault schema, child tables included."""
+    index = {}
+    for table in schemas:
+        index[table["name"]] = {field["name"] for field in table.get("fields") or []}
+        index.update(index_schema(table.get("childrenSchemas") or []))
+    return index
+
+
+def get_target_vault(vault_id):
+    response = TARGET_SESSION.get(f"{TARGET_ENV_URL}/v1/vaults/{vault_id}")
+    response.raise_for_status()
+    return response.json()
+
+
+def get_schema_index(vault_id):
+    """Return the schema index of a target vault, fetched once per run."""
+    with _schemas_lock:
+        vault_lock = _schema_locks.setdefault(vault_id, threading.Lock())
+    # only lookups of the same vault wait for its fetch
+    with vault_lock:
+        if vault_id not in _schemas:
+            print(f"-- Fetching the schema of the target vault {vault_id} --")
+            _schemas[vault_id] = index_schema(get_target_vault(vault_id)["vault"]["schemas"])
+        return _schemas[vault_id]
+
+
+def clear_schemas():
+    with _schemas_lock:
+        _schemas.clear()
+        _schema_locks.clear()
+
+
+def rule_errors(policy_name, rule_param, index):
+    """Return the tables and columns of a transformed rule missing from the schema index."""
+    errors = []
+    if "columnRuleParams" in rule_param:
+        for column in rule_param["columnRuleParams"]["columns"]:
+            table, _, column_name = column.partition(".")
+            if table not in index:
+                errors.append(f"policy {policy_name} rule {rule_param['name']} references the missing table {table}")
+            elif column_name not in index[table]:
+                errors.append(f"policy {policy_name} rule {rule_param['name']} references the missing column {column}")
+    elif "tableRuleParams" in rule_param:
+        table = rule_param["tableRuleParams"]["tableName"]
+        if table not in index:
+            errors.append(f"policy {policy_name} rule {rule_param['name']} references the missing table {table}")
+    # column groups are not part of the table -> columns index, they are checked by the API
+    return errors
+
+
+def validate_policies(policy_payloads, vault_id):
+    """Check the rules of transformed policies against the schema of the target vault.
+
+    Every problem is printed and a ValueError is raised if there is any, so
+    the migration stops before its first write.
+    """
+    index = get_schema_index(vault_id)
+    errors = [
+        error
+        for policy_payload in policy_payloads
+        for rule_param in policy_payload["ruleParams"]
+        for error in rule_errors(policy_payload.get("name"), rule_param, index)
+    ]
+    for error in errors:
+        print(f"-- {error} --")
+    if errors:
+        raise ValueError(f"-- {len(errors)} policy rules do not match the schema of the target vault {vault_id} --")
+    print(f"-- Policy rules validated against the schema of the target vault {vault_id} --")
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+THROTTLE_STATUS_CODES = (429, 503)
+# a 503 may come after the request was processed, only these are sent again
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+RATE_LIMIT_INITIAL_CONCURRENCY = int(os.getenv("RATE_LIMIT_INITIAL_CONCURRENCY") or "4")
+RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY") or "32")
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES") or "5")
+RATE_LIMIT_BACKOFF = float(os.getenv("RATE_LIMIT_BACKOFF") or "1")
+
+
+def parse_retry_after(value, default):
+    """Return the number of seconds to wait from a Retry-After header."""
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class AdaptiveLimiter:
+    """AIMD limit on the number of in-flight requests for one account.
+
+    Every successful response raises the limit by roughly one slot per
+    window, a 429/503 halves it and blocks new requests until Retry-After
+    has elapsed.
+    """
+
+    def __init__(
+        self,
+        initial_limit=RATE_LIMIT_INITIAL_CONCURRENCY,
+        max_limit=RATE_LIMIT_MAX_CONCURRENCY,
+        min_limit=1,
+        max_retries=RATE_LIMIT_MAX_RETRIES,
+        backoff=RATE_LIMIT_BACKOFF,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot and for any Retry-After pause to elapse."""
+        with self._condition:
+            while True:
+                pause = self.blocked_until - time.monotonic()
+                if pause > 0:
+                    self._condition.wait(pause)
+                elif self.in_flight >= int(self.limit):
+                    self._condition.wait()
+                else:
+                    self.in_flight += 1
+                    return
+
+    def release(self, throttled=False, retry_after=None, succeeded=True):
+        """Free a slot and adjust the limit from the request outcome."""
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.limit = max(float(self.min_limit), self.limit / 2)
+                if retry_after:
+                    self.blocked_until = max(
+                        self.blocked_until, time.monotonic() + retry_after
+                    )
+            elif succeeded:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def call(self, send, *args, idempotent=True, **kwargs):
+        """Send a request, retrying throttled responses after backing off.
+
+        A 429 is always retried, a 503 only when the request is idempotent.
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            throttled, retry_after, succeeded = False, None, False
+            try:
+                response = send(*args, **kwargs)
+                throttled = response.status_code in THROTTLE_STATUS_CODES
+                if throttled:
+                    retry_after = parse_retry_after(
+                        response.headers.get("Retry-After"),
+                        self.backoff * 2 ** attempt,
+                    )
+                succeeded = True
+            finally:
+                self.release(throttled, retry_after, succeeded)
+            if not throttled or attempt >= self.max_retries:
+                return response
+            if response.status_code == 503 and not idempotent:
+                # left to the caller, see retry.create_idempotently
+                return response
+            attempt += 1
+            print(f"-- Throttled with {response.status_code}, retrying in {retry_after:.1f}s --")
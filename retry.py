@@ -0,0 +1,48 @@
+import os
+import random
+import time
+import requests
+
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS") or "4")
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF") or "1")
+RETRY_MAX_BACKOFF = float(os.getenv("RETRY_MAX_BACKOFF") or "30")
+
+
+def is_transient(err):
+    """Return True for errors worth retrying: 5xx, connection errors and timeouts."""
+    if isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(err, requests.exceptions.HTTPError):
+        status_code = getattr(err.response, "status_code", None)
+        return isinstance(status_code, int) and status_code >= 500
+    return False
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given retry attempt."""
+    return random.uniform(0, min(RETRY_MAX_BACKOFF, RETRY_BACKOFF * 2 ** attempt))
+
+
+def create_idempotently(create, find_existing, description):
+    """Run a create call, retrying transient failures without creating duplicates.
+
+    Before every retry find_existing is called to check whether the failed
+    attempt actually landed in the target; if it did, its result is returned
+    instead of posting again.
+    """
+    attempt = 0
+    while True:
+        try:
+            return create()
+        except Exception as err:
+            attempt += 1
+            if not is_transient(err) or attempt >= RETRY_MAX_ATTEMPTS:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"-- Creating {description} failed with a transient error, retrying in {delay:.1f}s: {err} --")
+        time.sleep(delay)
+        existing = find_existing()
+        if existing:
+            print(f"-- {description} was created by a previous attempt, skipping creation --")
+            return existing
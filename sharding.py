@@ -0,0 +1,190 @@
+import atexit
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrency import map_concurrently
+
+
+SHARD = os.getenv("SHARD")
+SHARD_RESULTS_DIR = os.getenv("SHARD_RESULTS_DIR") or "shard_results"
+SHARD_RESULTS_MERGED = os.getenv("SHARD_RESULTS_MERGED")
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY") or "1")
+
+SHARD_FILE_PATTERN = re.compile(r"shard-(\d+)-of-(\d+)\.jsonl$")
+
+_results = {}
+_results_lock = threading.Lock()
+
+
+def parse_shard(shard):
+    """Parse a shard given as "i/n" into (i, n), shards are numbered from 1."""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", shard or "")
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise ValueError(f"-- Invalid shard {shard}, expected i/n with 1 <= i <= n --")
+    return int(match.group(1)), int(match.group(2))
+
+
+def get_shard():
+    """Return the (index, count) of the shard of the run, or None when SHARD is not set."""
+    return parse_shard(SHARD) if SHARD else None
+
+
+def shard_of(key, count):
+    """Return the shard (from 1) of a key, the same on every runner."""
+    digest = hashlib.sha256(str(key).encode("utf-8")).hexdigest()
+    return int(digest[:16], 16) % count + 1
+
+
+def group_by_dependencies(ids, dependencies):
+    """Return the group key of every ID, IDs sharing a dependency are in the same group.
+
+    dependencies(id) returns the hashable keys of the resources the ID needs
+    (the policies of a role for example), groups are closed transitively.
+    """
+    parents = {}
+
+    def find(node):
+        parents.setdefault(node, node)
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    for resource_id, resource_dependencies in zip(ids, map_concurrently(dependencies, ids, MAX_CONCURRENCY)):
+        root = find(("id", resource_id))
+        for dependency in resource_dependencies:
+            parents[find(("dependency", dependency))] = root
+            root = find(root)
+    members = {}
+    for resource_id in ids:
+        members.setdefault(find(("id", resource_id)), []).append(resource_id)
+    # the smallest member names the group, whatever the order of the IDs
+    return {
+        resource_id: min(group_ids, key=str)
+        for group_ids in members.values()
+        for resource_id in group_ids
+    }
+
+
+def select_shard(items, key=None, dependencies=None, shard=None):
+    """Return the items of the shard of the run, in their order.
+
+    key(item) is the ID of an item (the item itself by default). Without a
+    shard every item is returned unchanged.
+    """
+    shard = shard or get_shard()
+    if shard is None:
+        return items
+    index, count = shard
+    items = list(items)
+    ids = [key(item) if key else item for item in items]
+    group_keys = group_by_dependencies(ids, dependencies) if dependencies else {resource_id: resource_id for resource_id in ids}
+    selected = [item for item, resource_id in zip(items, ids) if shard_of(group_keys[resource_id], count) == index]
+    print(f"-- Shard {index}/{count}: {len(selected)} out of {len(items)} resources --")
+    return selected
+
+
+class ShardResults:
+    """JSON lines file of the resources migrated by one shard."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a")
+
+    def record(self, kind, source_id, target_id, vault_id=None):
+        entry = {"kind": kind, "sourceID": source_id, "targetID": target_id, "vaultID": vault_id}
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def shard_results_path(shard, results_dir=None):
+    index, count = shard
+    return os.path.join(results_dir or SHARD_RESULTS_DIR, f"shard-{index}-of-{count}.jsonl")
+
+
+def get_shard_results():
+    """Return the results file of the shard of the run, or None when SHARD is not set."""
+    shard = get_shard()
+    if shard is None:
+        return None
+    path = shard_results_path(shard)
+    with _results_lock:
+        results = _results.get(path)
+        if results is None:
+            results = ShardResults(path)
+            _results[path] = results
+            atexit.register(results.close)
+        return results
+
+
+def close_shard_results():
+    with _results_lock:
+        for results in _results.values():
+            results.close()
+        _results.clear()
+
+
+def merge_shard_results(paths, output):
+    """Merge shard results files into output and return the missing shards.
+
+    The merged file has one line per resource, in the format of
+    MIGRATION_JOURNAL, so a later run can resume from every shard.
+    """
+    entries = {}
+    shards = set()
+    counts = set()
+    for path in sorted(paths):
+        match = SHARD_FILE_PATTERN.search(os.path.basename(path))
+        if match:
+            shards.add(int(match.group(1)))
+            counts.add(int(match.group(2)))
+        with open(path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last line of a shard interrupted mid-write
+                    continue
+                entries[(entry["kind"], entry["sourceID"], entry.get("vaultID"))] = entry
+    if len(counts) > 1:
+        raise ValueError(f"-- Shard results of different shard counts {sorted(counts)} can not be merged --")
+    temp_path = f"{output}.tmp"
+    with open(temp_path, "w") as file:
+        for entry in entries.values():
+            file.write(json.dumps(entry) + "\n")
+    os.replace(temp_path, output)
+    count = counts.pop() if counts else 0
+    return [index for index in range(1, count + 1) if index not in shards]
+
+
+def main():
+    """Merges the shard results of SHARD_RESULTS_DIR"""
+    try:
+        paths = glob.glob(os.path.join(SHARD_RESULTS_DIR, "shard-*-of-*.jsonl"))
+        if not paths:
+            print(f"-- No shard results found in {SHARD_RESULTS_DIR} --")
+            exit(1)
+        output = SHARD_RESULTS_MERGED or os.path.join(SHARD_RESULTS_DIR, "merged.jsonl")
+        missing_shards = merge_shard_results(paths, output)
+        print(f"-- Results of {len(paths)} shards merged into {output} --")
+        if missing_shards:
+            print(f"-- Results of the shards {missing_shards} are missing --")
+            exit(1)
+    except Exception as err:
+        print(f"-- sharding other error: {err} --")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timezone
+import requests
+import migrate_connections
+import migrate_pipelines
+import migrate_policies
+import migrate_roles
+import migrate_service_accounts
+import migrate_vault_roles_and_policies
+import migrate_vault_schema
+from cache import SNAPSHOT_VERSION, print_cache_stats
+from concurrency import map_concurrently
+from http_client import get_session, paginate
+
+
+SOURCE_VAULT_ID = os.getenv("SOURCE_VAULT_ID")
+SOURCE_ACCOUNT_ID = os.getenv("SOURCE_ACCOUNT_ID")
+SOURCE_ACCOUNT_AUTH = os.getenv("SOURCE_ACCOUNT_AUTH")
+SOURCE_ENV_URL = os.getenv("SOURCE_ENV_URL")
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE") or "source_snapshot.json.gz"
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY") or "1")
+
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+
+
+def list_service_accounts():
+    """Yield all service accounts of the source account, page by page."""
+    return paginate(SOURCE_SESSION, f"{SOURCE_ENV_URL}/v1/serviceAccounts", "serviceAccounts")
+
+
+class SnapshotCrawler:
+    """Fetch source objects in parallel and keep them by endpoint and arguments."""
+
+    def __init__(self, max_workers=MAX_CONCURRENCY):
+        self.max_workers = max_workers
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, endpoint, fetch, *args):
+        value = fetch(*args)
+        with self._lock:
+            self.entries[(endpoint,) + args] = value
+        return value
+
+    def fetch_all(self, endpoint, fetch, ids):
+        """Fetch every ID and return the objects in the order of the IDs."""
+        return map_concurrently(lambda resource_id: self.fetch(endpoint, fetch, resource_id), ids, self.max_workers)
+
+    def listing(self, endpoint, list_items, *args):
+        return self.fetch(endpoint, lambda *list_args: list(list_items(*list_args)), *args)
+
+
+def unique(ids):
+    return list(dict.fromkeys(ids))
+
+
+def crawl_vault(crawler, vault_id):
+    crawler.fetch("vaults", migrate_vault_schema.get_vault_details, vault_id)
+
+
+def crawl_governance(crawler, vault_id):
+    """Snapshot the custom roles, the service accounts and their roles, and the policies (listed and by ID)."""
+    custom_roles = crawler.listing("roles/list", migrate_vault_roles_and_policies.list_all_vault_custom_roles, vault_id)
+    # listed for PREFETCH_POLICIES, the roles are indexed from it
+    crawler.listing("policies/list", migrate_roles.list_vault_policies, vault_id)
+    service_account_ids = [service_account["ID"] for service_account in list_service_accounts()]
+    crawler.fetch_all("serviceAccounts", migrate_service_accounts.get_service_account, service_account_ids)
+    service_accounts_roles = crawler.fetch_all(
+        "members/roles", migrate_service_accounts.list_service_account_roles, service_account_ids
+    )
+    crawl_roles(
+        crawler,
+        [role["ID"] for role in custom_roles]
+        + [
+            service_account_role["role"]["ID"]
+            for service_account_roles in service_accounts_roles
+            for service_account_role in service_account_roles["roleToResource"]
+        ],
+    )
+
+
+def crawl_roles(crawler, role_ids):
+    """Snapshot the given roles and their policies."""
+    role_ids = unique(role_ids)
+    crawler.fetch_all("roles", migrate_roles.get_role, role_ids)
+    roles_policies = crawler.fetch_all("roles/policies", migrate_roles.get_role_policies, role_ids)
+    crawl_policies(
+        crawler, [policy["ID"] for role_policies in roles_policies for policy in role_policies["policies"]]
+    )
+
+
+def crawl_policies(crawler, policy_ids):
+    crawler.fetch_all("policies", migrate_policies.get_policy, unique(policy_ids))
+
+
+def crawl_connections(crawler, vault_id):
+    connections = crawler.listing("connections/list", migrate_connections.list_connections, vault_id)
+    crawler.fetch_all("connections", migrate_connections.get_connection, [connection["ID"] for connection in connections])
+
+
+def crawl_pipelines(crawler, vault_id):
+    pipelines = crawler.listing("pipelines/list", migrate_pipelines.list_pipelines, vault_id)
+    crawler.fetch_all("pipelines", migrate_pipelines.get_pipeline, [pipeline["ID"] for pipeline in pipelines])
+
+
+def crawl_source_vault(vault_id, max_workers=MAX_CONCURRENCY):
+    """Return every source object the migrate scripts read for a vault."""
+    crawler = SnapshotCrawler(max_workers)
+    # the four parts of the vault are independent, crawl them side by side
+    map_concurrently(
+        lambda crawl: crawl(crawler, vault_id),
+        [crawl_vault, crawl_governance, crawl_connections, crawl_pipelines],
+        max_workers,
+    )
+    return crawler.entries
+
+
+def write_snapshot(path, vault_id, entries):
+    """Write the snapshot bundle, replacing any previous one only once complete."""
+    bundle = {
+        "version": SNAPSHOT_VERSION,
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "sourceEnvURL": SOURCE_ENV_URL,
+        "sourceVaultID": vault_id,
+        "entries": [
+            {"endpoint": key[0], "args": list(key[1:]), "value": value}
+            for key, value in sorted(entries.items())
+        ],
+    }
+    temp_path = f"{path}.tmp"
+    with gzip.open(temp_path, "wt", encoding="utf-8") as file:
+        json.dump(bundle, file)
+    os.replace(temp_path, path)
+
+
+def main():
+    """Snapshots the source vault into SNAPSHOT_FILE"""
+    try:
+        if not SOURCE_VAULT_ID:
+            print("-- Please provide the source vault ID --")
+            return
+        print(f"-- Taking a snapshot of the vault {SOURCE_VAULT_ID} --")
+        entries = crawl_source_vault(SOURCE_VAULT_ID)
+        write_snapshot(SNAPSHOT_FILE, SOURCE_VAULT_ID, entries)
+        print(f"-- Snapshot of {len(entries)} objects written to {SNAPSHOT_FILE} --")
+    except requests.exceptions.HTTPError as http_err:
+        print(f"-- snapshot HTTP error: {http_err.response.content.decode()} --")
+        exit(1)
+    except Exception as err:
+        print(f"-- snapshot other error: {err} --")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
+    print_cache_stats()
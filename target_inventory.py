@@ -0,0 +1,92 @@
+import threading
+from http_client import paginate
+
+
+# kind -> (list endpoints, response key, name of a listed item)
+INVENTORY_LISTINGS = {
+    "roles": (
+        ["/v1/roles?resource.type=VAULT&resource.ID={vault_id}"],
+        "roles",
+        lambda role: role["definition"]["name"],
+    ),
+    "policies": (
+        ["/v1/policies?resource.type=VAULT&resource.ID={vault_id}"],
+        "policies",
+        lambda policy: policy["name"],
+    ),
+    "serviceAccounts": (
+        ["/v1/serviceAccounts"],
+        "serviceAccounts",
+        lambda service_account: service_account["name"],
+    ),
+    "connections": (
+        ["/v1/gateway/outboundRoutes?vaultID={vault_id}", "/v1/gateway/inboundRoutes?vaultID={vault_id}"],
+        "ConnectionMappings",
+        lambda connection: connection["name"],
+    ),
+    "pipelines": (
+        ["/v1/pipelines?vaultID={vault_id}"],
+        "pipelines",
+        lambda pipeline: pipeline["name"],
+    ),
+}
+
+_inventories = {}
+_inventories_lock = threading.Lock()
+
+
+class TargetInventory:
+    """Name -> ID index of the resources of a target vault.
+
+    Every kind of resource is listed once, on its first lookup, so existence
+    checks are answered locally instead of with a search request each.
+    """
+
+    def __init__(self, session, env_url, vault_id):
+        self.session = session
+        self.env_url = env_url
+        self.vault_id = vault_id
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def find(self, kind, name):
+        """Return the ID of the target resource of that kind and name, if any."""
+        return self._load(kind).get(name)
+
+    def add(self, kind, name, resource_id):
+        """Record a resource created during the run."""
+        with self._lock:
+            if kind in self._index:
+                self._index[kind][name] = resource_id
+
+    def _load(self, kind):
+        with self._lock:
+            if kind not in self._index:
+                self._index[kind] = self._list(kind)
+            return self._index[kind]
+
+    def _list(self, kind):
+        endpoints, key, name_of = INVENTORY_LISTINGS[kind]
+        print(f"-- Listing {kind} of the target vault --")
+        index = {}
+        for endpoint in endpoints:
+            url = self.env_url + endpoint.format(vault_id=self.vault_id)
+            for item in paginate(self.session, url, key):
+                index[name_of(item)] = item["ID"]
+        return index
+
+
+def get_inventory(session, env_url, vault_id):
+    """Return the inventory of a target vault, shared for the whole run."""
+    with _inventories_lock:
+        inventory = _inventories.get((env_url, vault_id))
+        if inventory is None:
+            inventory = TargetInventory(session, env_url, vault_id)
+            _inventories[(env_url, vault_id)] = inventory
+        return inventory
+
+
+def clear_inventories():
+    """Forget every inventory so the next lookups list the target again."""
+    with _inventories_lock:
+        _inventories.clear()
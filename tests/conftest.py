@@ -2,6 +2,8 @@ import os
 import sys
 from pathlib import Path
 
+import pytest
+
 
 # Ensure project root is importable and use it as CWD for tests
 ROOT = Path(__file__).resolve().parent.parent
@@ -12,3 +14,52 @@ if str(ROOT) not in sys.path:
 def pytest_sessionstart(session):
     os.chdir(ROOT)
 
+
+@pytest.fixture(autouse=True)
+def clear_source_cache():
+    # source fetches and target listings are kept per run, every test starts afresh
+    from cache import SOURCE_CACHE, clear_snapshots
+    from policy_registry import clear_policy_registry
+    from policy_validation import clear_schemas
+    from target_inventory import clear_inventories
+
+    SOURCE_CACHE.clear()
+    clear_inventories()
+    yield
+    SOURCE_CACHE.clear()
+    clear_snapshots()
+    clear_inventories()
+    clear_schemas()
+    clear_policy_registry()
+
+
+@pytest.fixture
+def journal_path(tmp_path, monkeypatch):
+    # journal the migrated resources of the test in a temporary file
+    import journal
+
+    path = str(tmp_path / "journal.jsonl")
+    monkeypatch.setattr(journal, "MIGRATION_JOURNAL", path)
+    yield path
+    journal.close_journals()
+
+
+@pytest.fixture
+def id_mapping_store(tmp_path, monkeypatch):
+    # store the ID mappings of the test in a temporary database
+    import id_mapping
+
+    monkeypatch.setattr(id_mapping, "ID_MAPPING_STORE", str(tmp_path / "ids.sqlite"))
+    yield id_mapping.get_store()
+    id_mapping.close_stores()
+
+
+@pytest.fixture(autouse=True)
+def shard_results_dir(tmp_path, monkeypatch):
+    # write the shard results of every test in a temporary directory, never in the checkout
+    import sharding
+
+    path = str(tmp_path / "shards")
+    monkeypatch.setattr(sharding, "SHARD_RESULTS_DIR", path)
+    yield path
+    sharding.close_shard_results()
@@ -0,0 +1,52 @@
+import threading
+
+from assignments import AssignmentBatcher
+
+
+def test_batcher_coalesces_members_per_resource():
+    sent = []
+    batcher = AssignmentBatcher(lambda resource_id, members: sent.append((resource_id, members)))
+    batcher.add("p1", ["r1"])
+    batcher.add("p2", ["r1"])
+    batcher.add("p1", ["r2", "r1"])
+    assert batcher.batches() == [("p1", ["r1", "r2"]), ("p2", ["r1"])]
+    assert batcher.flush() == 2
+    assert sent == [("p1", ["r1", "r2"]), ("p2", ["r1"])]
+    assert batcher.flush() == 0
+
+
+def test_batcher_splits_large_batches_and_dedupes_by_key():
+    sent = []
+    batcher = AssignmentBatcher(
+        lambda resource_id, members: sent.append((resource_id, [m["ID"] for m in members])),
+        max_batch_size=2,
+        member_key=lambda member: member["ID"],
+    )
+    batcher.add("r1", [{"ID": "a"}, {"ID": "b"}, {"ID": "a"}, {"ID": "c"}])
+    batcher.add("r2", [])
+    assert batcher.flush() == 2
+    assert sent == [("r1", ["a", "b"]), ("r1", ["c"])]
+
+
+def test_batcher_flushes_in_parallel():
+    threads = set()
+    lock = threading.Lock()
+
+    def send(resource_id, members):
+        with lock:
+            threads.add(threading.get_ident())
+
+    batcher = AssignmentBatcher(send, max_workers=4)
+    for index in range(8):
+        batcher.add(f"p{index}", ["r"])
+    assert batcher.flush() == 8
+    assert threads
+
+
+def test_batcher_dedupes_member_objects_by_default():
+    sent = []
+    batcher = AssignmentBatcher(lambda resource_id, members: sent.append(members))
+    member = {"type": "SERVICE_ACCOUNT", "ID": "sa"}
+    batcher.add("r1", [member, dict(member), {"type": "SERVICE_ACCOUNT", "ID": "sb"}])
+    batcher.flush()
+    assert sent == [[member, {"type": "SERVICE_ACCOUNT", "ID": "sb"}]]
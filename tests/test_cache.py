@@ -0,0 +1,81 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import cache
+import migrate_roles as mr
+
+
+def test_get_or_load_counts_hits_and_misses():
+    lru = cache.LRUCache(max_size=2)
+    load = MagicMock(side_effect=["a", "b", "c", "a2"])
+    assert lru.get_or_load("a", load) == "a"
+    assert lru.get_or_load("a", load) == "a"
+    lru.get_or_load("b", load)
+    lru.get_or_load("c", load)  # evicts "a", the least recently used
+    assert len(lru) == 2
+    assert lru.get_or_load("a", load) == "a2"
+    assert (lru.hits, lru.misses) == (1, 4)
+    lru.clear()
+    assert len(lru) == 0 and (lru.hits, lru.misses) == (0, 0)
+
+
+def test_entries_expire_after_ttl():
+    now = [0]
+    lru = cache.LRUCache(ttl=10, clock=lambda: now[0])
+    load = MagicMock(side_effect=[1, 2])
+    assert lru.get_or_load("k", load) == 1
+    now[0] = 5
+    assert lru.get_or_load("k", load) == 1
+    now[0] = 20
+    assert lru.get_or_load("k", load) == 2
+
+
+def test_failed_loads_are_not_cached():
+    lru = cache.LRUCache()
+    with pytest.raises(ValueError):
+        lru.get_or_load("k", MagicMock(side_effect=ValueError("boom")))
+    assert lru.get_or_load("k", lambda: 1) == 1
+
+
+def test_concurrent_misses_load_once():
+    lru = cache.LRUCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "v"
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(lru.get_or_load("k", load)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(lru.get_or_load("k", load)))
+    second.start()
+    release.set()
+    first.join()
+    second.join()
+    assert results == ["v", "v"] and len(calls) == 1
+    assert (lru.hits, lru.misses) == (1, 1)
+
+
+@patch("requests.Session.get")
+def test_source_helpers_fetch_each_object_once(mock_get, monkeypatch, capsys):
+    monkeypatch.setattr(mr, "SOURCE_ENV_URL", "https://s")
+    response = MagicMock()
+    response.json.return_value = {"role": {"definition": {"name": "R", "permissions": []}}}
+    mock_get.return_value = response
+
+    first = mr.get_role("r1")
+    first["role"]["definition"]["name"] = "changed"
+    assert mr.get_role("r1")["role"]["definition"]["name"] == "R"
+    mr.get_role("r2")
+    assert mock_get.call_count == 2
+
+    cache.print_cache_stats()
+    assert "1 hits, 2 misses" in capsys.readouterr().out
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from concurrency import map_concurrently, prefetched
+
+
+def test_map_concurrently_serial_when_single_worker():
+    seen = []
+    out = map_concurrently(lambda x: seen.append(threading.get_ident()) or x * 2, [1, 2, 3])
+    assert out == [2, 4, 6]
+    assert set(seen) == {threading.get_ident()}
+
+
+def test_map_concurrently_preserves_input_order():
+    def slow(x):
+        time.sleep(0.01 * (5 - x))
+        return x
+
+    assert map_concurrently(slow, range(5), max_workers=5) == [0, 1, 2, 3, 4]
+
+
+def test_map_concurrently_reraises_first_failure():
+    def fail_on_two(x):
+        if x == 2:
+            raise ValueError("boom")
+        return x
+
+    with pytest.raises(ValueError):
+        map_concurrently(fail_on_two, [1, 2, 3, 4], max_workers=2)
+
+
+def test_prefetched_without_depth_is_the_items():
+    assert list(prefetched(iter([1, 2]), lambda item: pytest.fail("not prefetched"))) == [1, 2]
+
+
+def test_prefetched_runs_ahead_up_to_depth():
+    prefetched_items = []
+    consumed = []
+    items = prefetched(range(10), prefetched_items.append, depth=2)
+    for item in items:
+        consumed.append(item)
+        if item == 0:
+            deadline = time.monotonic() + 5
+            while len(prefetched_items) < 4 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.05)
+            # two items wait in the queue, one more is prefetched and waits for room
+            assert prefetched_items == [0, 1, 2, 3]
+    assert consumed == list(range(10))
+    assert prefetched_items == list(range(10))
+
+
+def test_prefetched_ignores_prefetch_failures_and_raises_iteration_failures():
+    def prefetch(item):
+        raise ValueError("prefetch")
+
+    def items():
+        yield 1
+        raise KeyError("listing")
+
+    consumed = []
+    with pytest.raises(KeyError):
+        for item in prefetched(items(), prefetch, depth=2):
+            consumed.append(item)
+    assert consumed == [1]
+
+
+def test_closing_prefetched_stops_the_producer():
+    prefetched_items = []
+    items = prefetched(range(1000), prefetched_items.append, depth=1)
+    assert next(items) == 0
+    # let the producer fill the queue and wait for room
+    time.sleep(0.3)
+    items.close()
+    time.sleep(0.3)
+    count = len(prefetched_items)
+    time.sleep(0.2)
+    assert count == len(prefetched_items) < 1000
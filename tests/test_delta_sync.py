@@ -0,0 +1,32 @@
+import pytest
+
+import delta_sync
+import journal
+
+
+def test_content_hash_is_canonical():
+    assert delta_sync.content_hash({"a": 1, "b": [1, {"c": 2, "d": 3}]}) == delta_sync.content_hash(
+        {"b": [1, {"d": 3, "c": 2}], "a": 1}
+    )
+    assert delta_sync.content_hash({"a": 1}) != delta_sync.content_hash({"a": 2})
+
+
+def test_diff_tracks_the_last_synced_version(id_mapping_store):
+    delta = delta_sync.diff("policies", "p1", {"name": "P"}, "tv")
+    assert delta == delta_sync.Delta(delta_sync.NEW, None, delta_sync.content_hash({"name": "P"}))
+
+    journal.record("policies", "p1", "t1", "tv")
+    # migrated before delta sync was enabled: no hash to compare with
+    assert delta_sync.diff("policies", "p1", {"name": "P"}, "tv").status == delta_sync.CHANGED
+    delta_sync.mark_synced("policies", "p1", "tv", delta)
+    assert delta_sync.diff("policies", "p1", {"name": "P"}, "tv") == delta_sync.Delta(
+        delta_sync.UNCHANGED, "t1", delta.content_hash
+    )
+    assert delta_sync.diff("policies", "p1", {"name": "P2"}, "tv").status == delta_sync.CHANGED
+    # every target vault is synced on its own
+    assert delta_sync.diff("policies", "p1", {"name": "P"}, "other").status == delta_sync.NEW
+
+
+def test_diff_requires_the_id_mapping_store():
+    with pytest.raises(ValueError, match="ID_MAPPING_STORE is required"):
+        delta_sync.diff("policies", "p1", {}, "tv")
@@ -0,0 +1,40 @@
+import pytest
+
+from dependency_graph import DependencyGraph
+
+
+def test_waves_follow_dependencies():
+    graph = DependencyGraph()
+    graph.add("sa", lambda results: None, ["role"])
+    graph.add("role", lambda results: None, ["p1", "p2"])
+    graph.add("p1", lambda results: None)
+    graph.add("p2", lambda results: None)
+    assert graph.waves() == [["p1", "p2"], ["role"], ["sa"]]
+    assert len(graph) == 4 and "role" in graph
+
+
+def test_shared_nodes_are_added_once():
+    graph = DependencyGraph()
+    graph.add("p", lambda results: "first")
+    graph.add("p", lambda results: "second")
+    assert graph.run() == {"p": "first"}
+
+
+def test_run_passes_dependency_results():
+    graph = DependencyGraph()
+    graph.add("role", lambda results: results["p1"] + results["p2"], ["p1", "p2"])
+    graph.add("p1", lambda results: 1)
+    graph.add("p2", lambda results: 2)
+    assert graph.run(max_workers=2) == {"p1": 1, "p2": 2, "role": 3}
+
+
+def test_unknown_dependency_and_cycle_raise():
+    graph = DependencyGraph()
+    graph.add("role", lambda results: None, ["missing"])
+    with pytest.raises(ValueError):
+        graph.waves()
+    graph = DependencyGraph()
+    graph.add("a", lambda results: None, ["b"])
+    graph.add("b", lambda results: None, ["a"])
+    with pytest.raises(ValueError):
+        graph.run()
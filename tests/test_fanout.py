@@ -0,0 +1,203 @@
+import gzip
+import json
+
+import pytest
+import requests
+
+import fanout
+import migrate_policies as mpol
+import migrate_roles as mr
+import migrate_vault_roles_and_policies as mvrp
+
+
+def test_get_targets(monkeypatch):
+    monkeypatch.setattr(fanout, "TARGET_VAULT_IDS", "['v1','v2']")
+    assert fanout.get_targets() == [("v1", None, None), ("v2", None, None)]
+    monkeypatch.setattr(fanout, "TARGET_ACCOUNT_IDS", "['a1','a2']")
+    monkeypatch.setattr(fanout, "TARGET_ACCOUNT_AUTHS", "['k1','k2']")
+    assert fanout.get_targets() == [("v1", "a1", "k1"), ("v2", "a2", "k2")]
+    monkeypatch.setattr(fanout, "TARGET_ACCOUNT_AUTHS", "k1")
+    with pytest.raises(ValueError, match="one entry per target vault"):
+        fanout.get_targets()
+
+
+def test_crawl_source_per_script(monkeypatch):
+    monkeypatch.setattr(mvrp, "list_all_vault_custom_roles", lambda vault_id: iter([{"ID": "r1"}]))
+    monkeypatch.setattr(mr, "get_role", lambda role_id: {"role": {"ID": role_id}})
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": "p1"}]})
+    monkeypatch.setattr(mpol, "get_policy", lambda policy_id: {"policy": {"ID": policy_id}})
+    monkeypatch.setattr(fanout, "SOURCE_VAULT_ID", "sv")
+    monkeypatch.setattr(fanout, "POLICY_IDS", "['p2']")
+    monkeypatch.setattr(fanout, "ROLE_IDS", "['r2']")
+
+    assert sorted(fanout.crawl_source("migrate_policies")) == [("policies", "p2")]
+    assert sorted(fanout.crawl_source("migrate_roles")) == [
+        ("policies", "p1"),
+        ("roles", "r2"),
+        ("roles/policies", "r2"),
+    ]
+    assert sorted(fanout.crawl_source("migrate_vault_roles_and_policies")) == [
+        ("policies", "p1"),
+        ("roles", "r1"),
+        ("roles/list", "sv"),
+        ("roles/policies", "r1"),
+    ]
+    # the policy listing of the source vault is snapshotted for PREFETCH_POLICIES
+    monkeypatch.setattr(mr, "PREFETCH_POLICIES", True)
+    monkeypatch.setattr(mr, "list_vault_policies", lambda vault_id: iter([{"ID": "p1"}]))
+    assert ("policies/list", "sv") in fanout.crawl_source("migrate_roles")
+    assert ("policies/list", "sv") not in fanout.crawl_source("migrate_policies")
+
+
+class FakeProcess:
+    def __init__(self, lines, returncode=0):
+        self.stdout = iter(lines)
+        self.returncode = returncode
+
+    def wait(self):
+        return self.returncode
+
+
+def fake_popen(calls, lines, returncode=0):
+    def popen(args, env, cwd, stdout, stderr, text):
+        calls.append((args, env))
+        return FakeProcess(lines, returncode)
+
+    return popen
+
+
+def test_migrate_target_streams_the_script_against_the_snapshot(monkeypatch, capsys):
+    calls = []
+    monkeypatch.setattr(fanout.subprocess, "Popen", fake_popen(calls, ["-- started --\n", "-- done --\n"]))
+    monkeypatch.setattr(fanout, "FANOUT_SCRIPT", "migrate_roles")
+    monkeypatch.setattr(fanout, "MIGRATION_JOURNAL", "journal.jsonl")
+    assert fanout.migrate_target(("v1", "a1", "k1"), "/tmp/snap.json.gz")
+    args, env = calls[0]
+    assert args[1].endswith("migrate_roles.py")
+    assert env["TARGET_VAULT_ID"] == "v1" and env["SOURCE_SNAPSHOT"] == "/tmp/snap.json.gz"
+    assert env["TARGET_ACCOUNT_ID"] == "a1" and env["TARGET_ACCOUNT_AUTH"] == "k1"
+    assert env["MIGRATION_JOURNAL"] == "journal.jsonl.v1"
+    assert env["PYTHONUNBUFFERED"] == "1"
+    assert capsys.readouterr().out == "[v1] -- started --\n[v1] -- done --\n"
+
+    monkeypatch.setattr(fanout.subprocess, "Popen", fake_popen(calls, [], returncode=1))
+    assert not fanout.migrate_target(("v1", None, None), "/tmp/snap.json.gz")
+
+
+def test_migrate_account_fans_out_in_one_process(monkeypatch):
+    calls = []
+    monkeypatch.setattr(fanout.subprocess, "Popen", fake_popen(calls, []))
+    monkeypatch.setenv("TARGET_ACCOUNT_IDS", "['a1','a1']")
+    monkeypatch.setenv("TARGET_ACCOUNT_AUTHS", "['k1','k1']")
+    assert fanout.migrate_account(("a1", "k1"), ["v1", "v2"], "/tmp/snap.json.gz")
+    args, env = calls[0]
+    assert args[1].endswith("fanout.py")
+    assert fanout.parse_ids(env["TARGET_VAULT_IDS"]) == ["v1", "v2"]
+    assert env["TARGET_ACCOUNT_ID"] == "a1" and env["TARGET_ACCOUNT_AUTH"] == "k1"
+    assert env["SOURCE_SNAPSHOT"] == "/tmp/snap.json.gz"
+    assert "TARGET_ACCOUNT_IDS" not in env and "TARGET_ACCOUNT_AUTHS" not in env
+
+
+def test_migrate_in_process_per_script(monkeypatch, capsys):
+    calls = []
+    monkeypatch.setattr(mpol, "main", lambda *args: calls.append(("policies",) + args))
+    monkeypatch.setattr(mr, "main", lambda *args: calls.append(("roles",) + args))
+    monkeypatch.setattr(fanout, "POLICY_IDS", "['p1']")
+    monkeypatch.setattr(fanout, "ROLE_IDS", "['r1']")
+    monkeypatch.setattr(fanout, "SOURCE_VAULT_ID", "sv")
+    entries = {("roles/list", "sv"): [{"ID": "r2"}]}
+    for script in fanout.FANOUT_SCRIPTS:
+        monkeypatch.setattr(fanout, "FANOUT_SCRIPT", script)
+        assert fanout.migrate_in_process(("v1", None, None), entries)
+    assert calls == [("policies", ["p1"], "v1"), ("roles", ["r1"], "v1"), ("roles", ["r2"], "v1", "sv")]
+
+    monkeypatch.setattr(mr, "main", lambda *args: (_ for _ in ()).throw(ValueError("boom")))
+    assert not fanout.migrate_in_process(("v2", None, None), entries)
+    assert "Migration failed for the target vault v2: boom" in capsys.readouterr().out
+
+
+def test_fanout_jobs_share_a_process_per_account(monkeypatch):
+    monkeypatch.setattr(fanout, "FANOUT_SCRIPT", "migrate_roles")
+    monkeypatch.setattr(fanout, "MIGRATION_JOURNAL", None)
+    targets = [("v1", None, None), ("v2", "a1", "k1"), ("v3", None, None), ("v4", "a1", "k1"), ("v5", "a2", "k2")]
+    jobs = fanout.fanout_jobs(targets, {}, "/tmp/snap.json.gz")
+    assert [vault_ids for vault_ids, _ in jobs] == [["v1"], ["v3"], ["v2", "v4"], ["v5"]]
+    assert [job.func for _, job in jobs] == [
+        fanout.migrate_in_process,
+        fanout.migrate_in_process,
+        fanout.migrate_account,
+        fanout.migrate_account,
+    ]
+
+    # journaled targets need a journal each, they run in their own process
+    monkeypatch.setattr(fanout, "MIGRATION_JOURNAL", "journal.jsonl")
+    jobs = fanout.fanout_jobs(targets[:1], {}, "/tmp/snap.json.gz")
+    assert jobs[0][1].func is fanout.migrate_target
+    monkeypatch.setattr(fanout, "MIGRATION_JOURNAL", None)
+    monkeypatch.setattr(fanout, "FANOUT_SCRIPT", "migrate_vault_roles_and_policies")
+    monkeypatch.setattr(mvrp, "PLAN", True)
+    jobs = fanout.fanout_jobs(targets[:1], {}, "/tmp/snap.json.gz")
+    assert jobs[0][1].func is fanout.migrate_target
+
+
+def test_main_fans_out_to_every_target(monkeypatch, capsys):
+    monkeypatch.setattr(fanout, "FANOUT_SCRIPT", "migrate_policies")
+    monkeypatch.setattr(fanout, "TARGET_VAULT_IDS", "['v1','v2','v3']")
+    monkeypatch.setattr(fanout, "MIGRATION_JOURNAL", "journal.jsonl")
+    monkeypatch.setattr(fanout, "crawl_source", lambda script: {("policies", "p1"): {"policy": {}}})
+    bundles = []
+
+    def migrate_target(target, snapshot_path):
+        with gzip.open(snapshot_path, "rt", encoding="utf-8") as file:
+            bundles.append(json.load(file))
+        return target[0] != "v2"
+
+    monkeypatch.setattr(fanout, "migrate_target", migrate_target)
+    with pytest.raises(SystemExit):
+        fanout.main()
+    out = capsys.readouterr().out
+    assert len(bundles) == 3
+    assert bundles[0]["entries"] == [{"endpoint": "policies", "args": ["p1"], "value": {"policy": {}}}]
+    assert "2 out of 3 target vaults migrated successfully" in out
+    assert "failed for the target vaults ['v2']" in out
+
+    monkeypatch.setattr(fanout, "MIGRATION_JOURNAL", None)
+    monkeypatch.setattr(fanout, "migrate_in_process", lambda target, entries: True)
+    fanout.main()
+    assert "3 out of 3 target vaults migrated successfully" in capsys.readouterr().out
+
+
+def test_main_invalid_input(monkeypatch, capsys):
+    monkeypatch.setattr(fanout, "FANOUT_SCRIPT", "migrate_pipelines")
+    with pytest.raises(SystemExit):
+        fanout.main()
+    monkeypatch.setattr(fanout, "FANOUT_SCRIPT", "migrate_roles")
+    monkeypatch.setattr(fanout, "TARGET_VAULT_IDS", None)
+    with pytest.raises(SystemExit):
+        fanout.main()
+    out = capsys.readouterr().out
+    assert "FANOUT_SCRIPT must be one of" in out and "TARGET_VAULT_IDS is missing" in out
+
+
+def test_main_errors(monkeypatch):
+    class Resp:
+        content = b"boom"
+
+    monkeypatch.setattr(fanout, "TARGET_VAULT_IDS", "v1")
+    monkeypatch.setattr(
+        fanout, "crawl_source", lambda script: (_ for _ in ()).throw(requests.exceptions.HTTPError(response=Resp()))
+    )
+    with pytest.raises(SystemExit):
+        fanout.main()
+    monkeypatch.setattr(fanout, "crawl_source", lambda script: (_ for _ in ()).throw(ValueError("x")))
+    with pytest.raises(SystemExit):
+        fanout.main()
+
+
+def test_run_as_script(monkeypatch, capsys):
+    import runpy
+
+    monkeypatch.delenv("TARGET_VAULT_IDS", raising=False)
+    with pytest.raises(SystemExit):
+        runpy.run_module("fanout", run_name="__main__")
+    assert "TARGET_VAULT_IDS is missing" in capsys.readouterr().out
@@ -0,0 +1,85 @@
+from unittest.mock import MagicMock, patch
+
+import requests
+
+import http_client as hc
+
+
+def test_build_headers():
+    headers = hc.build_headers("acc", "tok")
+    assert headers == {
+        "X-SKYFLOW-ACCOUNT-ID": "acc",
+        "Authorization": "Bearer tok",
+        "Content-Type": "application/json",
+    }
+
+
+def test_create_session_mounts_pooled_adapter(monkeypatch):
+    monkeypatch.setattr(hc, "HTTP_POOL_MAXSIZE", 7)
+    monkeypatch.setattr(hc, "HTTP_TIMEOUT", 5)
+    session = hc.create_session("acc", "tok")
+    assert session.headers["Authorization"] == "Bearer tok"
+    adapter = session.get_adapter("https://manage.skyflowapis.com")
+    assert isinstance(adapter, hc.TimeoutHTTPAdapter)
+    assert adapter.timeout == 5
+    assert adapter._pool_maxsize == 7
+
+
+def test_get_session_is_shared_per_account():
+    hc.close_sessions()
+    first = hc.get_session("acc", "tok")
+    assert hc.get_session("acc", "tok") is first
+    assert hc.get_session("other", "tok") is not first
+    hc.close_sessions()
+    assert hc.get_session("acc", "tok") is not first
+
+
+def test_adapter_applies_default_timeout():
+    adapter = hc.TimeoutHTTPAdapter(timeout=3)
+    request = requests.Request("GET", "https://s/v1/roles").prepare()
+    with patch.object(requests.adapters.HTTPAdapter, "send") as send:
+        adapter.send(request)
+        assert send.call_args.kwargs["timeout"] == 3
+        adapter.send(request, timeout=10)
+        assert send.call_args.kwargs["timeout"] == 10
+
+
+def page(items):
+    response = MagicMock()
+    response.json.return_value = {"roles": items}
+    return response
+
+
+@patch("requests.Session.get")
+def test_paginate_streams_pages_until_empty_page(mock_get):
+    mock_get.side_effect = [page([1, 2]), page([3, 4]), page([5]), page([])]
+    session = requests.Session()
+    items = list(hc.paginate(session, "https://s/v1/roles?type=CUSTOM", "roles", page_size=2))
+    assert items == [1, 2, 3, 4, 5]
+    urls = [c.args[0] for c in mock_get.call_args_list]
+    assert urls == [
+        "https://s/v1/roles?type=CUSTOM&offset=0&limit=2",
+        "https://s/v1/roles?type=CUSTOM&offset=2&limit=2",
+        "https://s/v1/roles?type=CUSTOM&offset=4&limit=2",
+        "https://s/v1/roles?type=CUSTOM&offset=5&limit=2",
+    ]
+
+
+@patch("requests.Session.get")
+def test_paginate_follows_pages_capped_by_the_server(mock_get):
+    # the server returns at most 2 items whatever the limit asked for
+    mock_get.side_effect = [page([1, 2]), page([3, 4]), page([5]), page([])]
+    items = list(hc.paginate(requests.Session(), "https://s/v1/roles", "roles", page_size=10))
+    assert items == [1, 2, 3, 4, 5]
+    offsets = [c.args[0].split("offset=")[1] for c in mock_get.call_args_list]
+    assert offsets == ["0&limit=10", "2&limit=10", "4&limit=10", "5&limit=10"]
+
+
+@patch("requests.Session.get")
+def test_paginate_stops_on_empty_page(mock_get):
+    empty = MagicMock()
+    empty.json.return_value = {}
+    mock_get.side_effect = [page([1, 2]), empty]
+    items = list(hc.paginate(requests.Session(), "https://s/v1/pipelines", "roles", page_size=2))
+    assert items == [1, 2]
+    assert mock_get.call_args_list[0].args[0] == "https://s/v1/pipelines?offset=0&limit=2"
@@ -0,0 +1,70 @@
+import pytest
+
+import id_mapping
+import journal
+
+
+def test_store_saves_and_resolves_mappings(id_mapping_store, monkeypatch):
+    monkeypatch.setattr(id_mapping, "LOOKUP_CHUNK_SIZE", 2)
+    id_mapping_store.save("roles", "r1", "t1", "tv")
+    id_mapping_store.save("roles", "r2", "t2", "tv")
+    id_mapping_store.save("roles", "r3", "t3", "other")
+    id_mapping_store.save("roles", "r1", "t1b", "tv")
+    assert id_mapping_store.target_ids("roles", ["r1", "r2", "r3", "x"]) == {
+        "r1": "t1b",
+        "r2": "t2",
+        "r3": "t3",
+    }
+    assert id_mapping_store.mappings("roles", "tv") == [("r1", "t1b"), ("r2", "t2")]
+
+
+def test_mappings_persist_across_runs(id_mapping_store):
+    id_mapping_store.save("policies", "p1", "t1")
+    id_mapping.close_stores()
+    assert id_mapping.get_store() is not id_mapping_store
+    assert id_mapping.get_store().target_ids("policies", ["p1"]) == {"p1": "t1"}
+
+
+def test_parse_ids():
+    assert id_mapping.parse_ids(None) == []
+    assert id_mapping.parse_ids(" s1 ") == ["s1"]
+    assert id_mapping.parse_ids("['s1','s2']") == ["s1", "s2"]
+
+
+def test_resolve_targets(id_mapping_store):
+    journal.record("policies", "p1", "t1", "tv")
+    journal.record("policies", "p2", "t2", "tv")
+    assert id_mapping.resolve_targets("policies", ["p2"]) == [("p2", "t2")]
+    assert id_mapping.resolve_targets("policies", [], "tv") == [("p1", "t1"), ("p2", "t2")]
+    assert id_mapping.resolve_targets("policies", []) == []
+    with pytest.raises(ValueError):
+        id_mapping.resolve_targets("policies", ["p1", "p3"])
+    assert id_mapping.translate_ids("policies", ["p1", "target-id"]) == ["t1", "target-id"]
+
+
+def test_without_store(monkeypatch):
+    monkeypatch.setattr(id_mapping, "ID_MAPPING_STORE", None)
+    assert id_mapping.get_store() is None
+    assert id_mapping.translate_ids("roles", ["r1"]) == ["r1"]
+    with pytest.raises(ValueError):
+        id_mapping.resolve_targets("roles", ["r1"])
+
+
+def test_mappings_are_kept_per_target_vault(id_mapping_store):
+    journal.record("policies", "p1", "t1", "v1")
+    journal.record("policies", "p1", "t2", "v2")
+    assert id_mapping.resolve_targets("policies", ["p1"], "v1") == [("p1", "t1")]
+    assert id_mapping.resolve_targets("policies", ["p1"], "v2") == [("p1", "t2")]
+    assert id_mapping.translate_ids("policies", ["p1", "x"], "v2") == ["t2", "x"]
+
+
+def test_vault_less_lookups_refuse_ambiguous_mappings(id_mapping_store):
+    journal.record("policies", "p1", "t1", "v1")
+    journal.record("policies", "p1", "t2", "v2")
+    journal.record("policies", "p2", "t3", "v1")
+    journal.record("policies", "p2", "t3", "v2")
+    assert id_mapping.resolve_targets("policies", ["p2"]) == [("p2", "t3")]
+    with pytest.raises(ValueError, match="several vaults"):
+        id_mapping.resolve_targets("policies", ["p1"])
+    with pytest.raises(ValueError, match="several vaults"):
+        id_mapping.translate_ids("policies", ["p1"])
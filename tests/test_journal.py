@@ -0,0 +1,52 @@
+import json
+from unittest.mock import patch
+
+import journal
+
+
+def test_records_are_appended_and_reloaded(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    first = journal.Journal(path)
+    first.record("roles", "r1", "t1")
+    first.record("policies", "p1", "tp1")
+    assert first.lookup("roles", "r1") == "t1"
+    first.close()
+    first.close()
+    with open(path) as file:
+        lines = [json.loads(line) for line in file]
+    assert lines[0] == {"kind": "roles", "sourceID": "r1", "targetID": "t1"}
+
+    with open(path, "a") as file:
+        file.write('{"kind": "roles", "sourc')  # interrupted mid-write
+    second = journal.Journal(path)
+    assert second.lookup("policies", "p1") == "tp1"
+    assert second.lookup("roles", "r2") is None
+    second.close()
+
+
+def test_fsync_is_batched(tmp_path):
+    with patch("journal.os.fsync") as fsync:
+        entries = journal.Journal(str(tmp_path / "journal.jsonl"), fsync_every=2)
+        entries.record("roles", "r1", "t1")
+        assert fsync.call_count == 0
+        entries.record("roles", "r2", "t2")
+        assert fsync.call_count == 1
+        entries.record("roles", "r3", "t3")
+        entries.close()
+        assert fsync.call_count == 2
+
+
+def test_completed_only_when_resuming(journal_path, monkeypatch):
+    journal.record("roles", "r1", "t1")
+    assert journal.get_journal() is journal.get_journal()
+    assert journal.completed("roles", "r1") is None
+    monkeypatch.setattr(journal, "RESUME", True)
+    assert journal.completed("roles", "r1") == "t1"
+
+
+def test_no_journal_by_default(monkeypatch):
+    monkeypatch.setattr(journal, "MIGRATION_JOURNAL", None)
+    monkeypatch.setattr(journal, "RESUME", True)
+    journal.record("roles", "r1", "t1")
+    assert journal.get_journal() is None
+    assert journal.completed("roles", "r1") is None
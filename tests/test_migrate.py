@@ -0,0 +1,157 @@
+import pytest
+import requests
+
+import migrate
+import migrate_connections as mc
+import migrate_pipelines as mpl
+import migrate_policies as mp
+import migrate_roles as mr
+import migrate_service_accounts as msa
+import migrate_vault_roles_and_policies as mvrp
+import migrate_vault_schema as mvs
+
+
+@pytest.fixture(autouse=True)
+def restore_vault_ids(monkeypatch):
+    # the CLI points the scripts at the vaults, restore them after every test
+    for module in migrate.SOURCE_VAULT_MODULES:
+        monkeypatch.setattr(module, "SOURCE_VAULT_ID", module.SOURCE_VAULT_ID)
+    for module in migrate.TARGET_VAULT_MODULES:
+        monkeypatch.setattr(module, "TARGET_VAULT_ID", module.TARGET_VAULT_ID)
+
+
+def test_expand_stages():
+    assert migrate.expand_stages(["all"]) == ["schema", "roles", "connections", "pipelines"]
+    assert migrate.expand_stages(["policies", "schema", "policies"]) == ["policies", "schema"]
+
+
+def test_all_hands_the_created_vault_over(monkeypatch, capsys):
+    calls = []
+    monkeypatch.setattr(mvs, "main", lambda: calls.append(("schema", mvs.SOURCE_VAULT_ID)) or "tv")
+    monkeypatch.setattr(mr, "ROLE_IDS", None)
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None)
+    monkeypatch.setattr(mvrp, "list_all_vault_custom_roles", lambda vault_id: iter([{"ID": f"{vault_id}-r1"}]))
+    monkeypatch.setattr(
+        mr,
+        "main",
+        lambda role_ids, target_vault_id, source_vault_id: calls.append(("roles", list(role_ids), target_vault_id)) or [{}],
+    )
+    monkeypatch.setattr(mc, "CONNECTION_IDS", None)
+    monkeypatch.setattr(mc, "CONNECTIONS_CONFIG", None)
+    monkeypatch.setattr(mc, "MIGRATE_ALL_CONNECTIONS", None)
+    monkeypatch.setattr(mc, "list_connections", lambda vault_id: iter([{"ID": "c1"}]))
+    monkeypatch.setattr(mc, "main", lambda connection_ids: calls.append(("connections", connection_ids, mc.TARGET_VAULT_ID)))
+    monkeypatch.setattr(mpl, "PIPELINE_ID", None)
+    monkeypatch.setattr(mpl, "list_pipelines", lambda vault_id: iter([{"ID": "p1"}, {"ID": "p2"}]))
+    monkeypatch.setattr(mpl, "main", lambda pipeline_id: calls.append(("pipelines", pipeline_id, mpl.TARGET_VAULT_ID)))
+
+    context = migrate.main(["all", "--source-vault-id", "sv"])
+
+    assert context == {"sourceVaultID": "sv", "targetVaultID": "tv"}
+    assert calls == [
+        ("schema", "sv"),
+        ("roles", ["sv-r1"], "tv"),
+        ("connections", ["c1"], "tv"),
+        ("pipelines", "p1", "tv"),
+        ("pipelines", "p2", "tv"),
+    ]
+    assert all(module.TARGET_VAULT_ID == "tv" for module in migrate.TARGET_VAULT_MODULES)
+    assert "-- No.of Roles: 1 --" in capsys.readouterr().out
+
+
+def test_configured_stages(monkeypatch, capsys):
+    calls = []
+    monkeypatch.setattr(mr, "ROLE_IDS", "['r1']")
+    monkeypatch.setattr(
+        mr, "main", lambda role_ids, target_vault_id, source_vault_id: calls.append(("roles", role_ids, target_vault_id))
+    )
+    monkeypatch.setattr(mp, "main", lambda policy_ids, target_vault_id: calls.append(("policies", target_vault_id)))
+    monkeypatch.setattr(msa, "main", lambda: calls.append(("service-accounts", msa.TARGET_VAULT_ID)))
+    monkeypatch.setattr(mc, "CONNECTION_IDS", "['c1']")
+    monkeypatch.setattr(mc, "main", lambda: calls.append(("connections",)))
+    monkeypatch.setattr(mpl, "PIPELINE_ID", "p1")
+    monkeypatch.setattr(mpl, "main", lambda pipeline_id: calls.append(("pipelines", pipeline_id)))
+
+    migrate.main(["roles", "policies", "service-accounts", "connections", "pipelines", "--target-vault-id", "tv"])
+
+    assert calls == [
+        ("roles", None, "tv"),
+        ("policies", "tv"),
+        ("service-accounts", "tv"),
+        ("connections",),
+        ("pipelines", "p1"),
+    ]
+    assert "-- No.of Roles: 0 --" in capsys.readouterr().out
+
+
+def test_no_connections(monkeypatch, capsys):
+    monkeypatch.setattr(mc, "CONNECTION_IDS", None)
+    monkeypatch.setattr(mc, "CONNECTIONS_CONFIG", None)
+    monkeypatch.setattr(mc, "MIGRATE_ALL_CONNECTIONS", None)
+    monkeypatch.setattr(mc, "list_connections", lambda vault_id: iter([]))
+    migrate.main(["connections", "--source-vault-id", "sv", "--target-vault-id", "tv"])
+    assert "No connections found for the vault sv" in capsys.readouterr().out
+
+
+def test_target_vault_required(monkeypatch, capsys):
+    monkeypatch.setattr(mvs, "main", lambda: None)
+    with pytest.raises(SystemExit):
+        migrate.main(["schema", "roles", "--target-vault-id", ""])
+    assert "Target vault ID is required for the roles stage" in capsys.readouterr().out
+
+
+def test_service_accounts_stage_requires_the_target_vault(monkeypatch, capsys):
+    monkeypatch.setattr(msa, "main", lambda: pytest.fail("service accounts migrated without a target vault"))
+    with pytest.raises(SystemExit):
+        migrate.main(["service-accounts", "--target-vault-id", ""])
+    assert "Target vault ID is required for the service-accounts stage" in capsys.readouterr().out
+
+
+def test_stage_errors_stop_the_run(monkeypatch, capsys):
+    class Resp:
+        content = b"denied"
+
+    def fail_http(policy_ids, target_vault_id):
+        raise requests.exceptions.HTTPError(response=Resp())
+
+    monkeypatch.setattr(mp, "main", fail_http)
+    with pytest.raises(SystemExit):
+        migrate.main(["policies", "--target-vault-id", "tv"])
+    monkeypatch.setattr(msa, "main", lambda: (_ for _ in ()).throw(ValueError("bad")))
+    with pytest.raises(SystemExit):
+        migrate.main(["service-accounts", "--target-vault-id", "tv"])
+    out = capsys.readouterr().out
+    assert "migrate HTTP error: denied" in out and "migrate other error: bad" in out
+
+
+def test_run_as_script(monkeypatch, capsys):
+    import runpy
+    import sys
+
+    monkeypatch.setattr(sys, "argv", ["migrate.py", "policies", "--target-vault-id", ""])
+    with pytest.raises(SystemExit):
+        runpy.run_module("migrate", run_name="__main__")
+    assert "Target vault ID is required for the policies stage" in capsys.readouterr().out
+
+
+def test_shard(monkeypatch, capsys):
+    import sharding
+
+    monkeypatch.setattr(sharding, "SHARD", None)
+    monkeypatch.setattr(mpl, "PIPELINE_ID", None)
+    pipeline_ids = [f"p{index}" for index in range(6)]
+    monkeypatch.setattr(mpl, "list_pipelines", lambda vault_id: iter([{"ID": p} for p in pipeline_ids]))
+    migrated = []
+    monkeypatch.setattr(mpl, "main", migrated.append)
+
+    migrate.main(["pipelines", "--target-vault-id", "tv", "--shard", "2/3"])
+    assert sharding.SHARD == "2/3"
+    assert migrated == [p for p in pipeline_ids if sharding.shard_of(p, 3) == 2]
+
+    with pytest.raises(SystemExit):
+        migrate.main(["all", "--shard", "1/2"])
+    with pytest.raises(SystemExit):
+        migrate.main(["policies", "--shard", "3/2"])
+    out = capsys.readouterr().out
+    assert "The schema stage can not be sharded" in out
+    assert "Invalid shard 3/2" in out
@@ -20,7 +20,7 @@ def test_transform_connection_payload_removes_audit_and_invocation(monkeypatch):
     assert "invocationURL" not in out["routes"][0]
 
 
-@patch("migrate_connections.requests.post")
+@patch("requests.Session.post")
 def test_main_with_config_creates_connection(mock_post, monkeypatch, tmp_path):
     # Ensure config branch is used
     monkeypatch.setattr(mc, "CONNECTIONS_CONFIG", "config_file", raising=False)
@@ -49,8 +49,31 @@ def test_main_with_config_creates_connection(mock_post, monkeypatch, tmp_path):
     assert mock_post.call_count >= 1
 
 
-@patch("migrate_connections.requests.get")
-@patch("migrate_connections.requests.post")
+@patch("requests.Session.post")
+def test_main_with_config_migrates_entries_without_id(mock_post, journal_path, monkeypatch):
+    import journal
+    import sharding
+
+    monkeypatch.setattr(mc, "CONNECTIONS_CONFIG", "config_file", raising=False)
+    monkeypatch.setattr(mc, "TARGET_VAULT_ID", "tv")
+    monkeypatch.setattr(mc, "TARGET_ENV_URL", "https://target")
+    monkeypatch.setattr(journal, "RESUME", True)
+    monkeypatch.setattr(sharding, "SHARD", "1/1")
+    resp = MagicMock()
+    resp.status_code = 200
+    resp.json.return_value = {"ID": "new-conn"}
+    mock_post.return_value = resp
+    sample = '[{"name": "Conn", "mode": "EGRESS", "routes": [{"path": "/p", "invocationURL": "u"}]}]'
+    with patch("builtins.open", mock_open(read_data=sample)):
+        mc.main()
+
+    assert mock_post.call_count == 1
+    # an entry without a source ID is not journaled
+    assert journal.get_journal().lookup("connections", None) is None
+
+
+@patch("requests.Session.get")
+@patch("requests.Session.post")
 def test_main_with_ids_fetches_each_and_creates(mock_post, mock_get, monkeypatch):
     monkeypatch.setattr(mc, "CONNECTIONS_CONFIG", None, raising=False)
     monkeypatch.setattr(mc, "TARGET_VAULT_ID", "tv")
@@ -87,7 +110,7 @@ def test_main_migrate_all_without_source_vault(monkeypatch):
     assert mc.main(connection_ids=[]) is None
 
 
-@patch("migrate_connections.requests.get")
+@patch("requests.Session.get")
 def test_main_handles_http_error(mock_get, monkeypatch):
     import requests
 
@@ -150,7 +173,7 @@ def test_run_as_script_config_file(monkeypatch):
     monkeypatch.setenv("SOURCE_ENV_URL", "https://s")
     sample = '[\n  {\n    "ID": "c1", "name": "Conn", "mode": "EGRESS", "vaultID": "sv",\n    "routes": [{"path": "/p", "method": "GET", "invocationURL": "u"}]\n  }\n]'
     with patch("builtins.open", mock_open(read_data=sample)):
-        with patch.object(_requests, "post") as mpost:
+        with patch.object(_requests.Session, "post") as mpost:
             r = MagicMock()
             r.status_code = 200
             r.json.return_value = {"ID": "new"}
@@ -159,7 +182,7 @@ def test_run_as_script_config_file(monkeypatch):
             assert mpost.call_count >= 1
 
 
-@patch("migrate_connections.requests.get")
+@patch("requests.Session.get")
 def test_list_connections_combines_inbound_and_outbound(mock_get, monkeypatch):
     monkeypatch.setattr(mc, "SOURCE_ENV_URL", "https://s")
     r1 = MagicMock()
@@ -168,12 +191,16 @@ def test_list_connections_combines_inbound_and_outbound(mock_get, monkeypatch):
     r2 = MagicMock()
     r2.raise_for_status.return_value = None
     r2.json.return_value = {"ConnectionMappings": ["i1"]}
-    mock_get.side_effect = [r1, r2]
+    empty = MagicMock()
+    empty.json.return_value = {"ConnectionMappings": []}
+    mock_get.side_effect = [r1, empty, r2, empty]
     out = mc.list_connections("v")
-    assert out == ["o1", "i1"]
+    assert list(out) == ["o1", "i1"]
+    assert "outboundRoutes?vaultID=v&offset=0&limit=" in mock_get.call_args_list[0].args[0]
+    assert "inboundRoutes?vaultID=v&offset=0&limit=" in mock_get.call_args_list[2].args[0]
 
 
-@patch("migrate_connections.requests.get")
+@patch("requests.Session.get")
 def test_get_connection_returns_json(mock_get, monkeypatch):
     monkeypatch.setattr(mc, "SOURCE_ENV_URL", "https://s")
     g = MagicMock()
@@ -184,7 +211,7 @@ def test_get_connection_returns_json(mock_get, monkeypatch):
     assert out["ID"] == "c"
 
 
-@patch("migrate_connections.requests.post")
+@patch("requests.Session.post")
 def test_main_handles_creation_failure(mock_post, monkeypatch):
     # Drive config file path
     monkeypatch.setattr(mc, "CONNECTIONS_CONFIG", "config_file", raising=False)
@@ -208,3 +235,92 @@ def test_main_handles_creation_failure(mock_post, monkeypatch):
         mc.main()
         # Should attempt to create the connection once even if it fails
         assert mock_post.call_count == 1
+
+
+@patch("requests.Session.get")
+@patch("requests.Session.post")
+def test_resume_skips_journaled_connections(mock_post, mock_get, journal_path, monkeypatch):
+    import journal
+
+    monkeypatch.setattr(mc, "CONNECTIONS_CONFIG", None, raising=False)
+    monkeypatch.setattr(mc, "MIGRATE_ALL_CONNECTIONS", None, raising=False)
+    monkeypatch.setattr(mc, "SOURCE_ENV_URL", "https://source")
+    monkeypatch.setattr(mc, "TARGET_ENV_URL", "https://target")
+    mock_get.return_value.json.return_value = {
+        "ID": "c2",
+        "name": "ConnB",
+        "mode": "EGRESS",
+        "routes": [],
+    }
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {"ID": "t2"}
+    journal.record("connections", "c1", "t1")
+    monkeypatch.setattr(journal, "RESUME", True)
+
+    mc.main(connection_ids=["c1", "c2"])
+    assert mock_get.call_count == 1 and mock_post.call_count == 1
+    assert journal.completed("connections", "c2") == "t2"
+
+    # listed connections are checked against the journal as well
+    monkeypatch.setattr(mc, "MIGRATE_ALL_CONNECTIONS", "true", raising=False)
+    monkeypatch.setattr(mc, "SOURCE_VAULT_ID", "sv", raising=False)
+    monkeypatch.setattr(mc, "list_connections", lambda v: [{"ID": "c2", "name": "ConnB"}])
+    mc.main()
+    assert mock_post.call_count == 1
+
+
+@patch("requests.Session.post")
+def test_delta_sync_skips_synced_connections(mock_post, id_mapping_store, monkeypatch, capsys):
+    monkeypatch.setattr(mc, "CONNECTIONS_CONFIG", None, raising=False)
+    monkeypatch.setattr(mc, "MIGRATE_ALL_CONNECTIONS", "true", raising=False)
+    monkeypatch.setattr(mc, "SOURCE_VAULT_ID", "sv", raising=False)
+    monkeypatch.setattr(mc, "TARGET_VAULT_ID", "tv")
+    monkeypatch.setattr(mc, "TARGET_ENV_URL", "https://target")
+    monkeypatch.setattr(mc, "DELTA_SYNC", True)
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {"ID": "t1"}
+    connection = {"ID": "c1", "name": "ConnA", "mode": "EGRESS", "routes": []}
+    monkeypatch.setattr(mc, "list_connections", lambda v: [dict(connection)])
+
+    mc.main()
+    mc.main()
+    assert mock_post.call_count == 1
+    assert "ConnA unchanged since the last sync" in capsys.readouterr().out
+
+    connection["description"] = "changed"
+    mc.main()
+    assert mock_post.call_count == 1
+    assert "ConnA changed since the last sync, update Target CONNECTION_ID: t1 manually" in capsys.readouterr().out
+
+    import delta_sync
+
+    monkeypatch.setattr(delta_sync, "DELTA_SYNC_ACKNOWLEDGED", "c1")
+    mc.main()
+    assert "ConnA updated by hand, marked as synced" in capsys.readouterr().out
+    monkeypatch.setattr(delta_sync, "DELTA_SYNC_ACKNOWLEDGED", None)
+    mc.main()
+    assert mock_post.call_count == 1
+    assert "ConnA unchanged since the last sync" in capsys.readouterr().out
+
+
+def test_main_only_migrates_the_connections_of_its_shard(monkeypatch):
+    import sharding
+
+    monkeypatch.setattr(sharding, "SHARD", "1/2")
+    monkeypatch.setattr(mc, "CONNECTIONS_CONFIG", None, raising=False)
+    monkeypatch.setattr(mc, "MIGRATE_ALL_CONNECTIONS", None, raising=False)
+    fetched = []
+    monkeypatch.setattr(mc, "get_connection", lambda connection_id: fetched.append(connection_id) or {"ID": connection_id, "name": connection_id})
+    monkeypatch.setattr(mc, "transform_connection_payload", lambda connection: connection)
+    monkeypatch.setattr(mc, "create_connection", lambda connection: MagicMock(status_code=200, json=lambda: {"ID": "t"}))
+    connection_ids = [f"c{index}" for index in range(8)]
+    mc.main(connection_ids)
+    assert fetched == [c for c in connection_ids if sharding.shard_of(c, 2) == 1]
+
+    monkeypatch.setattr(mc, "MIGRATE_ALL_CONNECTIONS", "true")
+    monkeypatch.setattr(mc, "SOURCE_VAULT_ID", "sv", raising=False)
+    monkeypatch.setattr(mc, "list_connections", lambda vault_id: iter([{"ID": c, "name": c} for c in connection_ids]))
+    created = []
+    monkeypatch.setattr(mc, "create_connection", lambda connection: created.append(connection["ID"]) or MagicMock(status_code=500))
+    mc.main()
+    assert created == fetched
@@ -217,36 +217,37 @@ def test_transform_pipeline_payload(monkeypatch):
 
 def test_list_pipelines(monkeypatch):
     module = load_module(monkeypatch)
-    calls = {}
+    calls = []
 
-    def fake_get(url, headers):
-        calls["url"] = url
-        calls["headers"] = headers
+    def fake_get(session, url):
+        calls.append(url)
+        # the listing ends on an empty page
+        pipelines = [] if "offset=0&" not in url else [{"ID": "pipeline-1"}]
         return SimpleNamespace(
             raise_for_status=lambda: None,
-            json=lambda: {"pipelines": [{"ID": "pipeline-1"}]},
+            json=lambda: {"pipelines": pipelines},
         )
 
-    monkeypatch.setattr(module.requests, "get", fake_get)
+    monkeypatch.setattr(module.requests.Session, "get", fake_get)
     result = module.list_pipelines("vault-123")
-    assert result == [{"ID": "pipeline-1"}]
-    assert calls["url"].endswith("vaultID=vault-123")
-    assert calls["headers"]["Authorization"].startswith("Bearer")
+    assert list(result) == [{"ID": "pipeline-1"}]
+    assert "vaultID=vault-123&offset=0&limit=" in calls[0]
+    assert "vaultID=vault-123&offset=1&limit=" in calls[1]
+    assert module.SOURCE_SESSION.headers["Authorization"].startswith("Bearer")
 
 
 def test_get_pipeline(monkeypatch):
     module = load_module(monkeypatch)
     captured = {}
 
-    def fake_get(url, headers):
+    def fake_get(session, url):
         captured["url"] = url
-        captured["headers"] = headers
         return SimpleNamespace(
             raise_for_status=lambda: None,
             json=lambda: {"pipeline": {"ID": "pipeline-1", "name": "Example"}},
         )
 
-    monkeypatch.setattr(module.requests, "get", fake_get)
+    monkeypatch.setattr(module.requests.Session, "get", fake_get)
     pipeline = module.get_pipeline("pipeline-1")
     assert pipeline["name"] == "Example"
     assert captured["url"].endswith("/pipeline-1")
@@ -256,10 +257,9 @@ def test_create_pipeline(monkeypatch):
     module = load_module(monkeypatch)
     captured = {}
 
-    def fake_post(url, json, headers):
+    def fake_post(session, url, json):
         captured["url"] = url
         captured["json"] = json
-        captured["headers"] = headers
 
         class DummyResponse:
             status_code = 200
@@ -269,7 +269,7 @@ def test_create_pipeline(monkeypatch):
 
         return DummyResponse()
 
-    monkeypatch.setattr(module.requests, "post", fake_post)
+    monkeypatch.setattr(module.requests.Session, "post", fake_post)
     payload = {"name": "new-pipeline"}
     response = module.create_pipeline(payload)
     assert response.status_code == 200
@@ -438,19 +438,65 @@ def test_run_as_script_executes_main(monkeypatch):
         def json(self):
             return {"ID": "new-pipeline"}
 
-    def fake_get(url, headers):
+    def fake_get(session, url):
         captured["get_url"] = url
         return FakeGetResponse()
 
-    def fake_post(url, json, headers):
+    def fake_post(session, url, json):
         captured["post_url"] = url
         captured["payload"] = json
         return FakePostResponse()
 
-    monkeypatch.setattr(requests, "get", fake_get)
-    monkeypatch.setattr(requests, "post", fake_post)
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    monkeypatch.setattr(requests.Session, "post", fake_post)
 
     runpy.run_module("migrate_pipelines", run_name="__main__")
 
     assert captured["post_url"].endswith("/v1/pipelines")
     assert captured["payload"]["vaultID"] == BASE_ENV["TARGET_VAULT_ID"]
+
+
+def test_main_resume_skips_journaled_pipeline(monkeypatch, capsys, journal_path):
+    import journal
+
+    module = load_module(monkeypatch)
+    journal.record("pipelines", "pipeline-1", "new-id")
+    monkeypatch.setattr(journal, "RESUME", True)
+    monkeypatch.setattr(
+        module, "get_pipeline", lambda pipeline_id: pytest.fail("journaled pipeline fetched")
+    )
+    module.main("pipeline-1")
+    assert "already migrated, Target PIPELINE_ID: new-id" in capsys.readouterr().out
+
+
+def test_main_delta_sync_skips_synced_pipeline(monkeypatch, capsys, id_mapping_store):
+    module = load_module(monkeypatch)
+    monkeypatch.setattr(module, "DELTA_SYNC", True)
+    pipeline = {"ID": "pipeline-1", "name": "Pipe", "source": {}, "destination": {}}
+    monkeypatch.setattr(module, "get_pipeline", lambda pipeline_id: dict(pipeline))
+    created = []
+
+    def create_pipeline(payload):
+        created.append(payload)
+        return SimpleNamespace(status_code=200, json=lambda: {"ID": "new-id"})
+
+    monkeypatch.setattr(module, "create_pipeline", create_pipeline)
+    module.main("pipeline-1")
+    module.main("pipeline-1")
+    assert len(created) == 1
+    assert "Pipe unchanged since the last sync, Target PIPELINE_ID: new-id" in capsys.readouterr().out
+
+    pipeline["description"] = "changed"
+    module.main("pipeline-1")
+    assert len(created) == 1
+    assert "Pipe changed since the last sync, update Target PIPELINE_ID: new-id manually" in capsys.readouterr().out
+
+    import delta_sync
+
+    monkeypatch.setattr(delta_sync, "DELTA_SYNC_ACKNOWLEDGED", "['pipeline-1']")
+    module.main("pipeline-1")
+    assert "Pipe updated by hand, marked as synced" in capsys.readouterr().out
+    monkeypatch.setattr(delta_sync, "DELTA_SYNC_ACKNOWLEDGED", None)
+    module.main("pipeline-1")
+    assert len(created) == 1
+    assert "Pipe unchanged since the last sync" in capsys.readouterr().out
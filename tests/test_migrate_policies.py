@@ -3,6 +3,8 @@ import requests
 from unittest.mock import MagicMock, patch
 
 import migrate_policies as mp
+from cache import SOURCE_CACHE
+from policy_registry import clear_policy_registry
 
 
 def test_transform_policy_payload_builds_rule_params(monkeypatch):
@@ -60,8 +62,8 @@ def test_transform_policy_payload_builds_rule_params(monkeypatch):
     ].endswith("users.email")
 
 
-@patch("migrate_policies.requests.post")
-@patch("migrate_policies.requests.get")
+@patch("requests.Session.post")
+@patch("requests.Session.get")
 def test_main_creates_policies(mock_get, mock_post, monkeypatch):
     monkeypatch.setattr(mp, "TARGET_VAULT_ID", "tv")
     monkeypatch.setattr(mp, "SOURCE_ENV_URL", "https://s")
@@ -161,9 +163,204 @@ def test_run_as_script(monkeypatch):
     tgt.raise_for_status.return_value = None
     tgt.json.return_value = {"ID": "np"}
 
-    with patch.object(_requests, "get", return_value=src) as mget, patch.object(
-        _requests, "post", return_value=tgt
+    with patch.object(_requests.Session, "get", return_value=src) as mget, patch.object(
+        _requests.Session, "post", return_value=tgt
     ) as mpost:
         runpy.run_module("migrate_policies", run_name="__main__")
         assert mget.call_count >= 1
         assert mpost.call_count >= 1
+
+
+def test_main_concurrent_preserves_policy_order(monkeypatch):
+    import time
+
+    monkeypatch.setattr(mp, "MAX_CONCURRENCY", 4)
+    monkeypatch.setattr(mp, "get_policy", lambda policy_id: policy_id)
+    monkeypatch.setattr(mp, "transform_policy_payload", lambda policy, target_vault_id=None: policy)
+
+    def create(policy_id):
+        time.sleep(0.01 * (4 - int(policy_id[1:])))
+        return {"ID": f"new-{policy_id}"}
+
+    monkeypatch.setattr(mp, "create_policy", create)
+    created = mp.main(policy_ids=["p1", "p2", "p3"])
+    assert [policy["ID"] for policy in created] == ["new-p1", "new-p2", "new-p3"]
+
+
+@patch("requests.Session.get")
+def test_find_policy_by_name(mock_get, monkeypatch):
+    monkeypatch.setattr(mp, "TARGET_ENV_URL", "https://t")
+    monkeypatch.setattr(mp, "TARGET_VAULT_ID", "tv")
+    found = MagicMock()
+    found.json.return_value = {"policies": [{"ID": "tp1"}]}
+    missing = MagicMock()
+    missing.json.return_value = {"policies": []}
+    mock_get.side_effect = [found, missing]
+    assert mp.find_policy("P") == {"ID": "tp1"}
+    assert mp.find_policy("P") is None
+    assert "name=P" in mock_get.call_args_list[0].args[0]
+
+
+@patch("requests.Session.get")
+@patch("requests.Session.post")
+def test_create_policy_retry_detects_existing(mock_post, mock_get, monkeypatch):
+    import retry
+
+    monkeypatch.setattr(retry, "RETRY_BACKOFF", 0)
+    monkeypatch.setattr(mp, "TARGET_ENV_URL", "https://t")
+
+    class Resp:
+        status_code = 502
+        content = b"bad gateway"
+
+    mock_post.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError(
+        response=Resp()
+    )
+    mock_get.return_value.json.return_value = {"policies": [{"ID": "landed"}]}
+    assert mp.create_policy({"name": "P"}) == {"ID": "landed"}
+    assert mock_post.call_count == 1
+
+
+@patch("requests.Session.post")
+@patch("requests.Session.get")
+def test_resume_skips_journaled_policies(mock_get, mock_post, journal_path, monkeypatch):
+    import journal
+
+    monkeypatch.setattr(mp, "transform_policy_payload", lambda policy, target_vault_id=None: {"name": policy["ID"]})
+    mock_get.return_value.json.return_value = {"ID": "p2"}
+    mock_post.return_value.json.return_value = {"ID": "t2"}
+    journal.record("policies", "p1", "t1")
+    monkeypatch.setattr(journal, "RESUME", True)
+
+    assert mp.main(["p1", "p2"]) == [{"ID": "t1"}, {"ID": "t2"}]
+    assert mock_get.call_count == 1 and mock_post.call_count == 1
+    assert journal.completed("policies", "p2") == "t2"
+
+
+@patch("requests.Session.post")
+@patch("requests.Session.get")
+def test_delta_sync_only_writes_changed_policies(mock_get, mock_post, id_mapping_store, monkeypatch):
+    monkeypatch.setattr(mp, "DELTA_SYNC", True)
+    monkeypatch.setattr(mp, "TARGET_VAULT_ID", "tv")
+    monkeypatch.setattr(mp, "transform_policy_payload", lambda policy, target_vault_id=None: {"name": policy["name"]})
+    updated = []
+    monkeypatch.setattr(mp, "update_policy_from_source", lambda policy_ids: updated.append(policy_ids) or True)
+    mock_get.return_value.json.return_value = {"name": "P"}
+    mock_post.return_value.json.return_value = {"ID": "t1"}
+
+    assert mp.main(["p1"]) == [{"ID": "t1"}]
+    # every main call is a new run, with its own policy registry
+    clear_policy_registry()
+    assert mp.main(["p1"]) == [{"ID": "t1"}]
+    assert mock_post.call_count == 1 and updated == []
+
+    # the source policy changes between two runs
+    SOURCE_CACHE.clear()
+    clear_policy_registry()
+    mock_get.return_value.json.return_value = {"name": "P renamed"}
+    assert mp.main(["p1"]) == [{"ID": "t1"}]
+    assert mock_post.call_count == 1 and updated == [("p1", "t1")]
+    clear_policy_registry()
+    assert mp.main(["p1"]) == [{"ID": "t1"}]
+    assert updated == [("p1", "t1")]
+
+
+@patch("requests.Session.post")
+@patch("requests.Session.get")
+def test_delta_sync_keeps_policies_with_leftover_rules_changed(mock_get, mock_post, id_mapping_store, monkeypatch, capsys):
+    import delta_sync
+
+    monkeypatch.setattr(mp, "DELTA_SYNC", True)
+    monkeypatch.setattr(mp, "TARGET_VAULT_ID", "tv")
+    monkeypatch.setattr(mp, "transform_policy_payload", lambda policy, target_vault_id=None: {"name": policy["name"]})
+    updated = []
+    # the target policy keeps a rule removed from the source
+    monkeypatch.setattr(mp, "update_policy_from_source", lambda policy_ids: updated.append(policy_ids) and False)
+    mock_get.return_value.json.return_value = {"name": "P"}
+    mock_post.return_value.json.return_value = {"ID": "t1"}
+    mp.main(["p1"])
+
+    SOURCE_CACHE.clear()
+    mock_get.return_value.json.return_value = {"name": "P without a rule"}
+    for _ in range(2):
+        clear_policy_registry()
+        assert mp.main(["p1"]) == [{"ID": "t1"}]
+    assert len(updated) == 2
+    assert "is listed in DELTA_SYNC_ACKNOWLEDGED" in capsys.readouterr().out
+
+    monkeypatch.setattr(delta_sync, "DELTA_SYNC_ACKNOWLEDGED", "p1")
+    clear_policy_registry()
+    mp.main(["p1"])
+    assert "rules removed by hand, marked as synced" in capsys.readouterr().out
+    monkeypatch.setattr(delta_sync, "DELTA_SYNC_ACKNOWLEDGED", None)
+    clear_policy_registry()
+    mp.main(["p1"])
+    assert len(updated) == 3
+    assert "Policy p1 unchanged since the last sync" in capsys.readouterr().out
+
+
+@patch("requests.Session.post")
+@patch("requests.Session.get")
+def test_main_migrates_into_the_given_target_vault(mock_get, mock_post, monkeypatch):
+    monkeypatch.setattr(mp, "TARGET_VAULT_ID", "default")
+    mock_get.return_value.json.return_value = {
+        "policy": {
+            "ID": "p1",
+            "name": "P",
+            "namespace": "n",
+            "status": "ACTIVE",
+            "BasicAudit": {},
+            "members": [],
+            "rules": [],
+        }
+    }
+    mock_post.return_value.json.return_value = {"ID": "t1"}
+    assert mp.main(["p1"], "other") == [{"ID": "t1"}]
+    assert mock_post.call_args.kwargs["json"]["resource"] == {"ID": "other", "type": "VAULT"}
+
+
+@patch("requests.Session.post")
+def test_main_validates_every_policy_before_creating_any(mock_post, monkeypatch, capsys):
+    import policy_validation
+
+    monkeypatch.setattr(mp, "VALIDATE_POLICIES", True)
+    monkeypatch.setattr(mp, "TARGET_VAULT_ID", "tv")
+    monkeypatch.setattr(
+        policy_validation,
+        "get_target_vault",
+        lambda vault_id: {"vault": {"schemas": [{"name": "users", "fields": [{"name": "email"}]}]}},
+    )
+    columns = {"p1": "email", "p2": "phone"}
+
+    def get_policy(policy_id):
+        return {
+            "policy": {
+                "ID": policy_id,
+                "name": policy_id,
+                "namespace": "n",
+                "status": "ACTIVE",
+                "BasicAudit": {},
+                "members": [],
+                "rules": [
+                    {
+                        "ID": "r",
+                        "name": "R",
+                        "ruleExpression": "true",
+                        "actions": ["POLICY.read"],
+                        "resources": [f"vault:v/table:users/column:{columns[policy_id]}"],
+                        "resourceType": "COLUMN",
+                        "dlpFormat": None,
+                    }
+                ],
+            }
+        }
+
+    monkeypatch.setattr(mp, "get_policy", get_policy)
+    with pytest.raises(ValueError):
+        mp.main(["p1", "p2"])
+    assert not mock_post.called
+    assert "policy p2 rule R references the missing column users.phone" in capsys.readouterr().out
+
+    columns["p2"] = "email"
+    mock_post.return_value.json.return_value = {"ID": "t"}
+    assert mp.main(["p1", "p2"]) == [{"ID": "t"}, {"ID": "t"}]
@@ -5,6 +5,13 @@ from unittest.mock import MagicMock, patch
 import migrate_roles as mr
 
 
+def empty_page():
+    # a listing ends on an empty page
+    response = MagicMock()
+    response.json.return_value = {}
+    return response
+
+
 def test_transform_role_payload_filters_upstream(monkeypatch):
     monkeypatch.setattr(mr, "TARGET_VAULT_ID", "tv")
     source = {
@@ -32,7 +39,7 @@ def test_transform_role_payload_filters_upstream(monkeypatch):
     assert out["resource"] == {"ID": "tv", "type": "VAULT"}
 
 
-@patch("migrate_roles.requests.get")
+@patch("requests.Session.get")
 def test_main_system_role_path(mock_get, monkeypatch):
     # Provide a ROLE_ID that resolves to a system role
     monkeypatch.setenv("ROLE_IDS", "['rid1']")
@@ -45,20 +52,25 @@ def test_main_system_role_path(mock_get, monkeypatch):
     role_resp.raise_for_status.return_value = None
     role_resp.json.return_value = {"role": {"definition": {"name": mr.SYSTEM_ROLES[0]}}}
 
-    # Second GET: get_system_role -> returns existing role list
+    # Second GET: target inventory -> lists the roles of the target vault
     sys_resp = MagicMock()
     sys_resp.raise_for_status.return_value = None
-    sys_resp.json.return_value = {"roles": [{"ID": "sys-role"}]}
+    sys_resp.json.return_value = {
+        "roles": [{"ID": "sys-role", "definition": {"name": mr.SYSTEM_ROLES[0]}}]
+    }
 
-    mock_get.side_effect = [role_resp, sys_resp]
+    mock_get.side_effect = [role_resp, sys_resp, empty_page()]
     # migrate_roles.main ignores the argument; provide ROLE_IDS module var
     monkeypatch.setattr(mr, "ROLE_IDS", "['rid1']", raising=False)
     out = mr.main()
     assert out and out[0]["ID"] == "sys-role"
+    assert mock_get.call_args_list[1].args[0] == (
+        "https://t/v1/roles?resource.type=VAULT&resource.ID=tv&offset=0&limit=100"
+    )
 
 
-@patch("migrate_roles.requests.post")
-@patch("migrate_roles.requests.get")
+@patch("requests.Session.post")
+@patch("requests.Session.get")
 @patch("migrate_roles.migrate_policies")
 def test_main_custom_role_create_and_assign(
     mock_migrate_policies, mock_get, mock_post, monkeypatch
@@ -98,8 +110,8 @@ def test_main_custom_role_create_and_assign(
     assert out and any(r.get("ID") == "new-role" for r in out)
 
 
-@patch("migrate_roles.requests.post")
-@patch("migrate_roles.requests.get")
+@patch("requests.Session.post")
+@patch("requests.Session.get")
 def test_migrate_all_roles_branch(mock_get, mock_post, monkeypatch):
     monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", "true", raising=False)
     monkeypatch.setattr(mr, "SOURCE_VAULT_ID", "sv", raising=False)
@@ -118,7 +130,13 @@ def test_migrate_all_roles_branch(mock_get, mock_post, monkeypatch):
     no_policies = MagicMock()
     no_policies.raise_for_status.return_value = None
     no_policies.json.return_value = {"policies": []}
-    mock_get.side_effect = [list_resp, role_resp, no_policies]
+
+    def get(url):
+        if "/v1/roles?" in url:
+            return list_resp if "offset=0&" in url else empty_page()
+        return no_policies if "policies" in url else role_resp
+
+    mock_get.side_effect = get
 
     create_post = MagicMock()
     create_post.raise_for_status.return_value = None
@@ -127,10 +145,37 @@ def test_migrate_all_roles_branch(mock_get, mock_post, monkeypatch):
 
     out = mr.main()
     assert out and any(r.get("ID") == "new-role" for r in out)
+    assert "resource.ID=sv&" in mock_get.call_args_list[0].args[0]
+
+    # the source vault passed by the caller is listed rather than SOURCE_VAULT_ID
+    mock_get.reset_mock()
+    mr.main(target_vault_id="tv", source_vault_id="other")
+    assert "resource.ID=other&" in mock_get.call_args_list[0].args[0]
+
 
+@patch("requests.Session.post")
+@patch("requests.Session.get")
+def test_passed_role_ids_take_precedence_over_migrate_all(mock_get, mock_post, monkeypatch):
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", "true", raising=False)
+    monkeypatch.setattr(mr, "SOURCE_VAULT_ID", "sv", raising=False)
+    monkeypatch.setattr(mr, "TARGET_VAULT_ID", "tv", raising=False)
+    monkeypatch.setattr(mr, "SOURCE_ENV_URL", "https://s")
+    monkeypatch.setattr(mr, "TARGET_ENV_URL", "https://t")
+    monkeypatch.setattr(mr, "list_all_roles", lambda source_vault_id=None: pytest.fail("roles listed"))
 
-@patch("migrate_roles.requests.post")
-@patch("migrate_roles.requests.get")
+    role_resp = MagicMock()
+    role_resp.json.return_value = {"role": {"definition": {"name": "Custom", "permissions": []}}}
+    no_policies = MagicMock()
+    no_policies.json.return_value = {"policies": []}
+    mock_get.side_effect = [role_resp, no_policies]
+    mock_post.return_value.json.return_value = {"ID": "new-role"}
+
+    assert mr.main(["r1"]) == [{"ID": "new-role"}]
+    assert "roles/r1" in mock_get.call_args_list[0].args[0]
+
+
+@patch("requests.Session.post")
+@patch("requests.Session.get")
 def test_skip_role_creation_if_exists(mock_get, mock_post, monkeypatch):
     monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", "true", raising=False)
     monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
@@ -146,8 +191,8 @@ def test_skip_role_creation_if_exists(mock_get, mock_post, monkeypatch):
     }
     exists_resp = MagicMock()
     exists_resp.raise_for_status.return_value = None
-    exists_resp.json.return_value = {"roles": [{"ID": "existing"}]}
-    mock_get.side_effect = [role_resp, exists_resp]
+    exists_resp.json.return_value = {"roles": [{"ID": "existing", "definition": {"name": "Custom"}}]}
+    mock_get.side_effect = [role_resp, exists_resp, empty_page()]
 
     mr.main()
     # No creation posts expected
@@ -166,7 +211,7 @@ def test_main_http_error(monkeypatch):
     role_resp.raise_for_status.return_value = None
     role_resp.json.return_value = {"role": {"definition": {"name": mr.SYSTEM_ROLES[0]}}}
 
-    # get_system_role raises HTTPError
+    # listing the target roles raises HTTPError
     def raise_err(*args, **kwargs):
         raise err
 
@@ -174,13 +219,31 @@ def test_main_http_error(monkeypatch):
     monkeypatch.setattr(mr, "SOURCE_ENV_URL", "https://s")
     monkeypatch.setattr(mr, "TARGET_ENV_URL", "https://t")
     monkeypatch.setattr(mr, "get_role", lambda _id: role_resp.json())
-    monkeypatch.setattr(mr, "get_system_role", raise_err)
+    monkeypatch.setattr(mr, "get_target_inventory", raise_err)
     with pytest.raises(requests.exceptions.HTTPError):
         mr.main()
 
 
-@patch("migrate_roles.requests.post")
-@patch("migrate_roles.requests.get")
+def test_main_http_error_before_the_roles_loop(monkeypatch, capsys):
+    class Resp:
+        content = b"boom"
+
+    def raise_err(*args, **kwargs):
+        raise requests.exceptions.HTTPError(response=Resp())
+
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "VALIDATE_POLICIES", True)
+    monkeypatch.setattr(mr, "get_role", lambda role_id: {"role": {"definition": {"name": "Custom"}}})
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": "p"}]})
+    monkeypatch.setattr(mr, "validate_target_policies", raise_err)
+    with pytest.raises(requests.exceptions.HTTPError):
+        mr.main(role_ids=["r1"])
+    out = capsys.readouterr().out
+    assert "migrate_roles HTTP error: boom" in out and "Role creation failed" not in out
+
+
+@patch("requests.Session.post")
+@patch("requests.Session.get")
 def test_migrate_all_missing_source_prints(mock_get, mock_post, monkeypatch):
     monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", "true", raising=False)
     monkeypatch.setattr(mr, "SOURCE_VAULT_ID", None, raising=False)
@@ -190,8 +253,8 @@ def test_migrate_all_missing_source_prints(mock_get, mock_post, monkeypatch):
         mr.main()
 
 
-@patch("migrate_roles.requests.post")
-@patch("migrate_roles.requests.get")
+@patch("requests.Session.post")
+@patch("requests.Session.get")
 def test_custom_role_check_does_not_exist(mock_get, mock_post, monkeypatch):
     monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", "true", raising=False)
     monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
@@ -222,8 +285,8 @@ def test_custom_role_check_does_not_exist(mock_get, mock_post, monkeypatch):
     assert any(r.get("ID") == "new-role" for r in out)
 
 
-@patch("migrate_roles.requests.post")
-@patch("migrate_roles.requests.get")
+@patch("requests.Session.post")
+@patch("requests.Session.get")
 def test_http_error_after_role_name(mock_get, mock_post, monkeypatch):
     # Raise HTTPError during create_role to hit lines 165-166
     class Resp:
@@ -255,8 +318,8 @@ def test_http_error_after_role_name(mock_get, mock_post, monkeypatch):
         mr.main()
 
 
-@patch("migrate_roles.requests.post")
-@patch("migrate_roles.requests.get")
+@patch("requests.Session.post")
+@patch("requests.Session.get")
 def test_generic_exception_after_role_name(mock_get, mock_post, monkeypatch):
     # Raise generic Exception (e.g., in get_role_policies) to hit lines 167-169
     monkeypatch.setattr(mr, "ROLE_IDS", "['rid']", raising=False)
@@ -291,8 +354,421 @@ def test_run_as_script(monkeypatch):
     monkeypatch.setenv("TARGET_VAULT_ID", "tv")
     monkeypatch.setenv("SOURCE_ENV_URL", "https://s")
     monkeypatch.setenv("TARGET_ENV_URL", "https://t")
-    with patch.object(_requests, "get") as g, patch.object(_requests, "post") as p:
+    with patch.object(_requests.Session, "get") as g, patch.object(_requests.Session, "post") as p:
         runpy.run_module("migrate_roles", run_name="__main__")
         # ROLE_IDS is [] so no network calls expected
         assert g.call_count == 0
         assert p.call_count == 0
+
+
+@patch("requests.Session.get")
+def test_find_role_by_name(mock_get, monkeypatch):
+    monkeypatch.setattr(mr, "TARGET_ENV_URL", "https://t")
+    found = MagicMock()
+    found.json.return_value = {"roles": [{"ID": "tr1"}]}
+    missing = MagicMock()
+    missing.json.return_value = {"roles": []}
+    mock_get.side_effect = [found, missing]
+    assert mr.find_role("Custom") == {"ID": "tr1"}
+    assert mr.find_role("Custom") is None
+
+
+def test_main_uses_given_role_ids(monkeypatch):
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "ROLE_IDS", "['from-env']", raising=False)
+    seen = []
+
+    def get_role(role_id):
+        seen.append(role_id)
+        return {"role": {"definition": {"name": mr.SYSTEM_ROLES[0]}}}
+
+    monkeypatch.setattr(mr, "get_role", get_role)
+    monkeypatch.setattr(mr, "get_target_inventory", lambda target_vault_id=None: MagicMock(find=lambda kind, name: "sys"))
+    out = mr.main(role_ids=(role_id for role_id in ["a", "b"]))
+    assert seen == ["a", "b"]
+    assert out == [{"ID": "sys"}, {"ID": "sys"}]
+
+
+@patch("requests.Session.post")
+@patch("migrate_roles.migrate_policies")
+def test_main_coalesces_shared_policy_assignments(mock_migrate_policies, mock_post, monkeypatch):
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", None, raising=False)
+    monkeypatch.setattr(mr, "TARGET_ENV_URL", "https://t")
+    monkeypatch.setattr(
+        mr,
+        "get_role",
+        lambda role_id: {"role": {"definition": {"name": role_id, "permissions": []}}},
+    )
+    monkeypatch.setattr(mr, "create_role", lambda role: {"ID": f"new-{role['roleDefinition']['name']}"})
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": "p"}]})
+    mock_migrate_policies.return_value = [{"ID": "np"}]
+
+    mr.main(role_ids=["r1", "r2"])
+    assert mock_post.call_count == 1
+    assert mock_post.call_args.kwargs["json"] == {"ID": "np", "roleIDs": ["new-r1", "new-r2"]}
+
+
+@patch("requests.Session.post")
+@patch("migrate_roles.migrate_policies")
+def test_main_assigns_the_policies_of_created_roles_when_a_role_fails(mock_migrate_policies, mock_post, monkeypatch):
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", None, raising=False)
+    monkeypatch.setattr(mr, "TARGET_ENV_URL", "https://t")
+    monkeypatch.setattr(
+        mr,
+        "get_role",
+        lambda role_id: {"role": {"definition": {"name": role_id, "permissions": []}}},
+    )
+
+    def create_role(role):
+        if role["roleDefinition"]["name"] == "r2":
+            raise RuntimeError("create failed")
+        return {"ID": "new-r1"}
+
+    monkeypatch.setattr(mr, "create_role", create_role)
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": "p"}]})
+    mock_migrate_policies.return_value = [{"ID": "np"}]
+
+    with pytest.raises(RuntimeError):
+        mr.main(role_ids=["r1", "r2"])
+    assert mock_post.call_count == 1
+    assert mock_post.call_args.kwargs["json"] == {"ID": "np", "roleIDs": ["new-r1"]}
+
+
+@patch("requests.Session.get")
+def test_existence_checks_list_target_roles_once(mock_get, monkeypatch):
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", "true", raising=False)
+    monkeypatch.setattr(mr, "TARGET_ENV_URL", "https://t")
+    monkeypatch.setattr(mr, "TARGET_VAULT_ID", "tv")
+    roles = MagicMock()
+    roles.json.return_value = {
+        "roles": [
+            {"ID": "owner", "definition": {"name": "VAULT_OWNER"}},
+            {"ID": "existing", "definition": {"name": "Custom"}},
+        ]
+    }
+    mock_get.side_effect = [roles, empty_page()]
+    assert mr.find_existing_role("VAULT_OWNER") == {"ID": "owner"}
+    assert mr.find_existing_role("Custom") == {"ID": "existing"}
+    assert mr.find_existing_role("New") is None
+    assert mock_get.call_count == 2
+    with pytest.raises(ValueError):
+        mr.find_existing_role("VAULT_EDITOR")
+
+
+@patch("requests.Session.post")
+@patch("requests.Session.get")
+def test_created_roles_are_added_to_the_inventory(mock_get, mock_post, monkeypatch):
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", "true", raising=False)
+    monkeypatch.setattr(mr, "TARGET_ENV_URL", "https://t")
+    roles = MagicMock()
+    roles.json.return_value = {"roles": []}
+    mock_get.return_value = roles
+    mock_post.return_value.json.return_value = {"ID": "new-role"}
+    assert mr.find_existing_role("Custom") is None
+    mr.create_role({"roleDefinition": {"name": "Custom"}})
+    assert mr.find_existing_role("Custom") == {"ID": "new-role"}
+
+
+@patch("requests.Session.post")
+@patch("migrate_roles.migrate_policies")
+def test_resume_skips_journaled_roles(mock_migrate_policies, mock_post, journal_path, monkeypatch):
+    import journal
+
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", None, raising=False)
+    monkeypatch.setattr(mr, "TARGET_ENV_URL", "https://t")
+    fetched = []
+
+    def get_role(role_id):
+        fetched.append(role_id)
+        return {"role": {"definition": {"name": role_id, "permissions": []}}}
+
+    monkeypatch.setattr(mr, "get_role", get_role)
+    monkeypatch.setattr(mr, "create_role", lambda role: {"ID": f"new-{role['roleDefinition']['name']}"})
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": "p"}]})
+    mock_migrate_policies.return_value = [{"ID": "np"}]
+    journal.record("roles", "r1", "new-r1")
+    monkeypatch.setattr(journal, "RESUME", True)
+
+    out = mr.main(role_ids=["r1", "r2"])
+    assert out == [{"ID": "new-r1"}, {"ID": "new-r2"}]
+    assert fetched == ["r2"]
+    # the policies of a journaled role are assigned before it is recorded
+    assert mock_post.call_args.kwargs["json"] == {"ID": "np", "roleIDs": ["new-r2"]}
+    assert journal.completed("roles", "r2") == "new-r2"
+
+
+@patch("requests.Session.post")
+@patch("migrate_roles.migrate_policies")
+def test_delta_sync_roles(mock_migrate_policies, mock_post, id_mapping_store, monkeypatch, capsys):
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", None, raising=False)
+    monkeypatch.setattr(mr, "DELTA_SYNC", True)
+    monkeypatch.setattr(mr, "TARGET_VAULT_ID", "tv")
+    monkeypatch.setattr(mr, "TARGET_ENV_URL", "https://t")
+    description = ["first"]
+    monkeypatch.setattr(
+        mr,
+        "get_role",
+        lambda role_id: {"role": {"definition": {"name": role_id, "description": description[0], "permissions": []}}},
+    )
+    created = []
+    monkeypatch.setattr(mr, "create_role", lambda role: created.append(role) or {"ID": "t1"})
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": "p"}]})
+    mock_migrate_policies.return_value = [{"ID": "np"}]
+
+    assert mr.main(role_ids=["r1"]) == [{"ID": "t1"}]
+    assert len(created) == 1 and mock_post.call_count == 1
+    assert mock_post.call_args.kwargs["json"] == {"ID": "np", "roleIDs": ["t1"]}
+
+    # an unchanged role is skipped, its policies are still synced
+    assert mr.main(role_ids=["r1"]) == [{"ID": "t1"}]
+    assert len(created) == 1 and mock_post.call_count == 1
+    assert mock_migrate_policies.call_count == 2
+
+    # a changed role is reported until its update by hand is acknowledged
+    import delta_sync
+
+    description[0] = "second"
+    assert mr.main(role_ids=["r1"]) == [{"ID": "t1"}]
+    assert "update Target ROLE_ID: t1 manually and list r1 in DELTA_SYNC_ACKNOWLEDGED" in capsys.readouterr().out
+    monkeypatch.setattr(delta_sync, "DELTA_SYNC_ACKNOWLEDGED", "['r1']")
+    assert mr.main(role_ids=["r1"]) == [{"ID": "t1"}]
+    assert "updated by hand, marked as synced" in capsys.readouterr().out
+    monkeypatch.setattr(delta_sync, "DELTA_SYNC_ACKNOWLEDGED", None)
+    assert mr.main(role_ids=["r1"]) == [{"ID": "t1"}]
+    assert "Role r1 unchanged since the last sync" in capsys.readouterr().out
+    assert len(created) == 1 and mock_post.call_count == 1
+
+
+@patch("requests.Session.post")
+@patch("migrate_roles.migrate_policies")
+def test_main_migrates_into_the_given_target_vault(mock_migrate_policies, mock_post, monkeypatch):
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", None, raising=False)
+    monkeypatch.setattr(mr, "TARGET_VAULT_ID", "default")
+    monkeypatch.setattr(
+        mr, "get_role", lambda role_id: {"role": {"definition": {"name": role_id, "permissions": []}}}
+    )
+    created = []
+    monkeypatch.setattr(mr, "create_role", lambda role: created.append(role) or {"ID": "t1"})
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": "p"}]})
+    mock_migrate_policies.return_value = [{"ID": "np"}]
+
+    assert mr.main(["r1"], "other") == [{"ID": "t1"}]
+    assert created[0]["resource"] == {"ID": "other", "type": "VAULT"}
+    mock_migrate_policies.assert_called_once_with(["p"], "other")
+
+
+def test_main_only_migrates_the_roles_of_its_shard(monkeypatch):
+    import sharding
+
+    monkeypatch.setattr(sharding, "SHARD", "1/2")
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    role_policies = {f"r{index}": [f"p{index // 2}"] for index in range(8)}
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": p} for p in role_policies[role_id]]})
+    monkeypatch.setattr(mr, "get_role", lambda role_id: {"role": {"definition": {"name": role_id}}})
+    monkeypatch.setattr(mr, "find_existing_role", lambda name, target_vault_id=None: {"ID": f"t-{name}"})
+
+    created = mr.main([f"r{index}" for index in range(8)])
+
+    migrated = [role["ID"][2:] for role in created]
+    # roles sharing a policy stay together
+    assert migrated == sharding.select_shard(
+        [f"r{index}" for index in range(8)], dependencies=mr.role_policy_ids, shard=(1, 2)
+    )
+    for index in range(0, 8, 2):
+        assert (f"r{index}" in migrated) == (f"r{index + 1}" in migrated)
+
+
+def test_main_validates_the_policies_of_the_roles_first(journal_path, monkeypatch):
+    import journal
+
+    monkeypatch.setattr(mr, "VALIDATE_POLICIES", True)
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", "true", raising=False)
+    names = {"r1": "Custom", "r2": "Other", "r3": "VAULT_OWNER", "r4": "Existing"}
+    monkeypatch.setattr(mr, "get_role", lambda role_id: {"role": {"definition": {"name": names[role_id]}}})
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": f"{role_id}-p"}]})
+    inventory = MagicMock()
+    inventory.find.side_effect = lambda kind, name: "existing-id" if name == "Existing" else None
+    monkeypatch.setattr(mr, "get_target_inventory", lambda target_vault_id=None: inventory)
+    validated = []
+    journal.record("roles", "r5", "new-r5")
+    monkeypatch.setattr(journal, "RESUME", True)
+
+    def validate(policy_ids, target_vault_id):
+        validated.append((policy_ids, target_vault_id))
+        raise ValueError("schema mismatch")
+
+    monkeypatch.setattr(mr, "validate_target_policies", validate)
+    monkeypatch.setattr(mr, "create_role", lambda role: pytest.fail("no role is created"))
+    with pytest.raises(ValueError):
+        mr.main(iter(["r1", "r2", "r3", "r4", "r5"]), "tv")
+    # the system role, the reused role and the migrated role are not created, their policies are not validated
+    assert validated == [(["r1-p", "r2-p"], "tv")]
+
+
+@patch("requests.Session.post")
+def test_shared_policy_is_created_once_and_assigned_to_every_role(mock_post, monkeypatch):
+    import migrate_policies as mp
+
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", None, raising=False)
+    monkeypatch.setattr(mr, "TARGET_ENV_URL", "https://t")
+    monkeypatch.setattr(mr, "get_role", lambda role_id: {"role": {"definition": {"name": role_id, "permissions": []}}})
+    monkeypatch.setattr(mr, "create_role", lambda role: {"ID": f"new-{role['roleDefinition']['name']}"})
+    role_policies = {"r1": ["shared", "own"], "r2": ["shared"]}
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": p} for p in role_policies[role_id]]})
+    fetched = []
+    monkeypatch.setattr(mp, "get_policy", lambda policy_id: fetched.append(policy_id) or {"ID": policy_id})
+    monkeypatch.setattr(mp, "transform_policy_payload", lambda policy, target_vault_id=None: {"name": policy["ID"]})
+    created = []
+    monkeypatch.setattr(mp, "create_policy", lambda payload: created.append(payload["name"]) or {"ID": f"t-{payload['name']}"})
+
+    mr.main(["r1", "r2"], "tv")
+
+    assert fetched == ["shared", "own"] and created == ["shared", "own"]
+    bodies = [c.kwargs["json"] for c in mock_post.call_args_list]
+    assert {"ID": "t-shared", "roleIDs": ["new-r1", "new-r2"]} in bodies
+    assert {"ID": "t-own", "roleIDs": ["new-r1"]} in bodies
+
+
+@patch("requests.Session.get")
+def test_prefetch_indexes_the_policies_of_every_role(mock_get, monkeypatch, capsys):
+    import migrate_policies as mp
+
+    monkeypatch.setattr(mr, "SOURCE_ENV_URL", "https://s")
+    listed = [
+        {"ID": "p1", "name": "P1", "rules": [], "members": [{"ID": "r1", "type": "ROLE"}, {"ID": "r2", "type": "ROLE"}]},
+        {"ID": "p2", "name": "P2", "rules": [], "members": [{"ID": "r1", "type": "ROLE"}, {"ID": "other", "type": "ROLE"}]},
+    ]
+    mock_get.return_value.json.return_value = {"policies": listed}
+    mock_get.side_effect = [mock_get.return_value, empty_page()]
+
+    mr.prefetch_role_policies("sv", ["r1", "r2", "r3"])
+
+    assert mock_get.call_count == 2
+    assert mock_get.call_args_list[0].args[0].startswith("https://s/v1/policies?resource.type=VAULT&resource.ID=sv&")
+    assert [p["ID"] for p in mr.get_role_policies("r1")["policies"]] == ["p1", "p2"]
+    assert [p["ID"] for p in mr.get_role_policies("r2")["policies"]] == ["p1"]
+    assert mr.get_role_policies("r3") == {"policies": []}
+    assert mp.get_policy("p2") == {"policy": listed[1]}
+    assert mock_get.call_count == 2
+    assert "2 policies of the vault sv indexed for 3 roles" in capsys.readouterr().out
+
+
+@patch("requests.Session.get")
+def test_prefetch_without_members_only_caches_the_policies(mock_get, monkeypatch, capsys):
+    import migrate_policies as mp
+
+    mock_get.return_value.json.return_value = {"policies": [{"ID": "p1", "name": "P1", "rules": []}]}
+    mock_get.side_effect = [mock_get.return_value, empty_page()]
+    mr.prefetch_role_policies("sv", ["r1"])
+    assert mp.get_policy("p1") == {"policy": {"ID": "p1", "name": "P1", "rules": []}}
+    mock_get.side_effect = None
+    mock_get.return_value.json.return_value = {"policies": [{"ID": "p9"}]}
+    assert mr.get_role_policies("r1") == {"policies": [{"ID": "p9"}]}
+    assert "Policy members are not listed" in capsys.readouterr().out
+
+
+@patch("requests.Session.get")
+def test_prefetch_fetches_the_policies_listed_without_rules(mock_get, monkeypatch):
+    import migrate_policies as mp
+
+    mock_get.return_value.json.return_value = {
+        "policies": [{"ID": "p1", "name": "P1", "members": [{"ID": "r1", "type": "ROLE"}]}]
+    }
+    mock_get.side_effect = [mock_get.return_value, empty_page()]
+    mr.prefetch_role_policies("sv", ["r1"])
+    assert [p["ID"] for p in mr.get_role_policies("r1")["policies"]] == ["p1"]
+    mock_get.side_effect = None
+    mock_get.return_value.json.return_value = {"policy": {"ID": "p1", "name": "P1", "rules": []}}
+    assert mp.get_policy("p1") == {"policy": {"ID": "p1", "name": "P1", "rules": []}}
+    assert mock_get.call_count == 3
+
+
+def test_main_prefetches_the_role_policies_of_the_source_vault(monkeypatch):
+    monkeypatch.setattr(mr, "PREFETCH_POLICIES", True)
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "SOURCE_VAULT_ID", "default")
+    prefetched = []
+    monkeypatch.setattr(mr, "prefetch_role_policies", lambda vault_id, role_ids: prefetched.append((vault_id, role_ids)))
+    monkeypatch.setattr(mr, "get_role", lambda role_id: {"role": {"definition": {"name": role_id}}})
+    monkeypatch.setattr(mr, "find_existing_role", lambda name, target_vault_id=None: {"ID": f"t-{name}"})
+
+    assert mr.main(iter(["r1", "r2"]), "tv", "sv") == [{"ID": "t-r1"}, {"ID": "t-r2"}]
+    mr.main(["r3"], "tv")
+    assert prefetched == [("sv", ["r1", "r2"]), ("default", ["r3"])]
+
+
+def test_prefetch_role_skips_migrated_roles(monkeypatch):
+    monkeypatch.setattr(mr, "completed", lambda kind, role_id: "t1")
+    monkeypatch.setattr(mr, "get_role", lambda role_id: pytest.fail("a migrated role is not read"))
+    mr.prefetch_role("r1")
+
+
+def test_prefetch_role_skips_the_policies_of_reused_roles(monkeypatch):
+    monkeypatch.setattr(mr, "completed", lambda kind, role_id: None)
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", "true", raising=False)
+    names = {"r1": "VAULT_OWNER", "r2": "Existing", "r3": "Custom"}
+    monkeypatch.setattr(mr, "get_role", lambda role_id: {"role": {"definition": {"name": names[role_id]}}})
+    monkeypatch.setattr(mr, "get_role_policies", lambda role_id: {"policies": [{"ID": f"{role_id}-p"}]})
+    inventory = MagicMock()
+    inventory.find.side_effect = lambda kind, name: "existing-id" if name == "Existing" else None
+    monkeypatch.setattr(mr, "get_target_inventory", lambda target_vault_id=None: inventory)
+    fetched = []
+    monkeypatch.setattr(mr, "get_policy", fetched.append)
+    for role_id in names:
+        mr.prefetch_role(role_id, "tv")
+    assert fetched == ["r3-p"]
+
+
+@patch("requests.Session.post")
+def test_main_reads_the_next_roles_while_writing(mock_post, monkeypatch):
+    import migrate_policies as mp
+    import threading
+
+    monkeypatch.setattr(mr, "PREFETCH_DEPTH", 2)
+    monkeypatch.setattr(mr, "MIGRATE_ALL_ROLES", None, raising=False)
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", None, raising=False)
+    read = {}
+    all_read = threading.Event()
+
+    def fetch(kind):
+        def read_source(resource_id):
+            read.setdefault((kind, resource_id), threading.get_ident())
+            if len(read) == 7:
+                all_read.set()
+            if kind == "roles":
+                return {"role": {"definition": {"name": resource_id, "permissions": []}}}
+            return {"policies": [{"ID": f"{resource_id}-p"}]}
+        return read_source
+
+    monkeypatch.setattr(mr, "get_role", fetch("roles"))
+    monkeypatch.setattr(mr, "get_role_policies", fetch("roles/policies"))
+    monkeypatch.setattr(mr, "get_policy", fetch("policies"))
+    monkeypatch.setattr(mp, "get_policy", lambda policy_id: {"ID": policy_id})
+    monkeypatch.setattr(mp, "transform_policy_payload", lambda policy, target_vault_id=None: {"name": policy["ID"]})
+    monkeypatch.setattr(mp, "create_policy", lambda payload: {"ID": f"t-{payload['name']}"})
+    monkeypatch.setattr(mr, "find_existing_role", lambda name, target_vault_id=None: {"ID": "owner"} if name == "VAULT_OWNER" else None)
+    created = []
+
+    def create_role(role):
+        if not created:
+            # the first role is written once the next ones are read
+            assert all_read.wait(5)
+        created.append(role["roleDefinition"]["name"])
+        return {"ID": f"t-{role['roleDefinition']['name']}"}
+
+    monkeypatch.setattr(mr, "create_role", create_role)
+
+    roles = mr.main(["r1", "r2", "VAULT_OWNER"], "tv")
+
+    assert roles == [{"ID": "t-r1"}, {"ID": "t-r2"}, {"ID": "owner"}]
+    assert created == ["r1", "r2"]
+    # the prefetch thread read both roles, their policies and the system role
+    assert {thread for thread in read.values()} != {threading.get_ident()}
+    assert ("policies", "r2-p") in read and ("roles", "VAULT_OWNER") in read
@@ -19,14 +19,14 @@ def test_transform_service_account_payload_strips_fields():
     assert "ID" not in svc and "namespace" not in svc and "BasicAudit" not in svc
 
 
-@patch("migrate_service_accounts.migrate_roles")
-@patch("migrate_service_accounts.requests.post")
-@patch("migrate_service_accounts.requests.get")
-def test_main_creates_sa_and_assigns_roles(
-    mock_get, mock_post, mock_migrate_roles, monkeypatch
-):
+@patch("requests.Session.post")
+@patch("requests.Session.get")
+def test_main_creates_sa_and_assigns_roles(mock_get, mock_post, monkeypatch):
     monkeypatch.setattr(msa, "SOURCE_ENV_URL", "https://s")
     monkeypatch.setattr(msa, "TARGET_ENV_URL", "https://t")
+    monkeypatch.setattr(
+        msa, "crawl_role", lambda role_id: ({"role": {"definition": {"name": role_id}}}, {"ID": f"n{role_id}"}, [])
+    )
 
     get_sa = MagicMock()
     get_sa.raise_for_status.return_value = None
@@ -59,14 +59,14 @@ def test_main_creates_sa_and_assigns_roles(
 
     mock_post.side_effect = [create_sa, assign_role, assign_role]
 
-    mock_migrate_roles.return_value = [{"ID": "nr1"}, {"ID": "nr2"}]
-
     created = msa.main(service_accounts_ids=["sa1"])
     assert created and created[0]["clientID"] == "new-sa"
+    assigned = [c.kwargs["json"]["ID"] for c in mock_post.call_args_list[1:]]
+    assert assigned == ["nr1", "nr2"]
 
 
-@patch("migrate_service_accounts.requests.post")
-@patch("migrate_service_accounts.requests.get")
+@patch("requests.Session.post")
+@patch("requests.Session.get")
 def test_main_no_roles_found(mock_get, mock_post, monkeypatch):
     monkeypatch.setattr(msa, "SOURCE_ENV_URL", "https://s")
     monkeypatch.setattr(msa, "TARGET_ENV_URL", "https://t")
@@ -126,6 +126,7 @@ def test_generic_exception_branch(monkeypatch):
             }
         },
     )
+    monkeypatch.setattr(msa, "list_service_account_roles", lambda _id: {"roleToResource": []})
     monkeypatch.setattr(msa, "transform_service_account_payload", lambda x: x)
     monkeypatch.setattr(
         msa,
@@ -142,8 +143,239 @@ def test_run_as_script(monkeypatch):
     import requests as _requests
 
     monkeypatch.setenv("SERVICE_ACCOUNT_IDS", "[]")
-    with patch.object(_requests, "get") as g, patch.object(_requests, "post") as p:
+    with patch.object(_requests.Session, "get") as g, patch.object(_requests.Session, "post") as p:
         runpy.run_module("migrate_service_accounts", run_name="__main__")
         # ROLE_IDS is [], so no network calls should be made
         assert g.call_count == 0
         assert p.call_count == 0
+
+
+@patch("requests.Session.get")
+def test_find_service_account_by_name(mock_get, monkeypatch):
+    monkeypatch.setattr(msa, "TARGET_ENV_URL", "https://t")
+    found = MagicMock()
+    found.json.return_value = {"serviceAccounts": [{"ID": "tsa"}]}
+    missing = MagicMock()
+    missing.json.return_value = {"serviceAccounts": []}
+    mock_get.side_effect = [found, missing]
+    assert msa.find_service_account("SA") == {"clientID": "tsa"}
+    assert msa.find_service_account("SA") is None
+    assert mock_get.call_args_list[0].args[0].endswith("/v1/serviceAccounts?name=SA")
+
+
+@patch("requests.Session.post")
+def test_main_groups_members_by_role(mock_post, monkeypatch):
+    monkeypatch.setattr(msa, "TARGET_ENV_URL", "https://t")
+    monkeypatch.setattr(
+        msa,
+        "get_service_account",
+        lambda sa_id: {"serviceAccount": {"ID": sa_id, "namespace": "n", "BasicAudit": {}, "name": sa_id}},
+    )
+    monkeypatch.setattr(
+        msa, "create_service_account", lambda sa: {"clientID": f"new-{sa['serviceAccount']['name']}"}
+    )
+    monkeypatch.setattr(
+        msa, "list_service_account_roles", lambda sa_id: {"roleToResource": [{"role": {"ID": "r"}}]}
+    )
+    monkeypatch.setattr(msa, "crawl_role", lambda role_id: ({}, {"ID": "nr"}, []))
+
+    msa.main(service_accounts_ids=["sa1", "sa2"])
+    assert mock_post.call_count == 1
+    assert mock_post.call_args.kwargs["json"] == {
+        "ID": "nr",
+        "members": [
+            {"type": "SERVICE_ACCOUNT", "ID": "new-sa1"},
+            {"type": "SERVICE_ACCOUNT", "ID": "new-sa2"},
+        ],
+    }
+
+
+def role_info(name):
+    return {"role": {"definition": {"name": name, "permissions": []}}}
+
+
+@patch("requests.Session.post")
+def test_main_migrates_shared_roles_and_policies_once(mock_post, monkeypatch):
+    monkeypatch.setattr(msa, "TARGET_ENV_URL", "https://t")
+    monkeypatch.setattr(
+        msa,
+        "get_service_account",
+        lambda sa_id: {"serviceAccount": {"ID": sa_id, "namespace": "n", "BasicAudit": {}, "name": sa_id}},
+    )
+    sa_roles = {"sa1": ["r1", "r2"], "sa2": ["r2", "sys"]}
+    monkeypatch.setattr(
+        msa,
+        "list_service_account_roles",
+        lambda sa_id: {"roleToResource": [{"role": {"ID": r}} for r in sa_roles[sa_id]]},
+    )
+    fetched_roles = []
+
+    def get_role(role_id):
+        fetched_roles.append(role_id)
+        return role_info(role_id)
+
+    monkeypatch.setattr(msa, "get_role", get_role)
+    monkeypatch.setattr(msa, "find_existing_role", lambda name: {"ID": "t-sys"} if name == "sys" else None)
+    role_policies = {"r1": ["p1", "p2"], "r2": ["p2"]}
+    monkeypatch.setattr(
+        msa, "get_role_policies", lambda role_id: {"policies": [{"ID": p} for p in role_policies[role_id]]}
+    )
+    order = []
+
+    def migrate_policy(policy_id):
+        order.append(policy_id)
+        return {"ID": f"t-{policy_id}"}
+
+    def create_role(role):
+        order.append(role["roleDefinition"]["name"])
+        return {"ID": f"t-{role['roleDefinition']['name']}"}
+
+    def create_service_account(sa):
+        order.append(sa["serviceAccount"]["name"])
+        return {"clientID": f"t-{sa['serviceAccount']['name']}"}
+
+    monkeypatch.setattr(msa, "migrate_policy", migrate_policy)
+    monkeypatch.setattr(msa, "create_role", create_role)
+    monkeypatch.setattr(msa, "create_service_account", create_service_account)
+
+    created = msa.main(service_accounts_ids=["sa1", "sa2"])
+    assert created == [{"clientID": "t-sa1"}, {"clientID": "t-sa2"}]
+    assert sorted(fetched_roles) == ["r1", "r2", "sys"]
+    # every policy is created once, before the roles, which precede the service accounts
+    assert sorted(order[:2]) == ["p1", "p2"]
+    assert sorted(order[2:4]) == ["r1", "r2"]
+    assert sorted(order[4:]) == ["sa1", "sa2"]
+    bodies = [c.kwargs["json"] for c in mock_post.call_args_list]
+    assert {"ID": "t-p2", "roleIDs": ["t-r1", "t-r2"]} in bodies
+    assert {"ID": "t-p1", "roleIDs": ["t-r1"]} in bodies
+    assert {
+        "ID": "t-r2",
+        "members": [
+            {"type": "SERVICE_ACCOUNT", "ID": "t-sa1"},
+            {"type": "SERVICE_ACCOUNT", "ID": "t-sa2"},
+        ],
+    } in bodies
+    assert {"ID": "t-sys", "members": [{"type": "SERVICE_ACCOUNT", "ID": "t-sa2"}]} in bodies
+    assert len(bodies) == 5
+
+
+@patch("requests.Session.post")
+def test_main_assigns_the_policies_of_created_roles_when_a_service_account_fails(mock_post, monkeypatch):
+    monkeypatch.setattr(msa, "TARGET_ENV_URL", "https://t")
+    monkeypatch.setattr(
+        msa,
+        "get_service_account",
+        lambda sa_id: {"serviceAccount": {"ID": sa_id, "namespace": "n", "BasicAudit": {}, "name": sa_id}},
+    )
+    monkeypatch.setattr(
+        msa, "list_service_account_roles", lambda sa_id: {"roleToResource": [{"role": {"ID": "r1"}}]}
+    )
+    monkeypatch.setattr(msa, "get_role", role_info)
+    monkeypatch.setattr(msa, "find_existing_role", lambda name: None)
+    monkeypatch.setattr(msa, "get_role_policies", lambda role_id: {"policies": [{"ID": "p1"}]})
+    monkeypatch.setattr(msa, "migrate_policy", lambda policy_id: {"ID": f"t-{policy_id}"})
+    monkeypatch.setattr(msa, "create_role", lambda role: {"ID": f"t-{role['roleDefinition']['name']}"})
+
+    def create_service_account(sa):
+        raise RuntimeError("create failed")
+
+    monkeypatch.setattr(msa, "create_service_account", create_service_account)
+
+    with pytest.raises(RuntimeError):
+        msa.main(service_accounts_ids=["sa1"])
+    bodies = [c.kwargs["json"] for c in mock_post.call_args_list]
+    assert bodies == [{"ID": "t-p1", "roleIDs": ["t-r1"]}]
+
+
+@patch("requests.Session.post")
+def test_resume_skips_journaled_service_accounts_and_roles(mock_post, journal_path, monkeypatch):
+    import journal
+
+    monkeypatch.setattr(msa, "TARGET_ENV_URL", "https://t")
+    fetched = []
+
+    def get_service_account(sa_id):
+        fetched.append(sa_id)
+        return {"serviceAccount": {"ID": sa_id, "namespace": "n", "BasicAudit": {}, "name": sa_id}}
+
+    def crawl_role(role_id):
+        fetched.append(role_id)
+        return role_info(role_id), None, []
+
+    monkeypatch.setattr(msa, "get_service_account", get_service_account)
+    monkeypatch.setattr(
+        msa, "list_service_account_roles", lambda sa_id: {"roleToResource": [{"role": {"ID": "r1"}}, {"role": {"ID": "r2"}}]}
+    )
+    monkeypatch.setattr(msa, "crawl_role", crawl_role)
+    monkeypatch.setattr(msa, "create_role", lambda role: {"ID": f"t-{role['roleDefinition']['name']}"})
+    monkeypatch.setattr(
+        msa, "create_service_account", lambda sa: {"clientID": f"t-{sa['serviceAccount']['name']}"}
+    )
+    journal.record("serviceAccounts", "sa1", "t-sa1")
+    journal.record("roles", "r1", "t-r1")
+    monkeypatch.setattr(journal, "RESUME", True)
+
+    created = msa.main(service_accounts_ids=["sa1", "sa2"])
+    assert created == [{"clientID": "t-sa1"}, {"clientID": "t-sa2"}]
+    assert fetched == ["sa2", "r2"]
+    bodies = [c.kwargs["json"] for c in mock_post.call_args_list]
+    assert bodies == [
+        {"ID": "t-r1", "members": [{"type": "SERVICE_ACCOUNT", "ID": "t-sa2"}]},
+        {"ID": "t-r2", "members": [{"type": "SERVICE_ACCOUNT", "ID": "t-sa2"}]},
+    ]
+    assert journal.completed("serviceAccounts", "sa2") == "t-sa2"
+    assert journal.completed("roles", "r2") == "t-r2"
+
+
+def test_existing_roles_are_journaled(journal_path, monkeypatch):
+    import journal
+
+    assert msa.migrate_role_step("r", {}, {"ID": "t-r"}, [], None, {}) == {"ID": "t-r"}
+    assert journal.get_journal().lookup("roles", "r") == "t-r"
+
+
+def test_service_account_dependencies(monkeypatch):
+    monkeypatch.setattr(
+        msa, "list_service_account_roles", lambda sa_id: {"roleToResource": [{"role": {"ID": "r1"}}, {"role": {"ID": "r2"}}]}
+    )
+    monkeypatch.setattr(msa, "get_role_policies", lambda role_id: {"policies": [{"ID": f"{role_id}-p"}]})
+    assert msa.service_account_dependencies("sa1") == [
+        ("role", "r1"),
+        ("role", "r2"),
+        ("policy", "r1-p"),
+        ("policy", "r2-p"),
+    ]
+
+
+def test_main_only_migrates_the_service_accounts_of_its_shard(monkeypatch):
+    import sharding
+
+    monkeypatch.setattr(sharding, "SHARD", "2/2")
+    monkeypatch.setattr(msa, "service_account_dependencies", lambda sa_id: [])
+    migrated = []
+    monkeypatch.setattr(
+        msa,
+        "build_migration_graph",
+        lambda sa_ids, policy_assignments, role_assignments: migrated.extend(sa_ids) or (_ for _ in ()).throw(ValueError("stop")),
+    )
+    sa_ids = [f"sa{index}" for index in range(6)]
+    with pytest.raises(ValueError):
+        msa.main(sa_ids)
+    assert migrated == [sa_id for sa_id in sa_ids if sharding.shard_of(sa_id, 2) == 2]
+
+
+def test_main_validates_the_policies_of_the_graph_first(monkeypatch):
+    from dependency_graph import DependencyGraph
+
+    monkeypatch.setattr(msa, "VALIDATE_POLICIES", True)
+    graph = DependencyGraph()
+    graph.add(("policy", "p1"), lambda results: pytest.fail("nothing is migrated"))
+    graph.add(("role", "r1"), lambda results: pytest.fail("nothing is migrated"), [("policy", "p1")])
+    monkeypatch.setattr(msa, "build_migration_graph", lambda *args: graph)
+    validated = []
+    monkeypatch.setattr(
+        msa, "validate_target_policies", lambda policy_ids: validated.append(policy_ids) or (_ for _ in ()).throw(ValueError("x"))
+    )
+    with pytest.raises(ValueError):
+        msa.main(["sa1"])
+    assert validated == [["p1"]]
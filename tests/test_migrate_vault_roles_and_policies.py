@@ -6,7 +6,7 @@ import migrate_vault_roles_and_policies as mvrp
 
 
 @patch("migrate_vault_roles_and_policies.migrate_roles")
-@patch("migrate_vault_roles_and_policies.requests.get")
+@patch("requests.Session.get")
 def test_main_success(mock_get, mock_migrate_roles, monkeypatch):
     monkeypatch.setattr(mvrp, "SOURCE_VAULT_ID", "sv", raising=False)
     monkeypatch.setattr(mvrp, "SOURCE_ENV_URL", "https://s")
@@ -25,7 +25,7 @@ def test_main_http_error(monkeypatch):
 
     err = requests.exceptions.HTTPError(response=Resp())
 
-    def raise_err():
+    def raise_err(vault_id):
         raise err
 
     monkeypatch.setattr(mvrp, "list_all_vault_custom_roles", raise_err)
@@ -40,7 +40,7 @@ def test_main_generic_exception(monkeypatch):
     monkeypatch.setattr(
         mvrp,
         "list_all_vault_custom_roles",
-        lambda: (_ for _ in ()).throw(ValueError("x")),
+        lambda vault_id: (_ for _ in ()).throw(ValueError("x")),
     )
     with pytest.raises(SystemExit):
         mvrp.main()
@@ -53,17 +53,30 @@ def test_run_as_script(monkeypatch):
     monkeypatch.setenv("SOURCE_VAULT_ID", "sv")
     monkeypatch.setenv("SOURCE_ENV_URL", "https://s")
     # Dummy migrate_roles.main to avoid side effects and assert it was called
-    dummy_main = MagicMock()
+    migrated = []
+    dummy_main = MagicMock(side_effect=lambda role_ids: migrated.extend(role_ids))
     dummy = types.SimpleNamespace(main=dummy_main)
-    sys.modules["migrate_roles"] = dummy
+    monkeypatch.setitem(sys.modules, "migrate_roles", dummy)
 
     r = MagicMock()
     r.raise_for_status.return_value = None
     r.json.return_value = {"roles": []}
-    with patch.object(_requests, "get", return_value=r) as mget:
+    with patch.object(_requests.Session, "get", return_value=r) as mget:
         runpy.run_module("migrate_vault_roles_and_policies", run_name="__main__")
-        # Should fetch once and call migrate_roles with an empty list
+        # Should stream the single (empty) page of roles into migrate_roles
         assert mget.call_count == 1
         assert dummy_main.called
-        args, _ = dummy_main.call_args
-        assert args == ([],)
+        assert migrated == []
+
+
+@patch("migrate_vault_roles_and_policies.migrate_roles")
+def test_plan_mode_does_not_migrate(mock_migrate_roles, monkeypatch):
+    monkeypatch.setattr(mvrp, "PLAN", True)
+    monkeypatch.setattr(mvrp, "list_all_vault_custom_roles", lambda vault_id: iter([{"ID": "r1"}]))
+    planned = []
+    monkeypatch.setattr(mvrp, "build_plan", lambda role_ids: planned.extend(role_ids) or "plan")
+    printed = []
+    monkeypatch.setattr(mvrp, "print_plan", printed.append)
+    mvrp.main()
+    assert planned == ["r1"] and printed == ["plan"]
+    assert not mock_migrate_roles.called
@@ -15,8 +15,8 @@ def test_transform_payload_uses_env_overrides(monkeypatch):
     assert out["workspaceID"] == "ws1"
 
 
-@patch("migrate_vault_schema.requests.post")
-@patch("migrate_vault_schema.requests.get")
+@patch("requests.Session.post")
+@patch("requests.Session.get")
 def test_main_fetches_vault_and_creates(mock_get, mock_post, monkeypatch):
     monkeypatch.setattr(mvs, "SOURCE_VAULT_ID", "sv")
     monkeypatch.setattr(mvs, "WORKSPACE_ID", "ws1")
@@ -40,7 +40,7 @@ def test_main_fetches_vault_and_creates(mock_get, mock_post, monkeypatch):
     assert mock_get.called and mock_post.called
 
 
-@patch("migrate_vault_schema.requests.post")
+@patch("requests.Session.post")
 def test_main_with_config_and_migrate_governance(mock_post, monkeypatch, tmp_path):
     monkeypatch.setattr(mvs, "VAULT_SCHEMA_CONFIG", "config_file", raising=False)
     monkeypatch.setattr(mvs, "WORKSPACE_ID", "ws1", raising=False)
@@ -59,7 +59,7 @@ def test_main_with_config_and_migrate_governance(mock_post, monkeypatch, tmp_pat
     schema_json = '{"schemas": [], "tags": []}'
     # Use a single open mock; we'll assert the append call targeting env file is made
     with patch("builtins.open", mock_open(read_data=schema_json)) as mopen:
-        mvs.main()
+        assert mvs.main() == "v1"
         # Check that the env file was opened for append
         called_paths = [call.args[0] for call in mopen.mock_calls if call[0] == ""]
         # The second open call should be for env_file path
@@ -71,8 +71,8 @@ def test_missing_inputs_and_workspace(monkeypatch):
     monkeypatch.setattr(mvs, "SOURCE_VAULT_ID", None, raising=False)
     monkeypatch.setattr(mvs, "WORKSPACE_ID", None, raising=False)
     # Should early-return without making any network calls
-    with patch("migrate_vault_schema.requests.get") as g, patch(
-        "migrate_vault_schema.requests.post"
+    with patch("requests.Session.get") as g, patch(
+        "requests.Session.post"
     ) as p:
         result = mvs.main()
         assert result is None
@@ -123,6 +123,6 @@ def test_run_as_script(monkeypatch):
         p = MagicMock()
         p.raise_for_status.return_value = None
         p.json.return_value = {"ID": "v1"}
-        with patch.object(_requests, "post", return_value=p) as mpost:
+        with patch.object(_requests.Session, "post", return_value=p) as mpost:
             runpy.run_module("migrate_vault_schema", run_name="__main__")
             assert mpost.call_count == 1
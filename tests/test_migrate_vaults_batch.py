@@ -0,0 +1,93 @@
+import json
+
+import pytest
+import requests
+
+import migrate_roles as mr
+import migrate_vault_schema as mvs
+import migrate_vaults_batch as batch
+
+
+def test_load_manifest(tmp_path):
+    entries = [{"sourceVaultID": "s1", "workspaceID": "w1"}]
+    assert batch.load_manifest(json.dumps(entries)) == entries
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(entries))
+    assert batch.load_manifest(str(path)) == entries
+    with pytest.raises(ValueError, match=r"entry 2 is missing \['workspaceID'\]"):
+        batch.load_manifest(json.dumps(entries + [{"sourceVaultID": "s2"}]))
+
+
+def test_main_isolates_failing_vaults(monkeypatch, capsys):
+    class Resp:
+        content = b"quota exceeded"
+
+    monkeypatch.setattr(
+        batch,
+        "BATCH_MANIFEST",
+        json.dumps(
+            [
+                {"sourceVaultID": "s1", "workspaceID": "w1", "vaultName": "Copy"},
+                {"sourceVaultID": "s2", "workspaceID": "w2"},
+                {"sourceVaultID": "s3", "workspaceID": "w3"},
+            ]
+        ),
+    )
+    monkeypatch.setattr(mvs, "get_vault_details", lambda vault_id: {"vault": {"name": vault_id, "description": "", "schemas": [], "tags": []}})
+    created = []
+
+    def create_vault(payload):
+        created.append(payload)
+        if payload["workspaceID"] == "w3":
+            raise requests.exceptions.HTTPError(response=Resp())
+        return {"ID": f"t-{payload['name']}"}
+
+    monkeypatch.setattr(mvs, "create_vault", create_vault)
+    monkeypatch.setattr(batch, "list_all_vault_custom_roles", lambda vault_id: iter([{"ID": f"{vault_id}-r1"}]))
+    migrated = {}
+
+    def migrate_roles(role_ids, target_vault_id, source_vault_id):
+        role_ids = list(role_ids)
+        if target_vault_id == "t-s2":
+            raise ValueError("role boom")
+        migrated[target_vault_id] = role_ids
+        return [{"ID": "x"} for _ in role_ids]
+
+    monkeypatch.setattr(mr, "main", migrate_roles)
+
+    with pytest.raises(SystemExit):
+        batch.main()
+    out = capsys.readouterr().out
+    assert migrated == {"t-Copy": ["s1-r1"]}
+    assert [payload["workspaceID"] for payload in sorted(created, key=lambda p: p["workspaceID"])] == ["w1", "w2", "w3"]
+    assert "s1 -> t-Copy: 1 roles migrated" in out
+    assert "s2: failed (target vault: t-s2). role boom" in out
+    assert "s3: failed (target vault: not created). quota exceeded" in out
+    assert "1 out of 3 vaults migrated successfully" in out
+
+
+def test_main_success(monkeypatch, capsys):
+    monkeypatch.setattr(batch, "BATCH_MANIFEST", json.dumps([{"sourceVaultID": "s1", "workspaceID": "w1"}]))
+    monkeypatch.setattr(batch, "run_vault", lambda entry: {"sourceVaultID": "s1", "targetVaultID": "t1", "roles": 0, "error": None})
+    batch.main()
+    assert "1 out of 1 vaults migrated successfully" in capsys.readouterr().out
+
+
+def test_main_invalid_input(monkeypatch, capsys):
+    monkeypatch.setattr(batch, "BATCH_MANIFEST", None)
+    with pytest.raises(SystemExit):
+        batch.main()
+    monkeypatch.setattr(batch, "BATCH_MANIFEST", "not json")
+    with pytest.raises(SystemExit):
+        batch.main()
+    out = capsys.readouterr().out
+    assert "BATCH_MANIFEST is missing" in out and "migrate_vaults_batch other error" in out
+
+
+def test_run_as_script(monkeypatch, capsys):
+    import runpy
+
+    monkeypatch.delenv("BATCH_MANIFEST", raising=False)
+    with pytest.raises(SystemExit):
+        runpy.run_module("migrate_vaults_batch", run_name="__main__")
+    assert "BATCH_MANIFEST is missing" in capsys.readouterr().out
@@ -0,0 +1,115 @@
+from unittest.mock import MagicMock, patch
+
+import migrate_roles as mr
+import migration_plan as plan_module
+
+
+def setup_source(monkeypatch, target_roles, target_policies):
+    roles = {
+        "r1": {"name": "Custom1", "policies": ["p1", "p2"]},
+        "r2": {"name": "Custom2", "policies": ["p2"]},
+        "r3": {"name": "VAULT_OWNER", "policies": []},
+        "r4": {"name": "Existing", "policies": ["p3"]},
+    }
+    monkeypatch.setattr(
+        plan_module.migrate_roles,
+        "get_role",
+        lambda role_id: {"role": {"definition": {"name": roles[role_id]["name"]}}},
+    )
+    monkeypatch.setattr(
+        plan_module.migrate_roles,
+        "get_role_policies",
+        lambda role_id: {"policies": [{"ID": p} for p in roles[role_id]["policies"]]},
+    )
+    monkeypatch.setattr(plan_module, "get_policy", lambda policy_id: {"policy": {"name": policy_id.upper()}})
+    index = {"roles": target_roles, "policies": target_policies}
+    monkeypatch.setattr(
+        mr, "get_target_inventory", lambda: MagicMock(find=lambda kind, name: index[kind].get(name))
+    )
+
+
+def test_plan_counts_calls_and_detects_conflicts(monkeypatch):
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", None, raising=False)
+    setup_source(monkeypatch, {"Existing": "t4"}, {"P1": "tp1"})
+
+    plan = plan_module.build_plan(iter(["r1", "r2", "r3", "r4"]))
+    assert plan.calls == {
+        "GET /v1/roles (source vault listing)": 1,
+        "GET /v1/roles (target vault listing)": 1,
+        "GET /v1/roles/{ID}": 4,
+        "GET /v1/roles/{ID}/policies": 3,
+        "POST /v1/roles": 3,
+        "GET /v1/policies/{ID}": 3,
+        "POST /v1/policies": 3,
+        "POST /v1/policies/assign": 3,
+    }
+    assert plan.total_calls == 21
+    assert sorted(plan.conflicts) == [
+        "Policy P1 already exists in the target vault",
+        "Role Existing already exists in the target vault",
+        "SYSTEM_ROLE VAULT_OWNER does not exist in the target vault",
+    ]
+
+
+def test_plan_counts_the_assignment_requests_of_shared_policies(monkeypatch):
+    import assignments
+    import journal
+
+    monkeypatch.setattr(assignments, "ASSIGN_BATCH_SIZE", 0)
+    monkeypatch.setattr(journal, "MIGRATION_JOURNAL", None)
+    assert plan_module.assignment_requests(5) == 1
+    monkeypatch.setattr(assignments, "ASSIGN_BATCH_SIZE", 2)
+    assert plan_module.assignment_requests(5) == 3
+    # a journaled migration assigns the policies of every role on its own
+    monkeypatch.setattr(journal, "MIGRATION_JOURNAL", "journal.jsonl")
+    assert plan_module.assignment_requests(5) == 5
+
+
+def test_plan_reuses_existing_roles_when_skipping(monkeypatch):
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", "true", raising=False)
+    setup_source(monkeypatch, {"Existing": "t4", "VAULT_OWNER": "t3", "Custom2": "t2"}, {})
+
+    plan = plan_module.build_plan(["r2", "r3", "r4"])
+    assert plan.roles_to_create == []
+    assert sorted(plan.roles_reused) == ["Custom2", "Existing", "VAULT_OWNER"]
+    assert plan.conflicts == []
+    assert "POST /v1/roles" not in plan.calls
+
+
+def test_plan_flags_duplicate_role_names(monkeypatch):
+    monkeypatch.setattr(mr, "SKIP_ROLE_CREATION_IF_ROLE_EXISTS", None, raising=False)
+    setup_source(monkeypatch, {}, {})
+    monkeypatch.setattr(
+        plan_module.migrate_roles, "get_role", lambda role_id: {"role": {"definition": {"name": "Same"}}}
+    )
+    monkeypatch.setattr(plan_module.migrate_roles, "get_role_policies", lambda role_id: {"policies": []})
+    plan = plan_module.build_plan(["a", "b"])
+    assert plan.conflicts == ["2 source roles are named Same, only one can be created"]
+
+
+def test_projected_time(monkeypatch):
+    plan = plan_module.MigrationPlan()
+    plan.add_call("POST /v1/roles", 100)
+    with patch("migration_plan.time.monotonic", side_effect=[0, 0.5]):
+        plan.read("GET /v1/roles/{ID}", lambda: None)
+    assert plan.average_latency == 0.5
+    assert plan.projected_seconds(concurrency=1) == 101 * 0.5
+    assert plan.projected_seconds(concurrency=10) == 101 * 0.5 / 10
+    assert plan.projected_seconds(concurrency=10, rate_limit=1) == 101
+    monkeypatch.setattr(plan_module, "PLAN_REQUEST_LATENCY", 2)
+    assert plan.projected_seconds(concurrency=2) == 101
+    assert plan_module.MigrationPlan().projected_seconds() == 0
+
+
+def test_print_plan(capsys):
+    plan = plan_module.MigrationPlan()
+    plan.add_call("POST /v1/policies", 2)
+    plan_module.print_plan(plan, concurrency=4, rate_limit=5)
+    out = capsys.readouterr().out
+    assert "Policies to create: 2" in out
+    assert "rate limit: 5/s" in out
+    assert "No conflicts detected" in out
+    plan.add_conflict("Role R already exists in the target vault")
+    plan_module.print_plan(plan, concurrency=1, rate_limit=0)
+    out = capsys.readouterr().out
+    assert "1 conflicts detected" in out and "rate limit: none" in out
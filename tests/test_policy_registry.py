@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from policy_registry import PolicyRegistry
+
+
+def test_policy_is_migrated_once_per_vault(capsys):
+    registry = PolicyRegistry()
+    calls = []
+
+    def migrate(target_id):
+        return lambda: calls.append(target_id) or {"ID": target_id}
+
+    assert registry.migrate("v1", "p", migrate("t1")) == {"ID": "t1"}
+    assert registry.migrate("v1", "p", migrate("t2")) == {"ID": "t1"}
+    assert registry.migrate("v2", "p", migrate("t3")) == {"ID": "t3"}
+    assert calls == ["t1", "t3"]
+    assert "Policy p already migrated in this run, Target POLICY_ID: t1" in capsys.readouterr().out
+    registry.clear()
+    assert registry.migrate("v1", "p", migrate("t4")) == {"ID": "t4"}
+
+
+def test_concurrent_callers_wait_for_the_first_one():
+    registry = PolicyRegistry()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def migrate():
+        calls.append("p")
+        started.set()
+        release.wait(5)
+        return {"ID": "t"}
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(registry.migrate("v", "p", migrate)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(registry.migrate("v", "p", migrate)))
+    second.start()
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert calls == ["p"]
+    assert results == [{"ID": "t"}, {"ID": "t"}]
+
+
+def test_failed_migrations_are_not_kept():
+    registry = PolicyRegistry()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        registry.migrate("v", "p", fail)
+    assert registry.migrate("v", "p", lambda: {"ID": "t"}) == {"ID": "t"}
@@ -0,0 +1,86 @@
+import copy
+
+import policy_transformer as pt
+
+
+def column_rule(**overrides):
+    rule = {
+        "ID": "sr1",
+        "name": "R1",
+        "ruleExpression": "x > 1",
+        "actions": ["POLICY.read", "POLICY.write"],
+        "resources": ["vault:v/table:users/column:email", "vault:v/table:users/column:ssn"],
+        "resourceType": "COLUMN",
+        "dlpFormat": None,
+    }
+    rule.update(overrides)
+    return rule
+
+
+def test_resource_names():
+    assert pt.column_name("vault:v/table:users/column:email") == "users.email"
+    assert pt.table_name("vault:v/table:orders") == "orders"
+    assert pt.column_group_name("columngroup:pii") == "pii"
+    assert pt.action_name("POLICY.read") == "READ"
+
+
+def test_repeated_resources_are_parsed_once():
+    pt.column_name.cache_clear()
+    first = pt.column_name("vault:v/table:t/column:" + "c" * 40)
+    second = pt.column_name("vault:v/table:t/column:" + "c" * 40)
+    assert first is second
+    assert pt.column_name.cache_info().hits == 1 and pt.column_name.cache_info().misses == 1
+
+
+def test_transform_rule_leaves_the_source_rule_untouched():
+    rule = column_rule()
+    source = copy.deepcopy(rule)
+    assert pt.transform_rule(rule, "tv") == {
+        "name": "R1",
+        "ruleExpression": "x > 1",
+        "columnRuleParams": {
+            "name": "R1",
+            "actions": ["READ", "WRITE"],
+            "action": "READ",
+            "vaultID": "tv",
+            "columns": ["users.email", "users.ssn"],
+        },
+    }
+    assert rule == source
+
+
+def test_transform_rules_updates_the_given_target_rules():
+    rules = [
+        column_rule(),
+        column_rule(name="R2", resourceType="TABLE", resources=["vault:v/table:orders"]),
+        column_rule(name="R3", resourceType="COLUMN_GROUP", resources=["columngroup:pii"]),
+    ]
+    rule_params = pt.transform_rules(iter(rules), "tv", ["t1", None, None])
+    assert [rule_param.get("ID") for rule_param in rule_params] == ["t1", None, None]
+    # an updated rule keeps the ID of its nested params, a new one drops it
+    assert rule_params[0]["columnRuleParams"]["ID"] == "sr1"
+    assert rule_params[1]["tableRuleParams"]["tableName"] == "orders"
+    assert "ID" not in rule_params[1]["tableRuleParams"]
+    assert rule_params[2]["columnGroupRuleParams"]["columnGroups"] == ["pii"]
+
+
+def test_transform_policy():
+    source = {
+        "policy": {
+            "ID": "p",
+            "name": "P",
+            "namespace": "n",
+            "status": "ACTIVE",
+            "BasicAudit": {},
+            "members": [],
+            "rules": [column_rule()],
+        }
+    }
+    payload = pt.transform_policy(source, "tv")
+    assert payload == {
+        "name": "P",
+        "resource": {"ID": "tv", "type": "VAULT"},
+        "ruleParams": [pt.transform_rule(column_rule(), "tv")],
+        "activated": True,
+    }
+    assert source["policy"]["rules"] == [column_rule()]
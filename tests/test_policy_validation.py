@@ -0,0 +1,87 @@
+from unittest.mock import patch
+
+import pytest
+
+import policy_validation as pv
+
+SCHEMA = [
+    {
+        "name": "users",
+        "fields": [{"name": "email"}, {"name": "ssn"}],
+        "childrenSchemas": [{"name": "addresses", "fields": [{"name": "city"}]}],
+    },
+    {"name": "orders"},
+]
+
+
+def column_rule(name, *columns):
+    return {"name": name, "columnRuleParams": {"columns": list(columns)}}
+
+
+def test_index_schema():
+    assert pv.index_schema(SCHEMA) == {
+        "users": {"email", "ssn"},
+        "addresses": {"city"},
+        "orders": set(),
+    }
+
+
+@patch("requests.Session.get")
+def test_schema_is_fetched_once_per_vault(mock_get, monkeypatch):
+    monkeypatch.setattr(pv, "TARGET_ENV_URL", "https://t")
+    mock_get.return_value.json.return_value = {"vault": {"schemas": SCHEMA}}
+    assert pv.get_schema_index("tv") is pv.get_schema_index("tv")
+    mock_get.assert_called_once_with("https://t/v1/vaults/tv")
+
+
+def test_schema_fetch_only_blocks_lookups_of_its_vault(monkeypatch):
+    import threading
+
+    fetching = threading.Event()
+    release = threading.Event()
+
+    def get_target_vault(vault_id):
+        if vault_id == "slow":
+            fetching.set()
+            assert release.wait(5)
+        return {"vault": {"schemas": SCHEMA}}
+
+    monkeypatch.setattr(pv, "get_target_vault", get_target_vault)
+    slow = threading.Thread(target=pv.get_schema_index, args=("slow",))
+    slow.start()
+    assert fetching.wait(5)
+    # answered while the schema of the other vault is still being fetched
+    assert "users" in pv.get_schema_index("fast")
+    release.set()
+    slow.join()
+    assert "users" in pv.get_schema_index("slow")
+
+
+def test_rule_errors():
+    index = pv.index_schema(SCHEMA)
+    assert pv.rule_errors("P", column_rule("R", "users.email", "addresses.city"), index) == []
+    assert pv.rule_errors("P", column_rule("R", "users.phone", "cards.number"), index) == [
+        "policy P rule R references the missing column users.phone",
+        "policy P rule R references the missing table cards",
+    ]
+    assert pv.rule_errors("P", {"name": "T", "tableRuleParams": {"tableName": "orders"}}, index) == []
+    assert pv.rule_errors("P", {"name": "T", "tableRuleParams": {"tableName": "carts"}}, index) == [
+        "policy P rule T references the missing table carts"
+    ]
+    assert pv.rule_errors("P", {"name": "G", "columnGroupRuleParams": {"columnGroups": ["pii"]}}, index) == []
+
+
+def test_validate_policies(monkeypatch, capsys):
+    monkeypatch.setattr(pv, "get_target_vault", lambda vault_id: {"vault": {"schemas": SCHEMA}})
+    pv.validate_policies([{"name": "P", "ruleParams": [column_rule("R", "users.ssn")]}], "tv")
+    with pytest.raises(ValueError, match="2 policy rules do not match the schema of the target vault tv"):
+        pv.validate_policies(
+            [
+                {"name": "P1", "ruleParams": [column_rule("R", "users.phone")]},
+                {"name": "P2", "ruleParams": [{"name": "T", "tableRuleParams": {"tableName": "carts"}}]},
+            ],
+            "tv",
+        )
+    out = capsys.readouterr().out
+    assert "Policy rules validated against the schema of the target vault tv" in out
+    assert "-- policy P2 rule T references the missing table carts --" in out
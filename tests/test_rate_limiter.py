@@ -0,0 +1,112 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import requests
+
+import http_client as hc
+import rate_limiter as rl
+
+
+def response(status_code, headers=None):
+    return SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+def test_parse_retry_after_variants():
+    assert rl.parse_retry_after(None, 2.0) == 2.0
+    assert rl.parse_retry_after("3", 2.0) == 3.0
+    assert rl.parse_retry_after("-1", 2.0) == 0.0
+    assert rl.parse_retry_after("not a date", 2.0) == 2.0
+    assert rl.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 2.0) == 0.0
+
+
+def test_success_grows_limit_up_to_max():
+    limiter = rl.AdaptiveLimiter(initial_limit=1, max_limit=2)
+    for _ in range(10):
+        assert limiter.call(lambda: response(200)).status_code == 200
+    assert limiter.limit == 2.0
+    assert limiter.in_flight == 0
+
+
+def test_throttled_response_halves_limit_and_retries():
+    limiter = rl.AdaptiveLimiter(initial_limit=8, max_limit=8, backoff=0)
+    responses = iter([response(429, {"Retry-After": "0.01"}), response(503), response(200)])
+    started = time.monotonic()
+    out = limiter.call(lambda: next(responses))
+    assert out.status_code == 200
+    assert limiter.throttled == 2
+    assert limiter.limit < 8 / 2
+    assert time.monotonic() - started >= 0.01
+
+
+def test_gives_up_after_max_retries():
+    limiter = rl.AdaptiveLimiter(max_retries=1, backoff=0)
+    calls = []
+
+    def send():
+        calls.append(1)
+        return response(429)
+
+    assert limiter.call(send).status_code == 429
+    assert len(calls) == 2
+    assert limiter.limit >= limiter.min_limit
+
+
+def test_exception_releases_slot_without_adjusting_limit():
+    limiter = rl.AdaptiveLimiter(initial_limit=2)
+
+    def boom():
+        raise requests.exceptions.ConnectionError("down")
+
+    try:
+        limiter.call(boom)
+    except requests.exceptions.ConnectionError:
+        pass
+    assert limiter.in_flight == 0 and limiter.limit == 2.0
+
+
+def test_acquire_blocks_when_limit_reached():
+    limiter = rl.AdaptiveLimiter(initial_limit=1, max_limit=1)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def worker():
+        limiter.acquire()
+        acquired.set()
+        limiter.release()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert not acquired.wait(0.05)
+    limiter.release()
+    thread.join(1)
+    assert acquired.is_set()
+
+
+def test_limited_session_routes_requests_through_limiter():
+    limiter = rl.AdaptiveLimiter(backoff=0)
+    session = hc.LimitedSession(limiter)
+    throttled = response(429)
+    ok = response(200)
+    with patch.object(requests.Session, "request", side_effect=[throttled, ok]) as req:
+        assert session.get("https://t/v1/roles") is ok
+        assert req.call_count == 2
+    assert limiter.throttled == 1
+
+
+def test_unavailable_non_idempotent_requests_are_not_sent_again():
+    limiter = rl.AdaptiveLimiter(initial_limit=8, backoff=0)
+    responses = iter([response(429), response(503), response(200)])
+    assert limiter.call(lambda: next(responses), idempotent=False).status_code == 503
+    assert limiter.throttled == 2 and limiter.limit == 2.0
+
+
+def test_limited_session_only_retries_unavailable_idempotent_methods():
+    session = hc.LimitedSession(rl.AdaptiveLimiter(backoff=0))
+    with patch.object(requests.Session, "request", side_effect=[response(503), response(200)]) as req:
+        assert session.put("https://t/v1/roles/r1").status_code == 200
+        assert req.call_count == 2
+    with patch.object(requests.Session, "request", side_effect=[response(503), response(200)]) as req:
+        assert session.post("https://t/v1/roles").status_code == 503
+        assert req.call_count == 1
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import retry
+
+
+def http_error(status_code):
+    return requests.exceptions.HTTPError(response=SimpleNamespace(status_code=status_code))
+
+
+def test_is_transient():
+    assert retry.is_transient(http_error(502))
+    assert not retry.is_transient(http_error(409))
+    assert retry.is_transient(requests.exceptions.ConnectionError())
+    assert retry.is_transient(requests.exceptions.Timeout())
+    assert not retry.is_transient(ValueError())
+
+
+def test_backoff_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(retry, "RETRY_BACKOFF", 1)
+    monkeypatch.setattr(retry, "RETRY_MAX_BACKOFF", 5)
+    assert all(0 <= retry.backoff_delay(10) <= 5 for _ in range(20))
+
+
+def test_create_idempotently_returns_first_success():
+    assert retry.create_idempotently(lambda: {"ID": "new"}, lambda: None, "role r") == {"ID": "new"}
+
+
+def test_create_idempotently_detects_landed_attempt(monkeypatch):
+    monkeypatch.setattr(retry, "RETRY_BACKOFF", 0)
+    calls = []
+
+    def create():
+        calls.append(1)
+        raise http_error(500)
+
+    out = retry.create_idempotently(create, lambda: {"ID": "existing"}, "role r")
+    assert out == {"ID": "existing"}
+    assert len(calls) == 1
+
+
+def test_create_idempotently_retries_until_success(monkeypatch):
+    monkeypatch.setattr(retry, "RETRY_BACKOFF", 0)
+    outcomes = [requests.exceptions.ConnectionError(), http_error(503), {"ID": "new"}]
+
+    def create():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert retry.create_idempotently(create, lambda: None, "policy p") == {"ID": "new"}
+
+
+def test_create_idempotently_gives_up(monkeypatch):
+    monkeypatch.setattr(retry, "RETRY_BACKOFF", 0)
+    monkeypatch.setattr(retry, "RETRY_MAX_ATTEMPTS", 2)
+    calls = []
+
+    def create():
+        calls.append(1)
+        raise http_error(500)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        retry.create_idempotently(create, lambda: None, "policy p")
+    assert len(calls) == 2
+
+
+def test_create_idempotently_does_not_retry_client_errors():
+    calls = []
+
+    def create():
+        calls.append(1)
+        raise http_error(409)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        retry.create_idempotently(create, lambda: None, "policy p")
+    assert len(calls) == 1
@@ -0,0 +1,124 @@
+import json
+import os
+
+import pytest
+
+import journal
+import sharding
+
+
+def test_parse_shard():
+    assert sharding.parse_shard("2/4") == (2, 4)
+    assert sharding.parse_shard(" 1 / 1 ") == (1, 1)
+    for shard in ["0/2", "3/2", "1", "a/b", None]:
+        with pytest.raises(ValueError, match="Invalid shard"):
+            sharding.parse_shard(shard)
+
+
+def test_shard_of_is_stable():
+    # hashed with sha256, not the per process salted hash()
+    assert sharding.shard_of("role1", 4) == sharding.shard_of("role1", 4)
+    assert {sharding.shard_of(f"r{index}", 3) for index in range(50)} == {1, 2, 3}
+
+
+def test_select_shard_without_shard_returns_the_items(monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD", None)
+    ids = iter(["a", "b"])
+    assert sharding.select_shard(ids) is ids
+
+
+def test_shards_partition_the_ids_and_keep_dependents_together(capsys):
+    ids = [f"r{index}" for index in range(40)]
+    # r0-r9 share p0 through a chain, r10 and r11 share p1
+    policies = {f"r{index}": [f"p{index}", f"p{index + 1}"] for index in range(10)}
+    policies.update({"r10": ["q"], "r11": ["q"]})
+    shards = [
+        sharding.select_shard(ids, dependencies=lambda role_id: policies.get(role_id, []), shard=(index, 3))
+        for index in range(1, 4)
+    ]
+    assert sorted(role_id for shard in shards for role_id in shard) == sorted(ids)
+    for shard in shards:
+        assert shard == [role_id for role_id in ids if role_id in shard]
+    assert sum(1 for shard in shards if "r0" in shard and set(f"r{index}" for index in range(10)) <= set(shard)) == 1
+    assert sum(1 for shard in shards if {"r10", "r11"} <= set(shard)) == 1
+    assert "-- Shard 1/3:" in capsys.readouterr().out
+
+
+def test_select_shard_by_key(monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD", "1/2")
+    items = [{"ID": f"c{index}"} for index in range(10)]
+    selected = sharding.select_shard(items, key=lambda item: item["ID"])
+    assert selected == [item for item in items if sharding.shard_of(item["ID"], 2) == 1]
+
+
+def test_records_are_written_to_the_shard_results(shard_results_dir, monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD", "2/3")
+    journal.record("roles", "r1", "t1", "v1")
+    journal.record("policies", "p1", "t2")
+    sharding.close_shard_results()
+    with open(os.path.join(shard_results_dir, "shard-2-of-3.jsonl")) as file:
+        entries = [json.loads(line) for line in file]
+    assert entries == [
+        {"kind": "roles", "sourceID": "r1", "targetID": "t1", "vaultID": "v1"},
+        {"kind": "policies", "sourceID": "p1", "targetID": "t2", "vaultID": None},
+    ]
+
+
+def test_no_shard_results_by_default(monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD", None)
+    assert sharding.get_shard_results() is None
+
+
+def write_shard(results_dir, index, count, entries, partial_line=""):
+    os.makedirs(results_dir, exist_ok=True)
+    with open(sharding.shard_results_path((index, count), results_dir), "w") as file:
+        file.writelines(json.dumps(entry) + "\n" for entry in entries)
+        file.write(partial_line)
+
+
+def test_main_merges_every_shard(shard_results_dir, capsys):
+    write_shard(shard_results_dir, 1, 2, [{"kind": "roles", "sourceID": "r1", "targetID": "t1", "vaultID": "v"}])
+    write_shard(
+        shard_results_dir,
+        2,
+        2,
+        [
+            {"kind": "roles", "sourceID": "r2", "targetID": "t2", "vaultID": "v"},
+            {"kind": "roles", "sourceID": "r2", "targetID": "t3", "vaultID": "v"},
+        ],
+        '{"kind": "rol',
+    )
+    sharding.main()
+    merged = os.path.join(shard_results_dir, "merged.jsonl")
+    assert "Results of 2 shards merged" in capsys.readouterr().out
+    # the merged file can be resumed from like a journal
+    assert journal.Journal(merged).lookup("roles", "r2") == "t3"
+    assert journal.Journal(merged).lookup("roles", "r1") == "t1"
+
+
+def test_main_reports_missing_shards(shard_results_dir, capsys):
+    write_shard(shard_results_dir, 2, 3, [])
+    with pytest.raises(SystemExit):
+        sharding.main()
+    assert "Results of the shards [1, 3] are missing" in capsys.readouterr().out
+
+
+def test_main_errors(shard_results_dir, capsys):
+    with pytest.raises(SystemExit):
+        sharding.main()
+    write_shard(shard_results_dir, 1, 2, [])
+    write_shard(shard_results_dir, 1, 3, [])
+    with pytest.raises(SystemExit):
+        sharding.main()
+    out = capsys.readouterr().out
+    assert "No shard results found" in out
+    assert "different shard counts [2, 3]" in out
+
+
+def test_run_as_script(tmp_path, monkeypatch, capsys):
+    import runpy
+
+    monkeypatch.setenv("SHARD_RESULTS_DIR", str(tmp_path))
+    with pytest.raises(SystemExit):
+        runpy.run_module("sharding", run_name="__main__")
+    assert "No shard results found" in capsys.readouterr().out
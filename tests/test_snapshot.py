@@ -0,0 +1,147 @@
+import gzip
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+import cache
+import migrate_connections as mc
+import migrate_pipelines as mp
+import migrate_policies as mpol
+import migrate_roles as mr
+import migrate_service_accounts as msa
+import migrate_vault_roles_and_policies as mvrp
+import migrate_vault_schema as mvs
+import snapshot
+
+
+def fake_source(monkeypatch):
+    monkeypatch.setattr(mvs, "get_vault_details", lambda vault_id: {"vault": {"ID": vault_id}})
+    monkeypatch.setattr(mvrp, "list_all_vault_custom_roles", lambda vault_id: iter([{"ID": "r1"}, {"ID": "r2"}]))
+    monkeypatch.setattr(snapshot, "list_service_accounts", lambda: iter([{"ID": "sa1"}]))
+    monkeypatch.setattr(msa, "get_service_account", lambda sa_id: {"serviceAccount": {"ID": sa_id}})
+    monkeypatch.setattr(
+        msa,
+        "list_service_account_roles",
+        lambda sa_id: {"roleToResource": [{"role": {"ID": "r2"}}, {"role": {"ID": "owner"}}]},
+    )
+    monkeypatch.setattr(mr, "get_role", lambda role_id: {"role": {"ID": role_id}})
+    monkeypatch.setattr(
+        mr, "get_role_policies", lambda role_id: {"policies": [{"ID": "p1"}, {"ID": f"p-{role_id}"}]}
+    )
+    monkeypatch.setattr(mpol, "get_policy", lambda policy_id: {"policy": {"ID": policy_id}})
+    monkeypatch.setattr(mr, "list_vault_policies", lambda vault_id: iter([{"ID": "p1", "members": []}]))
+    monkeypatch.setattr(mc, "list_connections", lambda vault_id: iter([{"ID": "c1"}]))
+    monkeypatch.setattr(mc, "get_connection", lambda connection_id: {"ID": connection_id})
+    monkeypatch.setattr(mp, "list_pipelines", lambda vault_id: iter([{"ID": "pl1"}]))
+    monkeypatch.setattr(mp, "get_pipeline", lambda pipeline_id: {"ID": pipeline_id})
+
+
+def test_crawl_source_vault(monkeypatch):
+    fake_source(monkeypatch)
+    entries = snapshot.crawl_source_vault("v1", max_workers=4)
+    assert entries[("vaults", "v1")] == {"vault": {"ID": "v1"}}
+    assert entries[("roles/list", "v1")] == [{"ID": "r1"}, {"ID": "r2"}]
+    assert entries[("policies/list", "v1")] == [{"ID": "p1", "members": []}]
+    assert sorted(key[1] for key in entries if key[0] == "roles") == ["owner", "r1", "r2"]
+    assert sorted(key[1] for key in entries if key[0] == "policies") == ["p-owner", "p-r1", "p-r2", "p1"]
+    assert ("members/roles", "sa1") in entries and ("serviceAccounts", "sa1") in entries
+    assert entries[("connections/list", "v1")] == [{"ID": "c1"}]
+    assert ("connections", "c1") in entries and ("pipelines", "pl1") in entries
+    assert entries[("pipelines/list", "v1")] == [{"ID": "pl1"}]
+
+
+def test_migrate_scripts_read_from_the_snapshot(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot.json.gz")
+    with monkeypatch.context() as m:
+        fake_source(m)
+        snapshot.write_snapshot(path, "v1", snapshot.crawl_source_vault("v1"))
+    monkeypatch.setattr(cache, "SOURCE_SNAPSHOT", path)
+
+    with patch("requests.Session.get", side_effect=AssertionError("source called")):
+        assert mr.get_role("r1") == {"role": {"ID": "r1"}}
+        assert mpol.get_policy("p1") == {"policy": {"ID": "p1"}}
+        assert mc.get_connection("c1") == {"ID": "c1"}
+        assert list(mvrp.list_all_vault_custom_roles("v1")) == [{"ID": "r1"}, {"ID": "r2"}]
+        assert list(mr.list_vault_policies("v1")) == [{"ID": "p1", "members": []}]
+        assert list(mc.list_connections("v1")) == [{"ID": "c1"}]
+        assert list(mp.list_pipelines("v1")) == [{"ID": "pl1"}]
+    # objects missing from the snapshot are still fetched from the source
+    with patch("requests.Session.get") as mock_get:
+        mock_get.return_value.json.return_value = {"role": {"ID": "r9"}}
+        assert mr.get_role("r9") == {"role": {"ID": "r9"}}
+        mock_get.return_value.json.return_value = {"roles": []}
+        assert list(mvrp.list_all_vault_custom_roles("v2")) == []
+    assert cache.get_snapshot().hits == 7
+
+
+def test_unsupported_snapshot_version(tmp_path, monkeypatch):
+    path = tmp_path / "snapshot.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        json.dump({"version": 99, "entries": []}, file)
+    monkeypatch.setattr(cache, "SOURCE_SNAPSHOT", str(path))
+    with pytest.raises(ValueError, match="Unsupported version 99"):
+        mr.get_role("r1")
+
+
+def test_print_cache_stats_reports_snapshot_hits(tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / "snapshot.json.gz")
+    snapshot.write_snapshot(path, "v1", {("roles", "r1"): {"role": {}}})
+    monkeypatch.setattr(cache, "SOURCE_SNAPSHOT", path)
+    mr.get_role("r1")
+    cache.print_cache_stats()
+    out = capsys.readouterr().out
+    assert "snapshot of vault v1" in out
+    assert "Source snapshot: 1 hits out of 1 objects" in out
+
+
+def test_main_writes_the_snapshot(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "snapshot.json.gz"
+    fake_source(monkeypatch)
+    monkeypatch.setattr(snapshot, "SOURCE_VAULT_ID", "v1")
+    monkeypatch.setattr(snapshot, "SNAPSHOT_FILE", str(path))
+    snapshot.main()
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        bundle = json.load(file)
+    assert bundle["version"] == cache.SNAPSHOT_VERSION and bundle["sourceVaultID"] == "v1"
+    assert {"endpoint": "vaults", "args": ["v1"], "value": {"vault": {"ID": "v1"}}} in bundle["entries"]
+    assert not (tmp_path / "snapshot.json.gz.tmp").exists()
+    assert "Snapshot of 19 objects written" in capsys.readouterr().out
+
+
+def test_main_without_vault_id(monkeypatch, capsys):
+    monkeypatch.setattr(snapshot, "SOURCE_VAULT_ID", None)
+    snapshot.main()
+    assert "Please provide the source vault ID" in capsys.readouterr().out
+
+
+def test_main_errors(monkeypatch):
+    class Resp:
+        content = b"boom"
+
+    monkeypatch.setattr(snapshot, "SOURCE_VAULT_ID", "v1")
+    monkeypatch.setattr(
+        snapshot, "crawl_source_vault", lambda vault_id: (_ for _ in ()).throw(requests.exceptions.HTTPError(response=Resp()))
+    )
+    with pytest.raises(SystemExit):
+        snapshot.main()
+    monkeypatch.setattr(snapshot, "crawl_source_vault", lambda vault_id: (_ for _ in ()).throw(ValueError("x")))
+    with pytest.raises(SystemExit):
+        snapshot.main()
+
+
+@patch("requests.Session.get")
+def test_list_service_accounts(mock_get):
+    mock_get.return_value.json.return_value = {"serviceAccounts": [{"ID": "sa1"}]}
+    mock_get.side_effect = [mock_get.return_value, MagicMock(**{"json.return_value": {}})]
+    assert list(snapshot.list_service_accounts()) == [{"ID": "sa1"}]
+
+
+def test_run_as_script(monkeypatch, capsys):
+    import runpy
+
+    monkeypatch.delenv("SOURCE_VAULT_ID", raising=False)
+    runpy.run_module("snapshot", run_name="__main__")
+    out = capsys.readouterr().out
+    assert "Please provide the source vault ID" in out and "Source cache" in out
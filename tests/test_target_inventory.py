@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock, patch
+
+import requests
+
+import target_inventory as ti
+
+
+def page(key, items):
+    response = MagicMock()
+    response.json.return_value = {key: items}
+    return response
+
+
+@patch("requests.Session.get")
+def test_connections_are_indexed_from_both_routes(mock_get):
+    mock_get.side_effect = [
+        page("ConnectionMappings", [{"ID": "c1", "name": "out"}]),
+        page("ConnectionMappings", []),
+        page("ConnectionMappings", [{"ID": "c2", "name": "in"}]),
+        page("ConnectionMappings", []),
+    ]
+    inventory = ti.TargetInventory(requests.Session(), "https://t", "tv")
+    assert inventory.find("connections", "out") == "c1"
+    assert inventory.find("connections", "in") == "c2"
+    assert inventory.find("connections", "missing") is None
+    urls = [c.args[0] for c in mock_get.call_args_list]
+    assert urls == [
+        "https://t/v1/gateway/outboundRoutes?vaultID=tv&offset=0&limit=100",
+        "https://t/v1/gateway/outboundRoutes?vaultID=tv&offset=1&limit=100",
+        "https://t/v1/gateway/inboundRoutes?vaultID=tv&offset=0&limit=100",
+        "https://t/v1/gateway/inboundRoutes?vaultID=tv&offset=1&limit=100",
+    ]
+
+
+@patch("requests.Session.get")
+def test_add_only_updates_listed_kinds(mock_get):
+    mock_get.side_effect = [page("policies", [{"ID": "p1", "name": "P1"}]), page("policies", [])]
+    inventory = ti.TargetInventory(requests.Session(), "https://t", "tv")
+    inventory.add("policies", "P2", "p2")
+    assert mock_get.call_count == 0
+    assert inventory.find("policies", "P2") is None
+    inventory.add("policies", "P2", "p2")
+    assert inventory.find("policies", "P2") == "p2"
+    assert mock_get.call_count == 2
+
+
+def test_get_inventory_is_shared_per_vault():
+    session = requests.Session()
+    first = ti.get_inventory(session, "https://t", "tv")
+    assert ti.get_inventory(session, "https://t", "tv") is first
+    assert ti.get_inventory(session, "https://t", "other") is not first
+    ti.clear_inventories()
+    assert ti.get_inventory(session, "https://t", "tv") is not first
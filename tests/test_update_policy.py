@@ -59,3 +59,67 @@ def test_transform_policy_payload_handles_update_and_new_rules(monkeypatch):
     # Check structure for one
     names = {r["name"] for r in payload["ruleParams"]}
     assert names == {"R2", "R3"}
+
+
+def source_rule(name, expression):
+    return {
+        "ID": f"s-{name}",
+        "name": name,
+        "ruleExpression": expression,
+        "actions": ["POLICY.read"],
+        "resources": ["vault:v/table:orders"],
+        "resourceType": "TABLE",
+        "dlpFormat": None,
+    }
+
+
+def test_inserted_rule_does_not_rewrite_the_following_rules(capsys):
+    target = {
+        "policy": {
+            "ID": "tp",
+            "resource": {"ID": "tv"},
+            "rules": [
+                {"ID": "t1", "name": "R1", "ruleExpression": "e1"},
+                {"ID": "t2", "name": "R2", "ruleExpression": "e2"},
+                {"ID": "t3", "name": "R3", "ruleExpression": "e3"},
+                {"ID": "t4", "name": "Gone", "ruleExpression": "e4"},
+            ],
+        }
+    }
+    source = {
+        "policy": {
+            "name": "s",
+            "displayName": "sd",
+            "description": "sdesc",
+            "rules": [
+                source_rule("New", "e0"),
+                source_rule("R1", "e1"),
+                source_rule("R2 renamed", "e2"),
+                source_rule("R3", "e3 changed"),
+            ],
+        }
+    }
+    payload = up.transform_policy_payload(source, target)
+    assert [(rule.get("ID"), rule["name"]) for rule in payload["ruleParams"]] == [
+        ("t2", "R2 renamed"),
+        ("t3", "R3"),
+        (None, "New"),
+    ]
+    assert payload["ruleParams"][2]["tableRuleParams"]["tableName"] == "orders"
+    assert "ID" not in payload["ruleParams"][2]["tableRuleParams"]
+    assert "Rule Gone of policy tp no longer exists in the source policy" in capsys.readouterr().out
+
+
+def test_diff_policy_rules_matches_each_target_rule_once():
+    target_rules = [{"ID": "t1", "name": "A", "ruleExpression": "e"}]
+    added, updated, removed = up.diff_policy_rules(
+        [{"name": "A", "ruleExpression": "e"}, {"name": "B", "ruleExpression": "e"}], target_rules
+    )
+    assert added == [{"name": "B", "ruleExpression": "e"}]
+    assert updated == [] and removed == []
+    # a target rule named like a source rule is not taken by a renamed one
+    added, updated, removed = up.diff_policy_rules(
+        [{"name": "C", "ruleExpression": "e"}, {"name": "A", "ruleExpression": "x"}], target_rules
+    )
+    assert added == [{"name": "C", "ruleExpression": "e"}]
+    assert updated == [({"name": "A", "ruleExpression": "x"}, target_rules[0])]
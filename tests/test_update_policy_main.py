@@ -4,8 +4,8 @@ from unittest.mock import MagicMock, patch
 import update_policy as up
 
 
-@patch("update_policy.requests.patch")
-@patch("update_policy.requests.get")
+@patch("requests.Session.patch")
+@patch("requests.Session.get")
 def test_main_success(mock_get, mock_patch, monkeypatch):
     monkeypatch.setattr(up, "SOURCE_POLICY_ID", "s1", raising=False)
     monkeypatch.setattr(up, "TARGET_POLICY_ID", "t1", raising=False)
@@ -71,8 +71,8 @@ def test_main_missing_inputs(monkeypatch):
     # Missing IDs should go to the "Please provide valid input" branch
     monkeypatch.setattr(up, "SOURCE_POLICY_ID", None, raising=False)
     monkeypatch.setattr(up, "TARGET_POLICY_ID", None, raising=False)
-    with patch("update_policy.requests.get") as g, patch(
-        "update_policy.requests.patch"
+    with patch("requests.Session.get") as g, patch(
+        "requests.Session.patch"
     ) as p:
         result = up.main()
         assert result is None
@@ -122,9 +122,49 @@ def test_run_as_script(monkeypatch):
     patch_resp = MagicMock()
     patch_resp.raise_for_status.return_value = None
     patch_resp.json.return_value = {"ok": True}
-    with patch.object(_requests, "get", side_effect=[src, tgt]) as mget, patch.object(
-        _requests, "patch", return_value=patch_resp
+    with patch.object(_requests.Session, "get", side_effect=[src, tgt]) as mget, patch.object(
+        _requests.Session, "patch", return_value=patch_resp
     ) as mpatch:
         runpy.run_module("update_policy", run_name="__main__")
         assert mget.call_count == 2
         assert mpatch.call_count == 1
+
+
+@patch("requests.Session.patch")
+def test_main_updates_every_migrated_policy_of_the_vault(mock_patch, id_mapping_store, monkeypatch):
+    monkeypatch.setattr(up, "SOURCE_POLICY_ID", None, raising=False)
+    monkeypatch.setattr(up, "TARGET_POLICY_ID", None, raising=False)
+    monkeypatch.setattr(up, "TARGET_VAULT_ID", "tv", raising=False)
+    monkeypatch.setattr(up, "TARGET_ENV_URL", "https://t")
+    id_mapping_store.save("policies", "s1", "t1", "tv")
+    # a stray TARGET_VAULT_ID does not update every policy of the vault
+    monkeypatch.setattr(up, "UPDATE_ALL_POLICIES", False)
+    assert up.get_policies_to_update() == []
+    monkeypatch.setattr(up, "SOURCE_POLICY_ID", "s1", raising=False)
+    assert up.get_policies_to_update() == [("s1", "t1")]
+    monkeypatch.setattr(up, "SOURCE_POLICY_ID", None, raising=False)
+    monkeypatch.setattr(up, "UPDATE_ALL_POLICIES", True)
+    id_mapping_store.save("policies", "s2", "t2", "tv")
+    fetched = []
+    monkeypatch.setattr(up, "get_source_policy", lambda policy_id: fetched.append(policy_id) or {"policy": {"rules": []}})
+    monkeypatch.setattr(up, "get_target_policy", lambda policy_id: fetched.append(policy_id) or {"policy": {"rules": []}})
+    monkeypatch.setattr(
+        up, "transform_policy_payload", lambda source, target: {"policy": {"ID": fetched[-1]}}
+    )
+    up.main()
+    assert fetched == ["s1", "t1", "s2", "t2"]
+    urls = [c.args[0] for c in mock_patch.call_args_list]
+    assert urls == ["https://t/v1/policies/t1", "https://t/v1/policies/t2"]
+
+
+def test_update_policy_from_source_reports_leftover_rules(monkeypatch):
+    rule = {"ID": "r1", "name": "R", "ruleExpression": "expr"}
+    stale_rule = {"ID": "r2", "name": "Old", "ruleExpression": "old"}
+    target_rules = [rule]
+    monkeypatch.setattr(up, "get_source_policy", lambda policy_id: {"policy": {"rules": [rule]}})
+    monkeypatch.setattr(up, "get_target_policy", lambda policy_id: {"policy": {"rules": target_rules}})
+    monkeypatch.setattr(up, "transform_policy_payload", lambda source, target: {"policy": {"ID": "t1"}})
+    monkeypatch.setattr(up, "update_policy", lambda payload: payload)
+    assert up.update_policy_from_source(("s1", "t1"))
+    target_rules.append(stale_rule)
+    assert not up.update_policy_from_source(("s1", "t1"))
@@ -9,15 +9,14 @@ def test_transform_role_payload_simple():
     source = {
         "role": {"definition": {"name": "N", "displayName": "D", "description": "Desc"}}
     }
-    target = {"role": {"ID": "rid"}}
-    out = ur.transform_role_payload(source, target)
+    out = ur.transform_role_payload(source, "rid")
     assert out["ID"] == "rid"
     assert out["roleDefinition"]["name"] == "N"
 
 
-@patch("update_role.requests.post")
-@patch("update_role.requests.get")
-@patch("update_role.requests.patch")
+@patch("requests.Session.post")
+@patch("requests.Session.get")
+@patch("requests.Session.patch")
 def test_main_update_metadata(mock_patch, mock_get, mock_post, monkeypatch):
     monkeypatch.setattr(ur, "UPDATE_ROLE_CRITERIA", "UPDATE_METADATA", raising=False)
     monkeypatch.setattr(ur, "SOURCE_ROLE_ID", "s1", raising=False)
@@ -30,10 +29,7 @@ def test_main_update_metadata(mock_patch, mock_get, mock_post, monkeypatch):
     g1.json.return_value = {
         "role": {"definition": {"name": "N", "displayName": "D", "description": "d"}}
     }
-    g2 = MagicMock()
-    g2.raise_for_status.return_value = None
-    g2.json.return_value = {"role": {"ID": "t1"}}
-    mock_get.side_effect = [g1, g2]
+    mock_get.side_effect = [g1]
 
     p = MagicMock()
     p.raise_for_status.return_value = None
@@ -41,10 +37,12 @@ def test_main_update_metadata(mock_patch, mock_get, mock_post, monkeypatch):
     mock_patch.return_value = p
 
     ur.main()
-    assert mock_patch.called
+    assert mock_patch.call_args.args[0] == "https://t/v1/roles/t1"
+    # the target role ID is known, only the source role is fetched
+    assert mock_get.call_count == 1
 
 
-@patch("update_role.requests.post")
+@patch("requests.Session.post")
 def test_main_assign_policy(mock_post, monkeypatch):
     monkeypatch.setattr(ur, "UPDATE_ROLE_CRITERIA", "ASSIGN_POLICY", raising=False)
     monkeypatch.setattr(ur, "POLICY_IDS", "['p1','p2']", raising=False)
@@ -59,7 +57,7 @@ def test_main_assign_policy(mock_post, monkeypatch):
     assert mock_post.call_count == 2
 
 
-@patch("update_role.requests.post")
+@patch("requests.Session.post")
 def test_main_assign_policy_empty_list(mock_post, monkeypatch):
     monkeypatch.setattr(ur, "UPDATE_ROLE_CRITERIA", "ASSIGN_POLICY", raising=False)
     monkeypatch.setattr(ur, "POLICY_IDS", "[]", raising=False)
@@ -86,7 +84,6 @@ def test_main_http_error_on_update(monkeypatch):
             }
         },
     )
-    monkeypatch.setattr(ur, "get_target_role", lambda _id: {"role": {"ID": "t1"}})
 
     def raise_err(_):
         raise err
@@ -128,7 +125,6 @@ def test_main_generic_exception(monkeypatch):
             }
         },
     )
-    monkeypatch.setattr(ur, "get_target_role", lambda _id: {"role": {"ID": "t1"}})
     monkeypatch.setattr(
         ur, "update_role", lambda payload: (_ for _ in ()).throw(Exception("boom"))
     )
@@ -143,7 +139,66 @@ def test_run_as_script(monkeypatch):
     monkeypatch.setenv("UPDATE_ROLE_CRITERIA", "ASSIGN_POLICY")
     monkeypatch.setenv("POLICY_IDS", "[]")
     monkeypatch.setenv("TARGET_ROLE_ID", "t1")
-    with patch.object(_requests, "post") as p:
+    with patch.object(_requests.Session, "post") as p:
         runpy.run_module("update_role", run_name="__main__")
         # POLICY_IDS is [], so no assignment posts should be made
         assert p.call_count == 0
+
+
+@patch("requests.Session.patch")
+@patch("requests.Session.get")
+def test_main_resolves_target_roles_from_the_store(mock_get, mock_patch, id_mapping_store, monkeypatch):
+    monkeypatch.setattr(ur, "UPDATE_ROLE_CRITERIA", "UPDATE_METADATA", raising=False)
+    monkeypatch.setattr(ur, "SOURCE_ROLE_ID", "['s1','s2']", raising=False)
+    monkeypatch.setattr(ur, "TARGET_ROLE_ID", None, raising=False)
+    monkeypatch.setattr(ur, "TARGET_ENV_URL", "https://t")
+    id_mapping_store.save("roles", "s1", "t1", "tv")
+    id_mapping_store.save("roles", "s2", "t2", "tv")
+    mock_get.return_value.json.return_value = {
+        "role": {"definition": {"name": "N", "displayName": "D", "description": "d"}}
+    }
+    ur.main()
+    urls = [c.args[0] for c in mock_patch.call_args_list]
+    assert urls == ["https://t/v1/roles/t1", "https://t/v1/roles/t2"]
+
+
+@patch("requests.Session.post")
+def test_main_assigns_migrated_policies_to_every_role(mock_post, id_mapping_store, monkeypatch):
+    monkeypatch.setattr(ur, "UPDATE_ROLE_CRITERIA", "ASSIGN_POLICY", raising=False)
+    monkeypatch.setattr(ur, "SOURCE_ROLE_ID", None, raising=False)
+    monkeypatch.setattr(ur, "TARGET_ROLE_ID", None, raising=False)
+    monkeypatch.setattr(ur, "TARGET_VAULT_ID", "tv", raising=False)
+    monkeypatch.setattr(ur, "UPDATE_ALL_ROLES", True)
+    monkeypatch.setattr(ur, "POLICY_IDS", "['sp1','tp2']", raising=False)
+    monkeypatch.setattr(ur, "TARGET_ENV_URL", "https://t")
+    id_mapping_store.save("roles", "s1", "t1", "tv")
+    id_mapping_store.save("roles", "s2", "t2", "tv")
+    id_mapping_store.save("policies", "sp1", "tp1", "tv")
+    ur.main()
+    bodies = [c.kwargs["json"] for c in mock_post.call_args_list]
+    assert bodies == [
+        {"ID": "tp1", "roleIDs": ["t1", "t2"]},
+        {"ID": "tp2", "roleIDs": ["t1", "t2"]},
+    ]
+
+
+@patch("requests.Session.post")
+def test_main_does_not_assign_to_every_role_without_opting_in(mock_post, id_mapping_store, monkeypatch, capsys):
+    monkeypatch.setattr(ur, "UPDATE_ROLE_CRITERIA", "ASSIGN_POLICY", raising=False)
+    monkeypatch.setattr(ur, "SOURCE_ROLE_ID", None, raising=False)
+    monkeypatch.setattr(ur, "TARGET_ROLE_ID", None, raising=False)
+    monkeypatch.setattr(ur, "TARGET_VAULT_ID", "tv", raising=False)
+    monkeypatch.setattr(ur, "UPDATE_ALL_ROLES", False)
+    monkeypatch.setattr(ur, "POLICY_IDS", "['tp1']", raising=False)
+    id_mapping_store.save("roles", "s1", "t1", "tv")
+    with pytest.raises(SystemExit):
+        ur.main()
+    assert mock_post.call_count == 0
+    assert "Missing roles to assign the policies to" in capsys.readouterr().out
+
+    # opted in, but nothing was migrated into the vault
+    monkeypatch.setattr(ur, "UPDATE_ALL_ROLES", True)
+    monkeypatch.setattr(ur, "TARGET_VAULT_ID", "empty", raising=False)
+    with pytest.raises(SystemExit):
+        ur.main()
+    assert mock_post.call_count == 0
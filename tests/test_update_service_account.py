@@ -13,16 +13,15 @@ def test_transform_service_account_payload_builds(monkeypatch):
             "enforceSignedDataTokens": False,
         },
     }
-    target = {"serviceAccount": {"ID": "tid"}}
-    out = usa.transform_service_account_payload(source, target)
+    out = usa.transform_service_account_payload(source, "tid")
     assert out["ID"] == "tid"
     assert out["serviceAccount"]["name"] == "S"
     assert out["clientConfiguration"]["enforceContextID"] is True
 
 
-@patch("update_service_account.requests.post")
-@patch("update_service_account.requests.get")
-@patch("update_service_account.requests.patch")
+@patch("requests.Session.post")
+@patch("requests.Session.get")
+@patch("requests.Session.patch")
 def test_main_update_metadata(mock_patch, mock_get, mock_post, monkeypatch):
     monkeypatch.setattr(
         usa, "UPDATE_SERVICE_ACCOUNT_CRITERIA", "UPDATE_METADATA", raising=False
@@ -41,10 +40,7 @@ def test_main_update_metadata(mock_patch, mock_get, mock_post, monkeypatch):
             "enforceSignedDataTokens": False,
         },
     }
-    g2 = MagicMock()
-    g2.raise_for_status.return_value = None
-    g2.json.return_value = {"serviceAccount": {"ID": "t1"}}
-    mock_get.side_effect = [g1, g2]
+    mock_get.side_effect = [g1]
 
     p = MagicMock()
     p.raise_for_status.return_value = None
@@ -52,10 +48,11 @@ def test_main_update_metadata(mock_patch, mock_get, mock_post, monkeypatch):
     mock_patch.return_value = p
 
     usa.main()
-    assert mock_patch.called
+    assert mock_patch.call_args.args[0] == "https://t/v1/serviceAccounts/t1"
+    assert mock_get.call_count == 1
 
 
-@patch("update_service_account.requests.post")
+@patch("requests.Session.post")
 def test_main_assign_roles(mock_post, monkeypatch):
     monkeypatch.setattr(
         usa, "UPDATE_SERVICE_ACCOUNT_CRITERIA", "ASSIGN_ROLES", raising=False
@@ -71,7 +68,7 @@ def test_main_assign_roles(mock_post, monkeypatch):
     assert mock_post.call_count == 2
 
 
-@patch("update_service_account.requests.post")
+@patch("requests.Session.post")
 def test_main_assign_roles_empty_list(mock_post, monkeypatch):
     monkeypatch.setattr(
         usa, "UPDATE_SERVICE_ACCOUNT_CRITERIA", "ASSIGN_ROLES", raising=False
@@ -104,9 +101,6 @@ def test_main_http_error_on_update(monkeypatch):
             },
         },
     )
-    monkeypatch.setattr(
-        usa, "get_target_service_account", lambda _id: {"serviceAccount": {"ID": "t1"}}
-    )
 
     def raise_err(_):
         raise err
@@ -156,9 +150,6 @@ def test_main_generic_exception(monkeypatch):
             },
         },
     )
-    monkeypatch.setattr(
-        usa, "get_target_service_account", lambda _id: {"serviceAccount": {"ID": "t1"}}
-    )
     monkeypatch.setattr(
         usa,
         "update_service_account",
@@ -175,7 +166,62 @@ def test_run_as_script(monkeypatch):
     monkeypatch.setenv("UPDATE_SERVICE_ACCOUNT_CRITERIA", "ASSIGN_ROLES")
     monkeypatch.setenv("ROLE_IDS", "[]")
     monkeypatch.setenv("TARGET_SERVICE_ACCOUNT_ID", "t1")
-    with patch.object(_requests, "post") as p:
+    with patch.object(_requests.Session, "post") as p:
         runpy.run_module("update_service_account", run_name="__main__")
         # ROLE_IDS is [], so no role assignment posts should be made
         assert p.call_count == 0
+
+
+@patch("requests.Session.patch")
+@patch("requests.Session.get")
+def test_main_resolves_target_service_account_from_the_store(mock_get, mock_patch, id_mapping_store, monkeypatch):
+    monkeypatch.setattr(usa, "UPDATE_SERVICE_ACCOUNT_CRITERIA", "UPDATE_METADATA", raising=False)
+    monkeypatch.setattr(usa, "SOURCE_SERVICE_ACCOUNT_ID", "s1", raising=False)
+    monkeypatch.setattr(usa, "TARGET_SERVICE_ACCOUNT_ID", None, raising=False)
+    monkeypatch.setattr(usa, "TARGET_ENV_URL", "https://t")
+    id_mapping_store.save("serviceAccounts", "s1", "t1", "tv")
+    mock_get.return_value.json.return_value = {
+        "serviceAccount": {"name": "S", "displayName": "SD", "description": "Desc"},
+        "clientConfiguration": {"enforceContextID": True, "enforceSignedDataTokens": False},
+    }
+    usa.main()
+    assert mock_patch.call_args.args[0] == "https://t/v1/serviceAccounts/t1"
+    assert mock_patch.call_args.kwargs["json"]["serviceAccount"]["ID"] == "t1"
+
+
+@patch("requests.Session.post")
+def test_main_assigns_migrated_roles_to_every_service_account(mock_post, id_mapping_store, monkeypatch):
+    monkeypatch.setattr(usa, "UPDATE_SERVICE_ACCOUNT_CRITERIA", "ASSIGN_ROLES", raising=False)
+    monkeypatch.setattr(usa, "SOURCE_SERVICE_ACCOUNT_ID", None, raising=False)
+    monkeypatch.setattr(usa, "TARGET_SERVICE_ACCOUNT_ID", None, raising=False)
+    monkeypatch.setattr(usa, "TARGET_VAULT_ID", "tv", raising=False)
+    monkeypatch.setattr(usa, "UPDATE_ALL_SERVICE_ACCOUNTS", True)
+    monkeypatch.setattr(usa, "ROLE_IDS", "['sr1']", raising=False)
+    monkeypatch.setattr(usa, "TARGET_ENV_URL", "https://t")
+    id_mapping_store.save("serviceAccounts", "s1", "t1", "tv")
+    id_mapping_store.save("serviceAccounts", "s2", "t2", "tv")
+    id_mapping_store.save("roles", "sr1", "tr1", "tv")
+    usa.main()
+    assert mock_post.call_count == 1
+    assert mock_post.call_args.kwargs["json"] == {
+        "ID": "tr1",
+        "members": [
+            {"type": "SERVICE_ACCOUNT", "ID": "t1"},
+            {"type": "SERVICE_ACCOUNT", "ID": "t2"},
+        ],
+    }
+
+
+@patch("requests.Session.post")
+def test_main_does_not_assign_to_every_service_account_without_opting_in(mock_post, id_mapping_store, monkeypatch, capsys):
+    monkeypatch.setattr(usa, "UPDATE_SERVICE_ACCOUNT_CRITERIA", "ASSIGN_ROLES", raising=False)
+    monkeypatch.setattr(usa, "SOURCE_SERVICE_ACCOUNT_ID", None, raising=False)
+    monkeypatch.setattr(usa, "TARGET_SERVICE_ACCOUNT_ID", None, raising=False)
+    monkeypatch.setattr(usa, "TARGET_VAULT_ID", "tv", raising=False)
+    monkeypatch.setattr(usa, "UPDATE_ALL_SERVICE_ACCOUNTS", False)
+    monkeypatch.setattr(usa, "ROLE_IDS", "['tr1']", raising=False)
+    id_mapping_store.save("serviceAccounts", "s1", "t1", "tv")
+    with pytest.raises(SystemExit):
+        usa.main()
+    assert mock_post.call_count == 0
+    assert "Missing service accounts to assign the roles to" in capsys.readouterr().out
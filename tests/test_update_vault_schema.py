@@ -4,8 +4,8 @@ from unittest.mock import MagicMock, patch
 import update_vault_schema as uvs
 
 
-@patch("update_vault_schema.requests.patch")
-@patch("update_vault_schema.requests.get")
+@patch("requests.Session.patch")
+@patch("requests.Session.get")
 def test_main_success(mock_get, mock_patch, monkeypatch):
     monkeypatch.setattr(uvs, "SOURCE_VAULT_ID", "sv", raising=False)
     monkeypatch.setattr(uvs, "TARGET_VAULT_ID", "tv", raising=False)
@@ -32,8 +32,8 @@ def test_main_missing_ids(monkeypatch):
     monkeypatch.setattr(uvs, "SOURCE_VAULT_ID", None, raising=False)
     monkeypatch.setattr(uvs, "TARGET_VAULT_ID", None, raising=False)
     # Should early-return without making any network calls
-    with patch("update_vault_schema.requests.get") as g, patch(
-        "update_vault_schema.requests.patch"
+    with patch("requests.Session.get") as g, patch(
+        "requests.Session.patch"
     ) as p:
         result = uvs.main()
         assert result is None
@@ -70,7 +70,7 @@ def test_main_generic_exception(monkeypatch):
     g.json.return_value = {
         "vault": {"name": "V", "description": "D", "schemas": [], "tags": []}
     }
-    with patch("update_vault_schema.requests.get", return_value=g):
+    with patch("requests.Session.get", return_value=g):
         with patch("update_vault_schema.update_vault", side_effect=Exception("boom")):
             with pytest.raises(SystemExit):
                 uvs.main()
@@ -92,9 +92,26 @@ def test_run_as_script(monkeypatch):
     p = MagicMock()
     p.raise_for_status.return_value = None
     p.json.return_value = {"ID": "tv"}
-    with patch.object(_requests, "get", return_value=g) as mget, patch.object(
-        _requests, "patch", return_value=p
+    with patch.object(_requests.Session, "get", return_value=g) as mget, patch.object(
+        _requests.Session, "patch", return_value=p
     ) as mpatch:
         runpy.run_module("update_vault_schema", run_name="__main__")
         assert mget.call_count == 1
         assert mpatch.call_count == 1
+
+
+@patch("requests.Session.patch")
+@patch("requests.Session.get")
+def test_delta_sync_skips_unchanged_schema(mock_get, mock_patch, id_mapping_store, monkeypatch, capsys):
+    monkeypatch.setattr(uvs, "SOURCE_VAULT_ID", "sv", raising=False)
+    monkeypatch.setattr(uvs, "TARGET_VAULT_ID", "tv", raising=False)
+    monkeypatch.setattr(uvs, "DELTA_SYNC", True)
+    mock_get.return_value.json.return_value = {
+        "vault": {"name": "V", "description": "D", "schemas": [], "tags": []}
+    }
+    mock_patch.return_value.json.return_value = {"ID": "tv"}
+
+    uvs.main()
+    uvs.main()
+    assert mock_patch.call_count == 1
+    assert "schema unchanged since the last sync" in capsys.readouterr().out
@@ -1,54 +1,89 @@
 import os
 import requests
+from cache import cached_source, print_cache_stats
+from concurrency import map_concurrently
+from http_client import get_session
+from id_mapping import parse_ids, resolve_targets
+from policy_transformer import transform_rules
 
 SOURCE_POLICY_ID = os.getenv("SOURCE_POLICY_ID")
 TARGET_POLICY_ID = os.getenv("TARGET_POLICY_ID")
+TARGET_VAULT_ID = os.getenv("TARGET_VAULT_ID")
 SOURCE_ACCOUNT_ID = os.getenv("SOURCE_ACCOUNT_ID")
 TARGET_ACCOUNT_ID = os.getenv("TARGET_ACCOUNT_ID")
 SOURCE_ACCOUNT_AUTH = os.getenv("SOURCE_ACCOUNT_AUTH")
 TARGET_ACCOUNT_AUTH = os.getenv("TARGET_ACCOUNT_AUTH")
 SOURCE_ENV_URL = os.getenv("SOURCE_ENV_URL")
 TARGET_ENV_URL = os.getenv("TARGET_ENV_URL")
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY") or "1")
+UPDATE_ALL_POLICIES = (os.getenv("UPDATE_ALL_POLICIES") or "").lower() == "true"
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-TARGET_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": TARGET_ACCOUNT_ID,
-    "Authorization": f"Bearer {TARGET_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
 
 
+@cached_source("policies")
 def get_source_policy(policy_id):
-    response = requests.get(
-        f"{SOURCE_ENV_URL}/v1/policies/{policy_id}", headers=SOURCE_ACCOUNT_HEADERS
+    response = SOURCE_SESSION.get(
+        f"{SOURCE_ENV_URL}/v1/policies/{policy_id}"
     )
     response.raise_for_status()
     return response.json()
 
 
 def get_target_policy(policy_id):
-    response = requests.get(
-        f"{TARGET_ENV_URL}/v1/policies/{policy_id}", headers=TARGET_ACCOUNT_HEADERS
+    response = TARGET_SESSION.get(
+        f"{TARGET_ENV_URL}/v1/policies/{policy_id}"
     )
     response.raise_for_status()
     return response.json()
 
 
 def update_policy(policy_data):
-    response = requests.patch(
-        f"{TARGET_ENV_URL}/v1/policies/{TARGET_POLICY_ID}",
+    response = TARGET_SESSION.patch(
+        f"{TARGET_ENV_URL}/v1/policies/{policy_data['policy']['ID']}",
         json=policy_data,
-        headers=TARGET_ACCOUNT_HEADERS,
     )
     response.raise_for_status()
     return response.json()
 
 
+def rule_key(rule):
+    """Content key of a policy rule, two rules with the same key grant the same access."""
+    return rule["ruleExpression"]
+
+
+def diff_policy_rules(source_rules, target_rules):
+    """Match the source rules with the target rules by name, then by content.
+
+    Returns the source rules to add, the (source rule, target rule) pairs to
+    update and the target rules missing from the source. Rules that are the
+    same in both policies are left out, whatever their position.
+    """
+    targets_by_name = {rule["name"]: rule for rule in target_rules}
+    targets_by_key = {}
+    for rule in target_rules:
+        targets_by_key.setdefault(rule_key(rule), rule)
+    source_names = {rule["name"] for rule in source_rules}
+    matched_ids = set()
+    added_rules, updated_rules = [], []
+    for source_rule in source_rules:
+        target_rule = targets_by_name.get(source_rule["name"])
+        if target_rule is None:
+            # a renamed rule keeps its content
+            target_rule = targets_by_key.get(rule_key(source_rule))
+            if target_rule is not None and target_rule["name"] in source_names:
+                target_rule = None
+        if target_rule is None or target_rule["ID"] in matched_ids:
+            added_rules.append(source_rule)
+            continue
+        matched_ids.add(target_rule["ID"])
+        if target_rule["name"] != source_rule["name"] or rule_key(target_rule) != rule_key(source_rule):
+            updated_rules.append((source_rule, target_rule))
+    removed_rules = [rule for rule in target_rules if rule["ID"] not in matched_ids]
+    return added_rules, updated_rules, removed_rules
+
+
 def transform_policy_payload(source_policy, target_policy):
     target_resource = target_policy["policy"]
     source_resource = source_policy["policy"]
@@ -62,91 +97,64 @@ def transform_policy_payload(source_policy, target_policy):
         }
     }
 
-    source_policy_rules = source_resource["rules"]
-    target_policy_rules = target_resource["rules"]
     target_vault_id = target_resource["resource"]["ID"]
-    target_policy_rule_params = []
-    no_of_source_policy_rules = len(source_policy_rules)
-    no_of_target_policy_rules = len(target_policy_rules)
-    for i in range(no_of_source_policy_rules):
-        source_policy_rule = source_policy_rules[i]
-        if i < no_of_target_policy_rules:
-            target_policy_rule = target_policy_rules[i]
-            if (
-                source_policy_rule["ruleExpression"]
-                == target_policy_rule["ruleExpression"]
-            ):
-                continue
-            else:
-                temp_rule_param = {
-                    "ID": target_policy_rule["ID"],
-                    "name": source_policy_rule["name"],
-                    "ruleExpression": source_policy_rule["ruleExpression"],
-                }
-                ruleParams = source_policy_rule
-                actions: list[str] = ruleParams["actions"]
-                rule_param_actions = [
-                    action.split(".")[1].upper() for action in actions
-                ]
-                resources: list[str] = ruleParams["resources"]
-                resourceType = source_policy_rule["resourceType"]
-
-                ruleParams["vaultID"] = target_vault_id
-                ruleParams["actions"] = rule_param_actions
-                ruleParams["action"] = rule_param_actions[0]
-        else:
-            temp_rule_param = {
-                "name": source_policy_rule["name"],
-                "ruleExpression": source_policy_rule["ruleExpression"],
-            }
-            ruleParams = source_policy_rule
-            actions: list[str] = ruleParams["actions"]
-            rule_param_actions = [action.split(".")[1].upper() for action in actions]
-            resources: list[str] = ruleParams["resources"]
-            resourceType = source_policy_rule["resourceType"]
-
-            ruleParams["vaultID"] = target_vault_id
-            ruleParams["actions"] = rule_param_actions
-            ruleParams["action"] = rule_param_actions[0]
-
-            del ruleParams["ID"]
-        
-        del ruleParams["resources"]
-        del ruleParams["dlpFormat"]
-        del ruleParams["resourceType"]
-        del ruleParams["ruleExpression"]
-
-        if resourceType == "COLUMN":
-            ruleParams["columns"] = [
-                f"{resource.split('/')[1].split(':')[1]}.{resource.split('/')[2].split(':')[1]}"
-                for resource in resources
-            ]
-            temp_rule_param["columnRuleParams"] = ruleParams
-        elif resourceType == "TABLE":
-            ruleParams["tableName"] = resources[0].split("table:")[1]
-            temp_rule_param["tableRuleParams"] = ruleParams
-        elif resourceType == "COLUMN_GROUP":
-            ruleParams["columnGroups"] = [
-                resource.split("columngroup:")[1] for resource in resources
-            ]
-            temp_rule_param["columnGroupRuleParams"] = ruleParams
-        target_policy_rule_params.append(temp_rule_param)
+    added_rules, updated_rules, removed_rules = diff_policy_rules(
+        source_resource["rules"], target_resource["rules"]
+    )
+    # only the rules that really changed are sent
+    target_policy_rule_params = transform_rules(
+        [source_policy_rule for source_policy_rule, _ in updated_rules] + added_rules,
+        target_vault_id,
+        [target_policy_rule["ID"] for _, target_policy_rule in updated_rules] + [None] * len(added_rules),
+    )
+    for target_policy_rule in removed_rules:
+        print(
+            f"-- Rule {target_policy_rule['name']} of policy {target_resource['ID']} "
+            "no longer exists in the source policy, remove it from the target policy --"
+        )
 
     update_payload["ruleParams"] = target_policy_rule_params
 
     return update_payload
 
 
+def get_policies_to_update():
+    """Return the (source, target) policy IDs to update.
+
+    Without TARGET_POLICY_ID the targets of SOURCE_POLICY_ID (one or a list of
+    IDs) are read from the ID mapping store. Every policy migrated into
+    TARGET_VAULT_ID is only updated when UPDATE_ALL_POLICIES asks for it.
+    """
+    if SOURCE_POLICY_ID and TARGET_POLICY_ID:
+        return [(SOURCE_POLICY_ID, TARGET_POLICY_ID)]
+    if SOURCE_POLICY_ID:
+        return resolve_targets("policies", parse_ids(SOURCE_POLICY_ID), TARGET_VAULT_ID)
+    if UPDATE_ALL_POLICIES and TARGET_VAULT_ID:
+        return resolve_targets("policies", [], TARGET_VAULT_ID)
+    return []
+
+
+def update_policy_from_source(policy_ids):
+    """Update a target policy with the definition of its source policy.
+
+    Returns whether the target policy matches the source one, which it does
+    not while rules removed from the source are left in the target.
+    """
+    source_policy_id, target_policy_id = policy_ids
+    source_policy = get_source_policy(source_policy_id)
+    target_policy = get_target_policy(target_policy_id)
+    policy_payload = transform_policy_payload(source_policy, target_policy)
+    update_policy(policy_payload)
+    print(f"-- Policy {target_policy_id} updated successfully. --")
+    _, _, removed_rules = diff_policy_rules(source_policy["policy"]["rules"], target_policy["policy"]["rules"])
+    return not removed_rules
+
+
 def main():
     try:
-        source_policy_id = SOURCE_POLICY_ID
-        target_policy_id = TARGET_POLICY_ID
-        if source_policy_id and target_policy_id:
-            source_policy = get_source_policy(source_policy_id)
-            target_policy = get_target_policy(target_policy_id)
-            policy_payload = transform_policy_payload(source_policy, target_policy)
-            update_policy(policy_payload)
-            print(f"-- Policy {TARGET_POLICY_ID} updated successfully. --")
+        policies_to_update = get_policies_to_update()
+        if policies_to_update:
+            map_concurrently(update_policy_from_source, policies_to_update, MAX_CONCURRENCY)
         else:
             print("-- Please provide valid input. Missing input paramaters. --")
     except requests.exceptions.HTTPError as http_err:
@@ -159,3 +167,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    print_cache_stats()
@@ -1,60 +1,51 @@
 import ast
 import os
 import requests
+from assignments import AssignmentBatcher
+from cache import cached_source, print_cache_stats
+from concurrency import map_concurrently
+from http_client import get_session
+from id_mapping import parse_ids, resolve_targets, translate_ids
 
 SOURCE_ROLE_ID = os.getenv("SOURCE_ROLE_ID")
 TARGET_ROLE_ID = os.getenv("TARGET_ROLE_ID")
+TARGET_VAULT_ID = os.getenv("TARGET_VAULT_ID")
 UPDATE_ROLE_CRITERIA = os.getenv("UPDATE_ROLE_CRITERIA")
 POLICY_IDS = os.getenv("POLICY_IDS")
+UPDATE_ALL_ROLES = (os.getenv("UPDATE_ALL_ROLES") or "").lower() == "true"
 SOURCE_ACCOUNT_ID = os.getenv("SOURCE_ACCOUNT_ID")
 TARGET_ACCOUNT_ID = os.getenv("TARGET_ACCOUNT_ID")
 SOURCE_ACCOUNT_AUTH = os.getenv("SOURCE_ACCOUNT_AUTH")
 TARGET_ACCOUNT_AUTH = os.getenv("TARGET_ACCOUNT_AUTH")
 SOURCE_ENV_URL = os.getenv("SOURCE_ENV_URL")
 TARGET_ENV_URL = os.getenv("TARGET_ENV_URL")
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY") or "1")
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-TARGET_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": TARGET_ACCOUNT_ID,
-    "Authorization": f"Bearer {TARGET_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
 
 
+@cached_source("roles")
 def get_source_role(policy_id):
-    response = requests.get(
-        f"{SOURCE_ENV_URL}/v1/roles/{policy_id}", headers=SOURCE_ACCOUNT_HEADERS
-    )
-    response.raise_for_status()
-    return response.json()
-
-
-def get_target_role(policy_id):
-    response = requests.get(
-        f"{TARGET_ENV_URL}/v1/roles/{policy_id}", headers=TARGET_ACCOUNT_HEADERS
+    response = SOURCE_SESSION.get(
+        f"{SOURCE_ENV_URL}/v1/roles/{policy_id}"
     )
     response.raise_for_status()
     return response.json()
 
 
 def update_role(role_data):
-    response = requests.patch(
-        f"{TARGET_ENV_URL}/v1/roles/{TARGET_ROLE_ID}",
+    response = TARGET_SESSION.patch(
+        f"{TARGET_ENV_URL}/v1/roles/{role_data['ID']}",
         json=role_data,
-        headers=TARGET_ACCOUNT_HEADERS,
     )
     response.raise_for_status()
     return response.json()
 
 
-def transform_role_payload(source_role, target_role):
+def transform_role_payload(source_role, target_role_id):
     role_payload = {
-        "ID": target_role["role"]["ID"],
+        "ID": target_role_id,
         "roleDefinition": {
             "name": source_role["role"]["definition"]["name"],
             "displayName": source_role["role"]["definition"]["displayName"],
@@ -64,43 +55,74 @@ def transform_role_payload(source_role, target_role):
     return role_payload
 
 
+def assign_policy(policy_id, role_ids: list):
+    assign_request = {"ID": policy_id, "roleIDs": role_ids}
+    response = TARGET_SESSION.post(
+        f"{TARGET_ENV_URL}/v1/policies/assign",
+        json=assign_request,
+    )
+    response.raise_for_status()
+
+
 def assign_policy_to_role(policy_ids, role_id: list):
+    policy_assignments = AssignmentBatcher(assign_policy, max_workers=MAX_CONCURRENCY)
     for policy_id in policy_ids:
-        assign_request = {"ID": policy_id, "roleIDs": role_id}
-        response = requests.post(
-            f"{TARGET_ENV_URL}/v1/policies/assign",
-            json=assign_request,
-            headers=TARGET_ACCOUNT_HEADERS,
-        )
-        response.raise_for_status()
+        policy_assignments.add(policy_id, role_id)
+    policy_assignments.flush()
+
+
+def get_roles_to_update():
+    """Return the (source, target) role IDs to update.
+
+    Without TARGET_ROLE_ID the targets of SOURCE_ROLE_ID (one or a list of IDs)
+    are read from the ID mapping store. Every role migrated into
+    TARGET_VAULT_ID is only updated when UPDATE_ALL_ROLES asks for it.
+    """
+    if TARGET_ROLE_ID:
+        return [(SOURCE_ROLE_ID, TARGET_ROLE_ID)]
+    if SOURCE_ROLE_ID:
+        return resolve_targets("roles", parse_ids(SOURCE_ROLE_ID), TARGET_VAULT_ID)
+    if UPDATE_ALL_ROLES and TARGET_VAULT_ID:
+        return resolve_targets("roles", [], TARGET_VAULT_ID)
+    return []
+
+
+def update_role_from_source(role_ids):
+    """Update the metadata of a target role with the one of its source role."""
+    source_role_id, target_role_id = role_ids
+    source_role = get_source_role(source_role_id)
+    role_payload = transform_role_payload(source_role, target_role_id)
+    update_role(role_payload)
 
 
 def main():
     try:
-        target_role_id = TARGET_ROLE_ID
+        roles_to_update = get_roles_to_update()
+        target_role_ids = [target_role_id for _, target_role_id in roles_to_update]
         if(UPDATE_ROLE_CRITERIA == "UPDATE_METADATA"):
-            source_role_id = SOURCE_ROLE_ID
-            if source_role_id and target_role_id:
-                source_role = get_source_role(source_role_id)
-                target_role = get_target_role(target_role_id)
-                role_payload = transform_role_payload(source_role, target_role)
+            if roles_to_update and all(source_role_id for source_role_id, _ in roles_to_update):
                 print("-- Fetching source Role, and working on updating target Role. --")
-                update_role(role_payload)
+                map_concurrently(update_role_from_source, roles_to_update, MAX_CONCURRENCY)
             else:
                 print("-- Please provide valid input. Missing input paramaters. --")
                 exit(1)
         elif(UPDATE_ROLE_CRITERIA == "ASSIGN_POLICY"):
+            if not target_role_ids:
+                print("-- Please provide valid input. Missing roles to assign the policies to. --")
+                exit(1)
             if(POLICY_IDS):
-                policy_ids = ast.literal_eval(POLICY_IDS)
+                # migrated source policy IDs are replaced by their target IDs
+                policy_ids = translate_ids("policies", ast.literal_eval(POLICY_IDS), TARGET_VAULT_ID)
                 if(len(policy_ids) > 0):
                     print("-- Assigning Policies to Role. --")
-                    assign_policy_to_role(policy_ids, [target_role_id])
+                    assign_policy_to_role(policy_ids, target_role_ids)
                 else:
                     print("-- Provided PolicyIds list is empty. --")
             else:
                 print("-- Please provide valid input. Missing policy IDs to assign. --")
                 exit(1)
-        print(f"-- Role {TARGET_ROLE_ID} updated successfully. --")
+        for target_role_id in target_role_ids:
+            print(f"-- Role {target_role_id} updated successfully. --")
     except requests.exceptions.HTTPError as http_err:
         print(f"-- update_role HTTP error: {http_err.response.content.decode()} --")
         raise http_err
@@ -111,3 +133,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    print_cache_stats()
@@ -1,64 +1,53 @@
 import ast
 import os
 import requests
+from assignments import AssignmentBatcher
+from cache import cached_source, print_cache_stats
+from concurrency import map_concurrently
+from http_client import get_session
+from id_mapping import parse_ids, resolve_targets, translate_ids
 
 SOURCE_SERVICE_ACCOUNT_ID = os.getenv("SOURCE_SERVICE_ACCOUNT_ID")
 TARGET_SERVICE_ACCOUNT_ID = os.getenv("TARGET_SERVICE_ACCOUNT_ID")
+TARGET_VAULT_ID = os.getenv("TARGET_VAULT_ID")
 UPDATE_SERVICE_ACCOUNT_CRITERIA = os.getenv("UPDATE_SERVICE_ACCOUNT_CRITERIA")
 ROLE_IDS = os.getenv("ROLE_IDS")
+UPDATE_ALL_SERVICE_ACCOUNTS = (os.getenv("UPDATE_ALL_SERVICE_ACCOUNTS") or "").lower() == "true"
 SOURCE_ACCOUNT_ID = os.getenv("SOURCE_ACCOUNT_ID")
 TARGET_ACCOUNT_ID = os.getenv("TARGET_ACCOUNT_ID")
 SOURCE_ACCOUNT_AUTH = os.getenv("SOURCE_ACCOUNT_AUTH")
 TARGET_ACCOUNT_AUTH = os.getenv("TARGET_ACCOUNT_AUTH")
 SOURCE_ENV_URL = os.getenv("SOURCE_ENV_URL")
 TARGET_ENV_URL = os.getenv("TARGET_ENV_URL")
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY") or "1")
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-TARGET_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": TARGET_ACCOUNT_ID,
-    "Authorization": f"Bearer {TARGET_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
 
 
+@cached_source("serviceAccounts")
 def get_source_service_account(service_account_id):
-    response = requests.get(
+    response = SOURCE_SESSION.get(
         f"{SOURCE_ENV_URL}/v1/serviceAccounts/{service_account_id}",
-        headers=SOURCE_ACCOUNT_HEADERS,
-    )
-    response.raise_for_status()
-    return response.json()
-
-
-def get_target_service_account(service_account_id):
-    response = requests.get(
-        f"{TARGET_ENV_URL}/v1/serviceAccounts/{service_account_id}",
-        headers=TARGET_ACCOUNT_HEADERS,
     )
     response.raise_for_status()
     return response.json()
 
 
 def update_service_account(service_account_data):
-    response = requests.patch(
-        f"{TARGET_ENV_URL}/v1/serviceAccounts/{TARGET_SERVICE_ACCOUNT_ID}",
+    response = TARGET_SESSION.patch(
+        f"{TARGET_ENV_URL}/v1/serviceAccounts/{service_account_data['ID']}",
         json=service_account_data,
-        headers=TARGET_ACCOUNT_HEADERS,
     )
     response.raise_for_status()
     return response.json()
 
 
-def transform_service_account_payload(source_service_account, target_service_account):
+def transform_service_account_payload(source_service_account, target_service_account_id):
     service_account_payload = {
-        "ID": target_service_account["serviceAccount"]["ID"],
+        "ID": target_service_account_id,
         "serviceAccount": {
-            "ID": target_service_account["serviceAccount"]["ID"],
+            "ID": target_service_account_id,
             "name": source_service_account["serviceAccount"]["name"],
             "displayName": source_service_account["serviceAccount"]["displayName"],
             "description": source_service_account["serviceAccount"]["description"]
@@ -75,54 +64,91 @@ def transform_service_account_payload(source_service_account, target_service_acc
     return service_account_payload
 
 
-def assign_roles_to_service_account(role_ids, service_account_id):
+def assign_role(role_id, members):
+    assign_request = {"ID": role_id, "members": members}
+    response = TARGET_SESSION.post(
+        f"{TARGET_ENV_URL}/v1/roles/assign",
+        json=assign_request,
+    )
+    response.raise_for_status()
+
+
+def assign_roles_to_service_accounts(role_ids, service_account_ids):
+    role_assignments = AssignmentBatcher(assign_role, max_workers=MAX_CONCURRENCY)
+    members = [
+        {"type": "SERVICE_ACCOUNT", "ID": service_account_id}
+        for service_account_id in service_account_ids
+    ]
     for role_id in role_ids:
-        assign_request = {
-            "ID": role_id,
-            "members": [{"type": "SERVICE_ACCOUNT", "ID": service_account_id}],
-        }
-        response = requests.post(
-            f"{TARGET_ENV_URL}/v1/roles/assign",
-            json=assign_request,
-            headers=TARGET_ACCOUNT_HEADERS,
+        role_assignments.add(role_id, members)
+    role_assignments.flush()
+
+
+def get_service_accounts_to_update():
+    """Return the (source, target) service account IDs to update.
+
+    Without TARGET_SERVICE_ACCOUNT_ID the targets of SOURCE_SERVICE_ACCOUNT_ID
+    (one or a list of IDs) are read from the ID mapping store. Every service
+    account migrated for TARGET_VAULT_ID is only updated when
+    UPDATE_ALL_SERVICE_ACCOUNTS asks for it.
+    """
+    if TARGET_SERVICE_ACCOUNT_ID:
+        return [(SOURCE_SERVICE_ACCOUNT_ID, TARGET_SERVICE_ACCOUNT_ID)]
+    if SOURCE_SERVICE_ACCOUNT_ID:
+        return resolve_targets(
+            "serviceAccounts", parse_ids(SOURCE_SERVICE_ACCOUNT_ID), TARGET_VAULT_ID
         )
-        response.raise_for_status()
+    if UPDATE_ALL_SERVICE_ACCOUNTS and TARGET_VAULT_ID:
+        return resolve_targets("serviceAccounts", [], TARGET_VAULT_ID)
+    return []
+
+
+def update_service_account_from_source(service_account_ids):
+    """Update a target service account with the metadata of its source one."""
+    source_service_account_id, target_service_account_id = service_account_ids
+    source_service_account = get_source_service_account(source_service_account_id)
+    service_account_payload = transform_service_account_payload(
+        source_service_account, target_service_account_id
+    )
+    update_service_account(service_account_payload)
 
 
 def main():
     try:
-        target_service_account_id = TARGET_SERVICE_ACCOUNT_ID
+        service_accounts_to_update = get_service_accounts_to_update()
+        target_service_account_ids = [
+            target_service_account_id for _, target_service_account_id in service_accounts_to_update
+        ]
         if UPDATE_SERVICE_ACCOUNT_CRITERIA == "UPDATE_METADATA":
-            source_service_account_id = SOURCE_SERVICE_ACCOUNT_ID
-            if source_service_account_id and target_service_account_id:
-                source_service_account = get_source_service_account(
-                source_service_account_id
-                )
-                target_service_account = get_target_service_account(
-                    target_service_account_id
-                )
-                service_account_payload = transform_service_account_payload(
-                    source_service_account, target_service_account
-                )
+            if service_accounts_to_update and all(
+                source_service_account_id for source_service_account_id, _ in service_accounts_to_update
+            ):
                 print("-- Fetching source SA, and working on updating target SA. --")
-                update_service_account(service_account_payload)
+                map_concurrently(
+                    update_service_account_from_source, service_accounts_to_update, MAX_CONCURRENCY
+                )
             else:
                 print("-- Please provide valid input. Missing input paramaters. --")
                 exit(1)
         elif UPDATE_SERVICE_ACCOUNT_CRITERIA == "ASSIGN_ROLES":
+            if not target_service_account_ids:
+                print("-- Please provide valid input. Missing service accounts to assign the roles to. --")
+                exit(1)
             if ROLE_IDS:
-                role_ids = ast.literal_eval(ROLE_IDS)
+                # migrated source role IDs are replaced by their target IDs
+                role_ids = translate_ids("roles", ast.literal_eval(ROLE_IDS), TARGET_VAULT_ID)
                 if len(role_ids) > 0:
                     print("-- Assigning roles to SA. --")
-                    assign_roles_to_service_account(role_ids, target_service_account_id)
+                    assign_roles_to_service_accounts(role_ids, target_service_account_ids)
                 else:
                     print("-- Provided RoleIDs list is empty. --")
             else:
                 print("-- Please provide valid input. Missing Role IDs to assign. --")
                 exit(1)
-        print(
-                f"-- Service account {TARGET_SERVICE_ACCOUNT_ID} updated successfully. --"
-            )
+        for target_service_account_id in target_service_account_ids:
+            print(
+                    f"-- Service account {target_service_account_id} updated successfully. --"
+                )
         
     except requests.exceptions.HTTPError as http_err:
         print(
@@ -136,3 +162,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    print_cache_stats()
@@ -1,5 +1,8 @@
 import requests
 import os
+from cache import cached_source, print_cache_stats
+from delta_sync import DELTA_SYNC, UNCHANGED, diff, mark_synced
+from http_client import get_session
 
 SOURCE_VAULT_ID = os.getenv("SOURCE_VAULT_ID")
 SOURCE_ACCOUNT_ID = os.getenv("SOURCE_ACCOUNT_ID")
@@ -10,25 +13,17 @@ SOURCE_ENV_URL = os.getenv("SOURCE_ENV_URL")
 TARGET_ENV_URL = os.getenv("TARGET_ENV_URL")
 TARGET_VAULT_ID = os.getenv("TARGET_VAULT_ID")
 
-SOURCE_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": SOURCE_ACCOUNT_ID,
-    "Authorization": f"Bearer {SOURCE_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
-
-TARGET_ACCOUNT_HEADERS = {
-    "X-SKYFLOW-ACCOUNT-ID": TARGET_ACCOUNT_ID,
-    "Authorization": f"Bearer {TARGET_ACCOUNT_AUTH}",
-    "Content-Type": "application/json",
-}
+SOURCE_SESSION = get_session(SOURCE_ACCOUNT_ID, SOURCE_ACCOUNT_AUTH)
+TARGET_SESSION = get_session(TARGET_ACCOUNT_ID, TARGET_ACCOUNT_AUTH)
 
+@cached_source("vaults")
 def get_vault_details(vaultID: str):
-    response = requests.get(f"{SOURCE_ENV_URL}/v1/vaults/{vaultID}", headers=SOURCE_ACCOUNT_HEADERS)
+    response = SOURCE_SESSION.get(f"{SOURCE_ENV_URL}/v1/vaults/{vaultID}")
     response.raise_for_status()
     return response.json()
 
 def update_vault(update_vault_request_payload):
-    response = requests.patch(f"{TARGET_ENV_URL}/v1/vaults/{TARGET_VAULT_ID}", json=update_vault_request_payload, headers=TARGET_ACCOUNT_HEADERS)
+    response = TARGET_SESSION.patch(f"{TARGET_ENV_URL}/v1/vaults/{TARGET_VAULT_ID}", json=update_vault_request_payload)
     response.raise_for_status()
     return response.json()
 
@@ -50,7 +45,14 @@ def main():
             vault_details = get_vault_details(SOURCE_VAULT_ID)
             print(f"-- Working on updating vault in target account --")
             update_vault_request = transform_payload(vault_details["vault"])
+            if DELTA_SYNC:
+                delta = diff("vaults", SOURCE_VAULT_ID, update_vault_request, TARGET_VAULT_ID)
+                if delta.status == UNCHANGED:
+                    print(f"-- Vault {SOURCE_VAULT_ID} schema unchanged since the last sync, nothing to update --")
+                    return
             update_vault_response = update_vault(update_vault_request)
+            if DELTA_SYNC:
+                mark_synced("vaults", SOURCE_VAULT_ID, TARGET_VAULT_ID, delta)
             print(f"-- Vault with ID {update_vault_response['ID']} has been updated successfully in the target account. --")
         else:
             print("-- Please provide valid input. Missing Target Vault ID or Source Vault ID. --")
@@ -64,3 +66,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    print_cache_stats()